@@ -0,0 +1,181 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* An opening book: a PGN corpus compiled into a sorted binary file of (key, move, weight)        *
+* records, looked up by binary search on a memory map of the file, so that a lookup parses      *
+* nothing and every process shares the pages of the file.                                       *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+Usage:
+    python book.py compile games.pgn book.bin --plies 20
+    python book.py probe book.bin --fen "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# The file is BOOK_MAGIC (8 bytes) followed by records of 12 bytes, little-endian:              #
+#      8 bytes:  Zobrist key of the position (see engine.py)                                    #
+#      2 bytes:  the move, packed by ttable.pack_move()                                         #
+#      2 bytes:  its weight                                                                     #
+# sorted by key, then by weight (highest first).                                                #
+#                                                                                               #
+# The weight of a move is the sum, over the games it was played in, of 2 for a win of the side  #
+# that played it, 1 for a draw or an unknown result and 0 for a loss.                           #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+
+import argparse
+import json
+import mmap
+import random
+import struct
+import sys
+
+from engine import Engine
+from fen import START_FEN
+from ttable import pack_move, unpack_move
+
+BOOK_MAGIC = b"CHESSBK1"
+RECORD = struct.Struct("<QHH")
+KEY = struct.Struct("<Q")
+
+# Points of a result, for the side that played the move.
+RESULT_POINTS = {("1-0", 1): 2, ("0-1", -1): 2, ("1-0", -1): 0, ("0-1", 1): 0}
+
+
+def compile_book(source, path, plies=20) -> dict:
+    """
+    parameters:
+        (1) source (str or file object): a PGN file (see pgn.py)
+        (2) path (str): the book file to write
+        (3) plies (int) [OPTIONAL]: number of moves of every game that go into the book
+
+    returns: {"games": games read, "positions": positions in the book, "records": records written}
+    """
+
+    from pgn import read_games, parse_san
+
+    weights = {}
+    games = 0
+    for game in read_games(source):
+        if "FEN" in game["headers"]:
+            continue
+        games += 1
+
+        engine = Engine()
+        for san in game["moves"][:plies]:
+            try:
+                move = parse_san(engine, san)
+            except ValueError:
+                break
+            record = (engine.key, pack_move(move))
+            weights[record] = weights.get(record, 0) + RESULT_POINTS.get((game["result"], engine.turn), 1)
+            engine.apply_legal_move(*move)
+
+    records = sorted(((key, move, min(weight, 0xFFFF)) for (key, move), weight in weights.items() if weight > 0),
+                     key=lambda record: (record[0], -record[2], record[1]))
+    with open(path, "wb") as file:
+        file.write(BOOK_MAGIC)
+        for record in records:
+            file.write(RECORD.pack(*record))
+
+    return {"games": games, "positions": len({record[0] for record in records}), "records": len(records)}
+
+
+class OpeningBook():
+    def __init__(self, path) -> None:
+        """
+        parameters:
+            (1) path (str): a book file written by compile_book()
+        """
+
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.file.seek(0, 2) > 0 else b""
+        if self.map[:len(BOOK_MAGIC)] != BOOK_MAGIC:
+            self.close()
+            raise ValueError(f"not an opening book: {path}")
+        self.size = (len(self.map) - len(BOOK_MAGIC)) // RECORD.size
+
+    def close(self) -> None:
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    # Key of the record at index.
+    def key_at(self, index) -> int:
+        return KEY.unpack_from(self.map, len(BOOK_MAGIC) + index * RECORD.size)[0]
+
+    def lookup(self, key) -> list:
+        """
+        parameters:
+            (1) key (int): Zobrist key of the position
+
+        returns: the [(move, weight)] of the book for key, highest weight first; the moves as (start_cord, end_cord, promotion_piece)
+        """
+
+        # The first record with a key not below key.
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        entries = []
+        for index in range(low, self.size):
+            record_key, move, weight = RECORD.unpack_from(self.map, len(BOOK_MAGIC) + index * RECORD.size)
+            if record_key != key:
+                break
+            entries.append((unpack_move(move), weight))
+        return entries
+
+    def choose(self, engine, best=False, rng=random):
+        """
+        parameters:
+            (1) engine (Engine): the position
+            (2) best (bool) [OPTIONAL]: the move of highest weight, instead of one drawn at random in proportion to weight
+            (3) rng (random.Random) [OPTIONAL]: source of the random draw
+
+        returns: a legal book move of the side to move, as (start_cord, end_cord, promotion_piece); None if the book has none
+        """
+
+        # Keys can collide: only moves that are legal in the position are taken.
+        legal_moves = engine.legal_moves()
+        entries = [(move, weight) for move, weight in self.lookup(engine.key) if move in legal_moves]
+        if len(entries) == 0:
+            return None
+        if best:
+            return entries[0][0]
+        return rng.choices([move for move, _ in entries], weights=[weight for _, weight in entries])[0]
+
+
+def main(argv=None) -> int:
+    from perft import move_name
+
+    parser = argparse.ArgumentParser(description="Opening book compiler and lookup.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = commands.add_parser("compile", help="compile a PGN file into a book")
+    compile_parser.add_argument("pgn", help="the PGN file")
+    compile_parser.add_argument("book", help="the book file to write")
+    compile_parser.add_argument("--plies", type=int, default=20, help="moves of every game that go into the book")
+    probe_parser = commands.add_parser("probe", help="print the book moves of a position")
+    probe_parser.add_argument("book", help="the book file")
+    probe_parser.add_argument("--fen", default=START_FEN, help="the position (defaults to the starting position)")
+    args = parser.parse_args(argv)
+
+    if args.command == "compile":
+        print(json.dumps(compile_book(args.pgn, args.book, args.plies)), flush=True)
+    else:
+        with OpeningBook(args.book) as book:
+            engine = Engine.from_fen(args.fen)
+            print(json.dumps({move_name(move): weight for move, weight in book.lookup(engine.key)}), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
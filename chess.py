@@ -1,46 +1,67 @@
+import argparse
+import os
 import pygame
 import sys
-from engine import Engine
-
-BACKGROUND_IMG = pygame.image.load('assets/chess_board.png')
-BLACK_QUEEN_IMG = pygame.image.load('assets/black_queen.png')
-BLACK_KING_IMG = pygame.image.load('assets/black_king.png')
-BLACK_PAWN_IMG = pygame.image.load('assets/black_pawn.png')
-BLACK_ROOK_IMG = pygame.image.load('assets/black_rook.png')
-BLACK_KNIGHT_IMG = pygame.image.load('assets/black_knight.png')
-BLACK_BISHOP_IMG = pygame.image.load('assets/black_bishop.png')
-WHITE_QUEEN_IMG = pygame.image.load('assets/white_queen.png')
-WHITE_KING_IMG = pygame.image.load('assets/white_king.png')
-WHITE_PAWN_IMG = pygame.image.load('assets/white_pawn.png')
-WHITE_ROOK_IMG = pygame.image.load('assets/white_rook.png')
-WHITE_KNIGHT_IMG = pygame.image.load('assets/white_knight.png')
-WHITE_BISHOP_IMG = pygame.image.load('assets/white_bishop.png')
-RESET_BTN_IMG = pygame.image.load('assets/reset.png')
-UNDO_BTN_IMG = pygame.image.load('assets/undo.png')
-WHITE_WIN_MSG_IMG = pygame.image.load('assets/white_win.png')
-BLACK_WIN_MSG_IMG = pygame.image.load('assets/black_win.png')
-STALEMATE_MSG_IMG = pygame.image.load('assets/stalemate.png')
-DRAW_MSG_IMG = pygame.image.load('assets/draw.png')
-WHITE_IN_CHECK_MSG_IMG = pygame.image.load('assets/white_in_check.png')
-BLACK_IN_CHECK_MSG_IMG = pygame.image.load('assets/black_in_check.png')
-
-END_MESSAGE_KEY = {1: WHITE_WIN_MSG_IMG, 2: BLACK_WIN_MSG_IMG, 3: STALEMATE_MSG_IMG, 4: DRAW_MSG_IMG, 5: WHITE_IN_CHECK_MSG_IMG, 6: BLACK_IN_CHECK_MSG_IMG}
-
-PIECE_IMAGE_KEY = {1: WHITE_ROOK_IMG,   -1: BLACK_ROOK_IMG,
-                   2: WHITE_KNIGHT_IMG, -2: BLACK_KNIGHT_IMG,
-                   3: WHITE_BISHOP_IMG, -3: BLACK_BISHOP_IMG,
-                   4: WHITE_QUEEN_IMG,  -4: BLACK_QUEEN_IMG,
-                   5: WHITE_KING_IMG,   -5: BLACK_KING_IMG,
-                   6: WHITE_PAWN_IMG,   -6: BLACK_PAWN_IMG}
+from book import OpeningBook
+from engine import CASTLING_ROOK_MOVES, Engine
+from search import Searcher
+from tablebase import Tablebase, WIN, DRAW
+from ttable import TranspositionTable
+
+# Images are loaded on first use (see image()), not at import; the names are the files of assets/ without ".png".
+ASSETS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+END_MESSAGE_KEY = {1: "white_win", 2: "black_win", 3: "stalemate", 4: "draw", 5: "white_in_check", 6: "black_in_check"}
+
+PIECE_IMAGE_KEY = {1: "white_rook",   -1: "black_rook",
+                   2: "white_knight", -2: "black_knight",
+                   3: "white_bishop", -3: "black_bishop",
+                   4: "white_queen",  -4: "black_queen",
+                   5: "white_king",   -5: "black_king",
+                   6: "white_pawn",   -6: "black_pawn"}
+
+# name: surface, converted to the pixel format of the display.
+_images = {}
+
+
+# The image of name, loaded once; only valid once the display is open (convert_alpha() needs its pixel format).
+def image(name):
+    surface = _images.get(name)
+    if surface is None:
+        surface = pygame.image.load(os.path.join(ASSETS_DIRECTORY, name + ".png")).convert_alpha()
+        _images[name] = surface
+    return surface
+
 
 BACKGROUND_COLOR = (255, 255, 255)
 FPS = 30
 
+# Right of the board: the messages, and the pieces to promote to.
+PANEL_RECT = pygame.Rect(400, 0, 110, 300)
+
+
+# Squares a move of the move log changes: start and end, plus the rook of castling or the pawn taken en-passant.
+def changed_cords(entry) -> list:
+    _, start_cord, _, end_cord, add_on = entry
+    cords = [tuple(start_cord), tuple(end_cord)]
+    if add_on in CASTLING_ROOK_MOVES:
+        cords.extend(CASTLING_ROOK_MOVES[add_on])
+    elif add_on in (10, 11, 12, 13):
+        cords.append((start_cord[0], end_cord[1]))
+    return cords
+
 # All values are hard-coded
 
 class Chess(): 
-    def __init__(self, engine) -> None:
+    # ai_color: the side (1 or -1) played by the search (see search.py), None for two human players.
+    # book: an OpeningBook (see book.py) the search plays from while it has moves for the position.
+    # tablebase: a Tablebase (see tablebase.py); the game ends as soon as it reaches a position of the tables.
+    def __init__(self, engine, ai_color=None, think_time=1.0, book=None, tablebase=None) -> None:
         self.engine = engine 
+        self.ai_color = ai_color
+        self.tablebase = tablebase
+        self.searcher = Searcher(engine, book=book, tablebase=tablebase)
+        self.think_time = think_time
 
         self.screen = pygame.display.set_mode((510, 400))
         pygame.display.set_caption("Chess")
@@ -57,34 +78,86 @@ class Chess():
         self.squares_centers_list = [[((48 * j) + 13 + 24, (48 * i) + 3 + 24) for j in range(8)] for i in range(8)]
         self.squares_list = [[pygame.Rect((48 * j) + 13, (48 * i) + 3, 48, 48) for j in range(8)] for i in range(8)]
 
-    def update_screen(self) -> None:
+        # Rects drawn since the last show(), squares with a dot of draw_possible_end_cords(), message of the panel on screen.
+        self.dirty_rects = []
+        self.marked_cords = []
+        self.message = None
+
+    # Everything, at start and after a reset.
+    def draw_screen(self) -> None:
         self.screen.fill(BACKGROUND_COLOR)
-        self.screen.blit(BACKGROUND_IMG, (0, 0))
-        self.screen.blit(RESET_BTN_IMG, (401, 350))
-        self.screen.blit(UNDO_BTN_IMG, (400, 300))
+        self.screen.blit(image("chess_board"), (0, 0))
+        self.screen.blit(image("reset"), (401, 350))
+        self.screen.blit(image("undo"), (400, 300))
 
         for i in range(8):
             for j in range(8):
                 if self.engine.board[i][j] != 0:
-                    self.screen.blit(PIECE_IMAGE_KEY[self.engine.board[i][j]], self.squares_list[i][j])
-
-        if self.engine.in_check(self.engine.turn):
-            end_message_index = 5 if self.engine.turn == 1 else 6
-            self.screen.blit(END_MESSAGE_KEY[end_message_index], (400, 0))
+                    self.screen.blit(image(PIECE_IMAGE_KEY[self.engine.board[i][j]]), self.squares_list[i][j])
+
+        self.marked_cords = []
+        self.draw_message(self.check_message())
+        self.dirty_rects = [self.screen.get_rect()]
+
+    # Redraws a square: the board under it, then the pieces that reach into it (their images are 50 x 50, the squares 48).
+    def draw_square(self, cord) -> None:
+        x, y = cord
+        rect = pygame.Rect((48 * y) + 13, (48 * x) + 3, 50, 50)
+        self.screen.set_clip(rect)
+        self.screen.blit(image("chess_board"), rect, rect)
+        for i in range(max(x - 1, 0), min(x + 2, 8)):
+            for j in range(max(y - 1, 0), min(y + 2, 8)):
+                if self.engine.board[i][j] != 0:
+                    self.screen.blit(image(PIECE_IMAGE_KEY[self.engine.board[i][j]]), self.squares_list[i][j])
+        self.screen.set_clip(None)
+        self.dirty_rects.append(rect)
+
+    # message: a key of END_MESSAGE_KEY, or None for an empty panel.
+    def draw_message(self, message) -> None:
+        self.screen.fill(BACKGROUND_COLOR, PANEL_RECT)
+        if message is not None:
+            self.screen.blit(image(END_MESSAGE_KEY[message]), (400, 0))
+        self.message = message
+        self.dirty_rects.append(PANEL_RECT)
+
+    # The in-check message of the side to move, None if it is not in check.
+    def check_message(self):
+        if self.engine.status().in_check:
+            return 5 if self.engine.turn == 1 else 6
+        return None
+
+    # Only the squares given (see changed_cords()) and the dots of the last selected piece are redrawn,
+    # and the panel only if its message changes.
+    def update_screen(self, cords=()) -> None:
+        for cord in set(cords) | set(self.marked_cords):
+            self.draw_square(cord)
+        self.marked_cords = []
+
+        message = self.check_message()
+        if message != self.message:
+            self.draw_message(message)
+
+    # Sends the rects drawn since the last call to the display.
+    def show(self) -> None:
+        pygame.display.update(self.dirty_rects)
+        self.dirty_rects = []
 
     def draw_possible_end_cords(self, start_cord) -> bool:
         all_legal_moves = self.engine.get_all_legal_moves(start_cord)
         if len(all_legal_moves) > 0:
             for cord in all_legal_moves:
                 pygame.draw.circle(self.screen, (255, 0, 0), self.squares_centers_list[cord[0]][cord[1]], 5)
+                self.dirty_rects.append(self.squares_list[cord[0]][cord[1]])
+            self.marked_cords.extend(tuple(cord) for cord in all_legal_moves)
             return True
         return False
 
     def ask_for_promotion(self) -> int:
         for i in range(4):
-            self.screen.blit(PIECE_IMAGE_KEY[self.engine.turn * (i + 1)], (420, 100 + i * 50))
+            self.screen.blit(image(PIECE_IMAGE_KEY[self.engine.turn * (i + 1)]), (420, 100 + i * 50))
 
-        pygame.display.update()
+        self.dirty_rects.append(PANEL_RECT)
+        self.show()
 
         while True:
             for event in pygame.event.get():
@@ -95,31 +168,60 @@ class Chess():
                 if event.type == pygame.MOUSEBUTTONUP:
                     for i in range(4):
                         if self.promotion_piece_rects[i].collidepoint(event.pos):
+                            # The pieces are taken off the panel.
+                            self.draw_message(self.message)
                             return self.engine.turn * (i + 1)
 
             self.clock.tick(FPS)
 
     def should_end_game(self) -> bool:
         is_over = False
-        in_checkmate = self.engine.in_checkmate()
-        if in_checkmate in (1, -1):
+        status = self.engine.status()
+        if status.checkmate:
             n = 1 if self.engine.turn == -1 else 2
-            self.screen.blit(END_MESSAGE_KEY[n], (400, 0))
+            self.draw_message(n)
             is_over = True
 
-        elif self.engine.is_stalemate():
-            self.screen.blit(END_MESSAGE_KEY[3], (400, 0))
+        elif status.stalemate:
+            self.draw_message(3)
             is_over = True
                 
-        elif self.engine.is_draw():
-            self.screen.blit(END_MESSAGE_KEY[4], (400, 0))
+        elif status.draw:
+            self.draw_message(4)
             is_over = True
 
+        # The tables know the result with best play from here on.
+        elif self.tablebase is not None:
+            probe = self.tablebase.probe(self.engine)
+            if probe is not None:
+                result = probe[0]
+                if result == DRAW:
+                    n = 4
+                else:
+                    n = 1 if (self.engine.turn == 1) == (result == WIN) else 2
+                self.draw_message(n)
+                is_over = True
+
         return is_over
+
+    # If it is the turn of the search, it plays its best move.
+    def play_ai_move(self) -> None:
+        if self.ai_color != self.engine.turn or self.game_over:
+            return
+
+        move = self.searcher.search(max_time=self.think_time)["move"]
+        if move is not None:
+            self.engine.move(*move)
+            self.update_screen(changed_cords(self.engine.move_log[-1]))
+
+        if self.should_end_game():
+            self.game_over = True
+        self.show()
         
     def run(self) -> None:
-        self.update_screen()
-        pygame.display.update()
+        self.draw_screen()
+        self.show()
+        self.play_ai_move()
 
         while True:
             for event in pygame.event.get():
@@ -133,15 +235,25 @@ class Chess():
 
                     if self.buttons_rect_key["reset"].collidepoint((x, y)):
                         self.engine.reset()
-                        self.update_screen()
+                        self.start_cord = None
+                        self.draw_screen()
                         self.game_over = False
-                        pygame.display.update()
+                        self.show()
+                        self.play_ai_move()
 
                     elif self.buttons_rect_key["undo"].collidepoint((x, y)):
-                        self.engine.undo_move()
-                        self.update_screen()
+                        # Against the search, the move it answered with is taken back too.
+                        cords = []
+                        if len(self.engine.move_log) > 0:
+                            cords += changed_cords(self.engine.move_log[-1])
+                            self.engine.undo_move()
+                        if self.ai_color == self.engine.turn and len(self.engine.move_log) > 0:
+                            cords += changed_cords(self.engine.move_log[-1])
+                            self.engine.undo_move()
+                        self.update_screen(cords)
                         self.game_over = False
-                        pygame.display.update()
+                        self.show()
+                        self.play_ai_move()
 
                     if self.start_cord is None and self.game_over is False:
                         for i in range(8):
@@ -150,7 +262,7 @@ class Chess():
                                     if (self.engine.board[i][j] > 0 and self.engine.turn > 0) or (self.engine.board[i][j] < 0 and self.engine.turn < 0):
                                         if self.draw_possible_end_cords((i, j)):
                                             self.start_cord = (i, j)
-                                            pygame.display.update()
+                                            self.show()
                                     break
 
                     elif self.start_cord is not None and self.game_over is False:
@@ -160,22 +272,32 @@ class Chess():
                                     self.end_cord = (m, n)
 
                                     if self.engine.is_promotion_move(self.start_cord, self.end_cord):
-                                        self.engine.move(self.start_cord, self.end_cord, self.ask_for_promotion())
+                                        moved = self.engine.move(self.start_cord, self.end_cord, self.ask_for_promotion())
                                     else:
-                                        self.engine.move(self.start_cord, self.end_cord, None)
+                                        moved = self.engine.move(self.start_cord, self.end_cord, None)
 
-                                    self.update_screen()
+                                    self.update_screen(changed_cords(self.engine.move_log[-1]) if moved else ())
                                     self.start_cord = None
                                     
                                     if self.should_end_game():
                                         self.game_over = True
 
-                                    pygame.display.update()
+                                    self.show()
+                                    self.play_ai_move()
                                     break   
            
             self.clock.tick(FPS)
 
 if __name__ == "__main__":
-    engine = Engine()
-    chess = Chess(engine)
+    parser = argparse.ArgumentParser(description="Chess.")
+    parser.add_argument("--ai", choices=("white", "black"), help="the side played by the computer (none by default)")
+    parser.add_argument("--think", type=float, default=1.0, help="seconds the computer thinks per move")
+    parser.add_argument("--book", help="opening book of the computer (see book.py)")
+    parser.add_argument("--tablebase", help="directory of endgame tables (see tablebase.py) that end the game early")
+    args = parser.parse_args()
+
+    engine = Engine(table=TranspositionTable())
+    book = None if args.book is None else OpeningBook(args.book)
+    tablebase = None if args.tablebase is None else Tablebase(args.tablebase)
+    chess = Chess(engine, {"white": 1, "black": -1, None: None}[args.ai], args.think, book, tablebase)
     chess.run()
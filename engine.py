@@ -7,6 +7,9 @@ Author - kinglacto
 *                                                                                               *
 * If no board is passed, the engine assumes the default starting position with white to move,   *
 * and an empty list, for moves.                                                                 *
+*                                                                                               *
+* An optional transposition table (table, see ttable.py) caches the legal moves and the status  *
+* of every position looked at, by key.                                                          *
 * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
 || NOTE: Hard-coded, unscalable, memory-inefficient. Requires a re-write. ||
@@ -69,15 +72,282 @@ Author - kinglacto
 #            16: black king-side castle                                                         #
 #            17: black queen-side castle                                                        #
 #           ----------------------------------------                                            #
+#                                                                                               #
+#    The log is kept packed (MoveLog): one 16-bit int per ply in an array('H'), the move as     #
+#    ttable.pack_move() packs it (the one move encoding of the engine):                         #
+#           start square | end square << 6 | (promotion piece + 6) << 12                        #
+#    (square index 8 * x + y; promotion piece 0 if there is none), and the piece moved and the  #
+#    piece captured in an array('b'), two bytes per ply. Reading an entry gives the tuple above, #
+#    its add_on worked out from the pieces and squares; MoveLog.move() gives the move itself,   #
+#    promotion piece included, as legal_moves() lists it.                                       #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# (d) backend (str) [keyword only]:                                                             #
+#      "mailbox":  the 8 x 8 list above is walked square by square (default).                   #
+#      "bitboard": the position is also kept as 64-bit integers, one per piece code, and moves  #
+#                  are generated set-wise (see bitboard.py). The board view is kept in sync.    #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# The state that the board alone does not show is kept explicitly (an engine built from a move  #
+# log works it out once, from the log):                                                         #
+#      castling (int):        castling rights bitmask                                           #
+#                                1: white king-side, 2: white queen-side,                       #
+#                                4: black king-side, 8: black queen-side                        #
+#      en_passant (tuple):    cord a pawn may capture en-passant on (None if there is none)     #
+#      halfmove_clock (int):  plies since the last capture or pawn move                         #
+#      ply_offset (int):      plies played before the first move of the log (from a FEN)        #
+#                                                                                               #
+# Every position also has a 64-bit Zobrist key (key), the XOR of one random number per:         #
+#      piece on a square, black to move, castling right held and en-passant file.               #
+#                                                                                               #
+# apply_legal_move() pushes (key, castling, en_passant, halfmove_clock) of the position it      #
+# leaves onto history, and undo_legal_move() pops it back. Both trust their move; move() and    #
+# undo_move() are the checked pair: move() finds the move among the targets of the piece,       #
+# makes it with apply_legal_move() and takes it back if it leaves its own king in check.        #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# The pieces on the board are also kept by colour and by kind, and set_square() updates them    #
+# with every change (so move(), undo_move() and their add-ons need nothing more):               #
+#      piece_cords (dict):  {1: set of cords of the white pieces, -1: of the black pieces}      #
+#      material (list):     material[piece + 6] is the number of pieces with that code          #
+#      score (int):         sum of the piece-square values of the pieces, for white (see        #
+#                           evaluation.py); evaluation.evaluate() reads it                      #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# The geometry of the board is worked out once, at import, by square index 8 * x + y:           #
+#      KNIGHT_TARGETS, KING_TARGETS:  cords a knight / king on the square jumps or steps to     #
+#      PAWN_ATTACKS[color]:           cords a pawn of color on the square captures on           #
+#      STRAIGHT_RAYS, DIAGONAL_RAYS:  4 rays each, the cords of one direction, nearest first    #
+# The move generators, is_square_attacked() and the pin search walk these instead of adding    #
+# offsets and checking the edges of the board at every step.                                    #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# to_bytes() packs a position into a few bytes (to send it to another process), little-endian:  #
+#      64 bytes:  piece code + 6 of every square, by square index 8 * x + y                     #
+#      1 byte:    turn (1 or -1)                                                                #
+#      1 byte:    castling rights bitmask                                                       #
+#      1 byte:    en-passant square index (255 if there is none)                                #
+#      2 bytes:   halfmove clock                                                                #
+#      2 bytes:   fullmove number                                                               #
+#      2 bytes:   number n of earlier keys                                                      #
+#      8n bytes:  keys of the earlier positions that can still repeat, oldest first             #
+# from_bytes() builds an engine from them, with an empty move log (the fullmove number is kept  #
+# in ply_offset, so to_fen() still gives it).                                                   #
+# Both clocks must be at most CLOCK_LIMIT (see fen.py); to_bytes() raises ValueError if not.    #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 """
 
+import random
+import struct
+from array import array
+from collections import namedtuple
+
+from evaluation import PIECE_SQUARE_TABLES
+from fen import CLOCK_LIMIT, castling_on_board, parse_fen, format_fen
+from ttable import pack_move, unpack_move
+
+BACKENDS = ("mailbox", "bitboard")
+
+# Fixed part of the packed position (see the top of file).
+PACKED_POSITION = struct.Struct("<64sbBBHHH")
+
+
+# PACKED_POSITION.pack() of the fields, with a ValueError (not a struct.error) if a clock does not fit its 2 bytes.
+def pack_position(squares, turn, castling, en_passant, halfmove_clock, fullmove_number, count) -> bytes:
+    if not 0 <= halfmove_clock <= CLOCK_LIMIT or not 0 <= fullmove_number <= CLOCK_LIMIT:
+        raise ValueError(f"clocks out of range for a packed position: {halfmove_clock} {fullmove_number}")
+    return PACKED_POSITION.pack(squares, turn, castling, en_passant, halfmove_clock, fullmove_number, count)
+
+# The seed is fixed so that keys are the same in every process and every run.
+_zobrist_random = random.Random(0x5EED)
+
+# ZOBRIST_PIECES[piece + 6][8 * x + y]; the row of index 6 (empty square) is all zeros.
+ZOBRIST_PIECES = tuple(tuple(_zobrist_random.getrandbits(64) if piece != 0 else 0 for _ in range(64)) for piece in range(-6, 7))
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_EN_PASSANT = tuple(_zobrist_random.getrandbits(64) for _ in range(8))
+
+# ZOBRIST_CASTLING[rights] is the XOR of the numbers of every right in the bitmask.
+_zobrist_rights = tuple(_zobrist_random.getrandbits(64) for _ in range(4))
+ZOBRIST_CASTLING = tuple(
+    (_zobrist_rights[0] if rights & 1 else 0) ^ (_zobrist_rights[1] if rights & 2 else 0) ^
+    (_zobrist_rights[2] if rights & 4 else 0) ^ (_zobrist_rights[3] if rights & 8 else 0) for rights in range(16))
+
+# Status flags of the side to move (Engine.position_status()).
+STATUS_IN_CHECK = 1
+STATUS_NO_MOVES = 2
+
+# The state of the game for the side to move (Engine.status()):
+#      in_check (bool), legal_moves (int): number of legal moves,
+#      checkmate (bool), stalemate (bool), draw (bool): stalemate, repetition, 50-move rule or too little material,
+#      result (str): "1-0", "0-1" or "1/2-1/2" if the game is over, else None
+GameStatus = namedtuple("GameStatus", ("in_check", "legal_moves", "checkmate", "stalemate", "draw", "result"))
+
+
+# (piece, start_cord, captured, end_cord, add_on) -> 16-bit int (see top of file); the pieces are kept apart.
+# The tuple has no promotion piece: a pawn reaching the last rank is taken to become a queen unless promotion_piece says otherwise.
+def pack_log_entry(entry, promotion_piece=None) -> int:
+    piece, start_cord, _, end_cord, _ = entry
+    if promotion_piece is None and piece in (6, -6) and end_cord[0] in (0, 7):
+        promotion_piece = 4 if piece > 0 else -4
+    return pack_move((start_cord, end_cord, promotion_piece))
+
+
+# The inverse of pack_log_entry(), given the piece moved and the piece captured: a pawn leaving its file for an 
+# empty square took en-passant, and a king moving two files castled.
+def unpack_log_entry(packed, piece, captured) -> tuple:
+    start, end = packed & 63, packed >> 6 & 63
+    add_on = 0
+    if piece == 6 or piece == -6:
+        if captured == 0 and (start ^ end) & 7:
+            add_on = (10 if piece == 6 else 12) + (0 if end & 7 > start & 7 else 1)
+    elif (piece == 5 or piece == -5) and ((end & 7) - (start & 7) == 2 or (start & 7) - (end & 7) == 2):
+        add_on = CASTLING_ADD_ONS[CORDS[end]]
+    return (piece, CORDS[start], captured, CORDS[end], add_on)
+
+
+class MoveLog():
+    """
+    The move log (see top of file), packed: it reads, iterates and appends as the list of 
+    (piece, start_cord, captured, end_cord, add_on) tuples it stands for, at 4 bytes per ply.
+    """
+
+    __slots__ = ("moves", "pieces")
+
+    def __init__(self, entries=()) -> None:
+        self.moves = array("H")
+        self.pieces = array("b")
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self) -> int:
+        return len(self.moves)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.moves)))]
+        if index < 0:
+            index += len(self.moves)
+        return unpack_log_entry(self.moves[index], self.pieces[2 * index], self.pieces[2 * index + 1])
+
+    def __delitem__(self, index) -> None:
+        if index < 0:
+            index += len(self.moves)
+        del self.moves[index]
+        del self.pieces[2 * index:2 * index + 2]
+
+    def __iter__(self):
+        pieces = self.pieces
+        for i, packed in enumerate(self.moves):
+            yield unpack_log_entry(packed, pieces[2 * i], pieces[2 * i + 1])
+
+    def __reversed__(self):
+        for i in range(len(self.moves) - 1, -1, -1):
+            yield self[i]
+
+    def __eq__(self, other) -> bool:
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return f"MoveLog({list(self)})"
+
+    def append(self, entry, promotion_piece=None) -> None:
+        self.push(pack_log_entry(entry, promotion_piece), entry[0], entry[2])
+
+    # The move of the ply at index, as (start_cord, end_cord, promotion_piece): what apply_legal_move() was given.
+    def move(self, index) -> tuple:
+        return unpack_move(self.moves[index])
+
+    # Appends an entry already packed, with the piece moved and the piece captured.
+    def push(self, packed, piece, captured) -> None:
+        self.moves.append(packed)
+        self.pieces.append(piece)
+        self.pieces.append(captured)
+
+    def pop(self) -> tuple:
+        entry = self[-1]
+        del self[-1]
+        return entry
+
+    def clear(self) -> None:
+        del self.moves[:]
+        del self.pieces[:]
+
+
+# Castling rights kept by a move that starts or ends on these squares: a king or rook leaving home, or a rook captured there.
+CASTLING_MASKS = {(7, 4): 0b1100, (7, 7): 0b1110, (7, 0): 0b1101,
+                  (0, 4): 0b0011, (0, 7): 0b1011, (0, 0): 0b0111}
+
+
+# Directions of the rays from a square (dx, dy): straight ones (as a rook moves), diagonal ones (as a bishop moves).
+STRAIGHT_DIRECTIONS = ((1, 0), (-1, 0), (0, -1), (0, 1))
+DIAGONAL_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+KNIGHT_JUMPS = ((1, 2), (-1, 2), (1, -2), (-1, -2), (2, 1), (-2, 1), (2, -1), (-2, -1))
+
+# The cord of every square index; the tables below hold these very tuples, so walking them builds no new ones.
+CORDS = tuple((x, y) for x in range(8) for y in range(8))
+
+
+# Cords reached from square by steps of (dx, dy), nearest first, up to the edge of the board.
+def _ray(square, dx, dy) -> tuple:
+    x, y = CORDS[square]
+    cords = []
+    m, n = x + dx, y + dy
+    while 0 <= m <= 7 and 0 <= n <= 7:
+        cords.append(CORDS[m * 8 + n])
+        m, n = m + dx, n + dy
+    return tuple(cords)
+
+
+STRAIGHT_RAYS = tuple(tuple(_ray(square, dx, dy) for dx, dy in STRAIGHT_DIRECTIONS) for square in range(64))
+DIAGONAL_RAYS = tuple(tuple(_ray(square, dx, dy) for dx, dy in DIAGONAL_DIRECTIONS) for square in range(64))
+KNIGHT_TARGETS = tuple(tuple(ray[0] for ray in (_ray(square, dx, dy) for dx, dy in KNIGHT_JUMPS) if ray) for square in range(64))
+KING_TARGETS = tuple(tuple(ray[0] for ray in DIAGONAL_RAYS[square] + STRAIGHT_RAYS[square] if ray) for square in range(64))
+PAWN_ATTACKS = {color: tuple(tuple(ray[0] for ray in (_ray(square, -color, 1), _ray(square, -color, -1)) if ray) for square in range(64))
+                for color in (1, -1)}
+
+# A generator lists a move as the entry of a table for its start square and end square, so that none is built 
+# per move: MOVE_TUPLES[start][end] is (start_cord, end_cord, None) and MOVE_CODES[start][end] the same move 
+# packed by ttable.pack_move(); PROMOTION_TUPLES and PROMOTION_CODES hold the four promotions (queen, rook, 
+# bishop, knight) of a pawn moving onto the last rank, for white onto rank 8 and for black onto rank 1.
+MOVE_TUPLES = tuple(tuple((CORDS[start], CORDS[end], None) for end in range(64)) for start in range(64))
+MOVE_CODES = tuple(tuple(pack_move(move) for move in row) for row in MOVE_TUPLES)
+PROMOTION_TUPLES = tuple(tuple(tuple((CORDS[start], CORDS[end], piece * (1 if end < 8 else -1)) for piece in (4, 1, 3, 2))
+                               if end < 8 or end >= 56 else () for end in range(64)) for start in range(64))
+PROMOTION_CODES = tuple(tuple(tuple(pack_move(move) for move in moves) for moves in row) for row in PROMOTION_TUPLES)
+
+
+# add_on of a castling move (see top of file), by the end cord of the king.
+CASTLING_ADD_ONS = {(7, 6): 14, (7, 2): 15, (0, 6): 16, (0, 2): 17}
+
+# Rook (start cord, end cord) of a castling move, by add_on.
+CASTLING_ROOK_MOVES = {14: ((7, 7), (7, 5)), 15: ((7, 0), (7, 3)), 16: ((0, 7), (0, 5)), 17: ((0, 0), (0, 3))}
+
 
 class Engine():
-    def __init__(self, board=None, turn=1, moves=[]) -> None:
-        self.horizontal_offsets = ((1, 0), (-1, 0), (0, -1), (0, 1))
-        self.diagonal_offsets = ((1, 1), (1, -1), (-1, 1), (-1, -1))
-        self.knight_offsets = ((1, 2), (-1, 2), (1, -2), (-1, -2), (2, 1), (-2, 1), (2, -1), (-2, -1))
+    # Engine(backend="bitboard") hands back a BitboardEngine; it shares every public method of this class.
+    def __new__(cls, *args, backend="mailbox", **kwargs):
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown backend: {backend}")
+
+        if cls is Engine and backend == "bitboard":
+            from bitboard import BitboardEngine
+            cls = BitboardEngine
+        return super().__new__(cls)
+
+    def __init__(self, board=None, turn=1, moves=(), backend="mailbox", table=None) -> None:
+        self.horizontal_offsets = STRAIGHT_DIRECTIONS
+        self.diagonal_offsets = DIAGONAL_DIRECTIONS
+        self.knight_offsets = KNIGHT_JUMPS
 
         self.piece_function_key = {1: self.rook_cords,   -1: self.rook_cords, 
                                    2: self.knight_cords, -2: self.knight_cords, 
@@ -90,41 +360,262 @@ class Engine():
         self.black_pieces = tuple(self.pieces[:6])
         self.white_pieces = tuple(self.pieces[6:])
 
+        # Optional TranspositionTable (see ttable.py) that legal moves and status are cached in, by key.
+        self.table = table
+
         if board is None:
             self.reset()
         else:
             self.board = board
             self.turn = turn 
             self.move_log = moves
+            self.find_kings()
+            self.load_pieces()
+            self.start_history()
+
+    # The move log reads as a list of tuples (see top of file); it is kept packed, and whatever is assigned is packed.
+    @property
+    def move_log(self) -> MoveLog:
+        return self.log
+
+    @move_log.setter
+    def move_log(self, moves) -> None:
+        self.log = moves if isinstance(moves, MoveLog) else MoveLog(moves)
+
+    # Places piece (0 empties the square) on cord. move() and undo_move() write to the board only through here,
+    # so that a backend can mirror every change.
+    def set_square(self, cord, piece) -> None:
+        x, y = cord[0], cord[1]
+        old_piece = self.board[x][y]
+        self.key ^= ZOBRIST_PIECES[old_piece + 6][x * 8 + y] ^ ZOBRIST_PIECES[piece + 6][x * 8 + y]
+        self.score += PIECE_SQUARE_TABLES[piece + 6][x * 8 + y] - PIECE_SQUARE_TABLES[old_piece + 6][x * 8 + y]
+        self.board[x][y] = piece
+
+        if old_piece != 0:
+            self.piece_cords[1 if old_piece > 0 else -1].discard((x, y))
+            self.material[old_piece + 6] -= 1
+        if piece != 0:
+            self.piece_cords[1 if piece > 0 else -1].add((x, y))
+            self.material[piece + 6] += 1
+
+        # Keep track of where the kings are, so in_check() never has to look for them.
+        if piece == 5 or piece == -5:
+            self.king_positions[1 if piece > 0 else -1] = (cord[0], cord[1])
+
+    # Scans the board once for both kings (None if a king is missing).
+    def find_kings(self) -> None:
+        self.king_positions = {1: None, -1: None}
+        for x in range(8):
+            for y in range(8):
+                if self.board[x][y] in (5, -5):
+                    self.king_positions[1 if self.board[x][y] > 0 else -1] = (x, y)
+
+    # Piece lists, material counts and score (see top of file) from the board, once it has been replaced as a whole
+    # (a backend rebuilds what it keeps besides the board here too).
+    def load_pieces(self) -> None:
+        self.piece_cords = {1: set(), -1: set()}
+        self.material = [0] * 13
+        self.score = 0
+        for x in range(8):
+            for y in range(8):
+                piece = self.board[x][y]
+                if piece != 0:
+                    self.piece_cords[1 if piece > 0 else -1].add((x, y))
+                    self.material[piece + 6] += 1
+                    self.score += PIECE_SQUARE_TABLES[piece + 6][x * 8 + y]
+
+    # Works out the state from the move log, computes the key from scratch and starts an empty history.
+    def start_history(self) -> None:
+        self.derive_state()
+        self.key = self.zobrist_key()
+        self.history = []
+        self.game_status = None
+
+    # Castling rights, en-passant cord and halfmove clock, from the move log (one pass over it).
+    def derive_state(self) -> None:
+        self.castling = self.castling_rights()
+        self.en_passant = None
+        self.halfmove_clock = 0
+        self.ply_offset = 0
+
+        if len(self.move_log) > 0:
+            piece, start, _, end, _ = self.move_log[-1]
+            if piece in (6, -6) and abs(start[0] - end[0]) == 2:
+                self.en_passant = ((start[0] + end[0]) // 2, end[1])
+
+        for move in reversed(self.move_log):
+            if move[2] != 0 or move[0] in (6, -6):
+                break
+            self.halfmove_clock += 1
 
-    # This function takes a cord as input and adds an offset to it with a multiple - number of squares.
-    def offset(self, cord, offset, number_of_squares) -> list:
-        return [cord[0] + offset[0] * number_of_squares, cord[1] + offset[1] * number_of_squares]
+    def set_state(self, castling, en_passant, halfmove_clock, fullmove_number=1) -> None:
+        """
+        parameters:
+            (1) castling (int): castling rights bitmask (see top of file)
+            (2) en_passant (iterable object of length 2): the en-passant cord, or None
+            (3) halfmove_clock (int): plies since the last capture or pawn move
+            (4) fullmove_number (int) [OPTIONAL]: number of the current move (1 at the start of the game)
+
+        returns: None; the key is recomputed and the history is cleared. Rights whose king or rook is not on its home square are dropped.
+        """
+
+        self.castling = castling_on_board(self.board, castling)
+        self.en_passant = None if en_passant is None else tuple(en_passant)
+        self.halfmove_clock = halfmove_clock
+        self.ply_offset = 2 * (fullmove_number - 1) + (1 if self.turn == -1 else 0) - len(self.move_log)
+        self.key = self.zobrist_key()
+        self.history = []
+        self.game_status = None
+
+    @classmethod
+    def from_fen(cls, fen, backend="mailbox", table=None):
+        """
+        parameters:
+            (1) fen (str): the position in FEN (see fen.py)
+            (2) backend (str) [OPTIONAL]: the backend of the engine built
+            (3) table (TranspositionTable) [OPTIONAL]: its transposition table
+
+        returns: an Engine at the position, with an empty move log; raises ValueError if fen is not a valid FEN
+        """
+
+        board, turn, castling, en_passant, halfmove_clock, fullmove_number = parse_fen(fen)
+        engine = Engine(board, turn, (), backend=backend, table=table)
+        engine.set_state(castling, en_passant, halfmove_clock, fullmove_number)
+        return engine
+
+    def set_fen(self, fen) -> None:
+        """
+        parameters:
+            (1) fen (str): the position in FEN (see fen.py)
+
+        returns: None; the engine is set to the position, with an empty move log (a cheaper way than from_fen() 
+                 to go through many positions). Raises ValueError if fen is not a valid FEN.
+        """
+
+        board, turn, castling, en_passant, halfmove_clock, fullmove_number = parse_fen(fen)
+        self.board = board
+        self.turn = turn
+        self.move_log = []
+        self.find_kings()
+        self.load_pieces()
+        self.set_state(castling, en_passant, halfmove_clock, fullmove_number)
+
+    def to_fen(self) -> str:
+        """
+        parameters: None
+
+        returns: the current position in FEN (see fen.py)
+        """
+
+        plies = self.ply_offset + len(self.move_log)
+        return format_fen(self.board, self.turn, self.castling, self.en_passant, self.halfmove_clock, plies // 2 + 1)
+
+    def to_bytes(self) -> bytes:
+        """
+        parameters: None
+
+        returns: the position packed into bytes (see top of file); raises ValueError if a clock is above CLOCK_LIMIT
+        """
+
+        # The positions since the last capture or pawn move are the only ones that can repeat.
+        keys = [entry[0] for entry in self.history[len(self.history) - min(self.halfmove_clock, len(self.history)):]]
+        squares = bytes(piece + 6 for row in self.board for piece in row)
+        en_passant = 255 if self.en_passant is None else self.en_passant[0] * 8 + self.en_passant[1]
+        plies = self.ply_offset + len(self.move_log)
+
+        return (pack_position(squares, self.turn, self.castling, en_passant, self.halfmove_clock, plies // 2 + 1, len(keys)) + 
+                struct.pack(f"<{len(keys)}Q", *keys))
+
+    @classmethod
+    def from_bytes(cls, data, backend="mailbox", table=None):
+        """
+        parameters:
+            (1) data (bytes): a position packed by to_bytes()
+            (2) backend (str) [OPTIONAL]: the backend of the engine built
+            (3) table (TranspositionTable) [OPTIONAL]: its transposition table
+
+        returns: an Engine at the position, with an empty move log
+        """
+
+        squares, turn, castling, en_passant, halfmove_clock, fullmove_number, count = PACKED_POSITION.unpack_from(data)
+        board = [[squares[x * 8 + y] - 6 for y in range(8)] for x in range(8)]
+
+        engine = Engine(board, turn, (), backend=backend, table=table)
+        engine.set_state(castling, None if en_passant == 255 else (en_passant // 8, en_passant % 8), halfmove_clock, fullmove_number)
+
+        # The earlier keys are only ever read by repetition_count(); there is no move to undo them with.
+        keys = struct.unpack_from(f"<{count}Q", data, PACKED_POSITION.size)
+        engine.history = [(key, None, None, None) for key in keys]
+        return engine
+
+    @classmethod
+    def from_position(cls, position, backend="mailbox", table=None):
+        """
+        parameters:
+            (1) position (Position): an immutable position (see position.py)
+            (2) backend (str) [OPTIONAL]: the backend of the engine built
+            (3) table (TranspositionTable) [OPTIONAL]: its transposition table
+
+        returns: an Engine at the position, with an empty move log; the position itself is not changed by moves of the engine
+        """
+
+        squares = position.squares
+        board = [[squares[x * 8 + y] - 6 for y in range(8)] for x in range(8)]
+
+        engine = Engine(board, position.turn, (), backend=backend, table=table)
+        engine.set_state(position.castling, position.en_passant, position.halfmove_clock, position.fullmove_number)
+        return engine
+
+    def zobrist_key(self) -> int:
+        """
+        parameters: None
+
+        returns: the key of the current position, computed from scratch (see the top of file)
+        """
+
+        key = 0 if self.turn == 1 else ZOBRIST_BLACK_TO_MOVE
+        for x in range(8):
+            for y in range(8):
+                key ^= ZOBRIST_PIECES[self.board[x][y] + 6][x * 8 + y]
+
+        key ^= ZOBRIST_CASTLING[self.castling]
+        if self.en_passant is not None:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant[1]]
+        return key
+
+    # Castling rights bitmask (see the top of file) left by the moves of the log: a right is lost once the king 
+    # or that rook leaves its square, or the rook is captured on it.
+    def castling_rights(self) -> int:
+        rights = 0b1111
+        for move in self.move_log:
+            rights &= CASTLING_MASKS.get(tuple(move[1]), 0b1111) & CASTLING_MASKS.get(tuple(move[3]), 0b1111)
+        return rights
 
     # Returns all possible (possibly illegal) cords that the rook, hypothetically, could move from (start cord, which is a tuple of the form (x, y)).
     def rook_cords(self, start_cord) -> list:
         possible_end_cords = []
-        enemy_pieces = self.black_pieces if self.board[start_cord[0]][start_cord[1]] > 0 else self.white_pieces
-        max_squares = 8 if self.board[start_cord[0]][start_cord[1]] not in (5, -5) else 2 # Max offset multiplier
-
-        # 4 offsets - 4 directions, i.e top, down, left and right.
-        for direction_index in range(4):
-            # Max of 8 squares and 1 square, for rook and king respectively.
-            for n in range(1, max_squares):
-                # adds the offset and checks end cord on the board.
-                m, n = self.offset(start_cord, self.horizontal_offsets[direction_index], n)
-
-                # If the end cord is in enemy_pieces and is a valid cord, search must stop.
-                if 0 <= m <= 7 and 0 <= n <= 7 and self.board[m][n] in enemy_pieces:
-                    possible_end_cords.append((m, n))
-                    break
+        board = self.board
+        x, y = start_cord
+        piece = board[x][y]
+        is_king = piece == 5 or piece == -5 # A king goes one square only.
+
+        # 4 rays - 4 directions, i.e top, down, left and right; each one walked outwards from the start cord (see STRAIGHT_RAYS).
+        for ray in STRAIGHT_RAYS[x * 8 + y]:
+            for end_cord in ray:
+                target = board[end_cord[0]][end_cord[1]]
 
-                # If the end cord is empty and is a valid cord, search must continue.
-                elif 0 <= m <= 7 and 0 <= n <= 7 and self.board[m][n] == 0:
-                    possible_end_cords.append((m, n))
+                # If the end cord is empty, search must continue.
+                if target == 0:
+                    possible_end_cords.append(end_cord)
 
-                # If neither, it is either an invalid cord on an 8 x 8 board or it is occupied by a same color piece (also invalid); nevertheless, search must stop.
+                # If the end cord holds an enemy piece, it can be captured, and search must stop.
+                # Else it is occupied by a same color piece (invalid); search must stop.
                 else:
+                    if target * piece < 0:
+                        possible_end_cords.append(end_cord)
+                    break
+
+                if is_king:
                     break
 
         return possible_end_cords
@@ -132,18 +623,21 @@ class Engine():
     # Returns all possible (possibly illegal) cords that the bishop, hypothetically, could move from (start cord, which is a tuple of the form (x, y)).
     def bishop_cords(self, start_cord) -> list:
         possible_end_cords = []
-        enemy_pieces = self.black_pieces if self.board[start_cord[0]][start_cord[1]] > 0 else self.white_pieces
-        max_squares = 8 if self.board[start_cord[0]][start_cord[1]] not in (5, -5) else 2
-        
-        for direction_index in range(4):
-            for n in range(1, max_squares):
-                m, n = self.offset(start_cord, self.diagonal_offsets[direction_index], n)
-                if 0 <= m <= 7 and 0 <= n <= 7 and self.board[m][n] in enemy_pieces:
-                    possible_end_cords.append((m, n))
-                    break
-                elif 0 <= m <= 7 and 0 <= n <= 7 and self.board[m][n] == 0:
-                    possible_end_cords.append((m, n))
+        board = self.board
+        x, y = start_cord
+        piece = board[x][y]
+        is_king = piece == 5 or piece == -5
+
+        for ray in DIAGONAL_RAYS[x * 8 + y]:
+            for end_cord in ray:
+                target = board[end_cord[0]][end_cord[1]]
+                if target == 0:
+                    possible_end_cords.append(end_cord)
                 else:
+                    if target * piece < 0:
+                        possible_end_cords.append(end_cord)
+                    break
+                if is_king:
                     break
 
         return possible_end_cords
@@ -151,177 +645,107 @@ class Engine():
     # Returns all possible (possibly illegal) cords that the pawn, hypothetically, could move from (start cord, which is a tuple of the form (x, y)).
     def pawn_cords(self, start_cord) -> list:
         possible_end_cords = []
-        enemy_pieces = self.black_pieces if self.board[start_cord[0]][start_cord[1]] > 0 else self.white_pieces
+        board = self.board
 
         x = start_cord[0]
         y = start_cord[1]
+        piece = board[x][y]
 
         # If piece is white.
-        if enemy_pieces[0] == -1:
-
-            # If a previous move has been made.
-            if len(self.move_log) > 0: 
-                previous_move = self.move_log[-1]
+        if piece > 0:
 
-                # If the square to the right is occupied by a black pawn
-                # AND if the pawn previously moved, was indeed, a black pawn
-                # AND if the start_cord, of the previous move, is of the form (1, y + 1), i.e from 7th rank 
-                # AND if the destination was DIRECTLY to the adjacent right cord (on the 5th rank),
-                # then en-passant is possible.
-                if x > 0 and y < 7 and self.board[x][y + 1] == -6 and previous_move[0] == -6 and previous_move[1] == (1, y + 1) and previous_move[3] == (3, y + 1): 
-                    possible_end_cords.append((x - 1, y + 1))
+            # If a black pawn has just moved two squares and passed the square diagonally ahead of this one 
+            # (to the right or to the left), then en-passant is possible.
+            if self.en_passant is not None and self.turn == 1 and self.en_passant[0] == x - 1 and self.en_passant[1] in (y - 1, y + 1): 
+                possible_end_cords.append(self.en_passant)
 
-                # Same logic as above but with the square to the left
-                if x > 0 and y > 0 and self.board[x][y - 1] == -6 and previous_move[0] == -6 and previous_move[1] == (1, y - 1) and previous_move[3] == (3, y - 1): 
-                    possible_end_cords.append((x - 1, y - 1))
-
-            # Diagonal movement (diagonal_offsets [3] and [4] for top-right and top-left) with multiplier equal to 1.
-            for direction_index in range(2, 4):
-                m, n = self.offset(start_cord, self.diagonal_offsets[direction_index], 1)
-
-                # Only if the diagonal square is occupied by an enemy piece, is the square valid.
-                if 0 <= m <= 7 and 0 <= n <= 7 and self.board[m][n] in enemy_pieces:
-                    possible_end_cords.append((m, n))
+            # Diagonal movement, one square up and to the right or left (see PAWN_ATTACKS).
+            # Only if the diagonal square is occupied by an enemy piece, is the square valid.
+            for end_cord in PAWN_ATTACKS[1][x * 8 + y]:
+                if board[end_cord[0]][end_cord[1]] < 0:
+                    possible_end_cords.append(end_cord)
 
             # Checks if square above is free, i.e if it can move to the 3rd rank.
-            if x > 0 and self.board[x - 1][y] == 0: 
-                possible_end_cords.append((x - 1, y))
+            if x > 0 and board[x - 1][y] == 0: 
+                possible_end_cords.append(CORDS[(x - 1) * 8 + y])
 
             # If start rank is the 2nd rank and all squares in between are empty, then it can move to 4th rank.
-            if x == 6 and self.board[x - 2][y] == 0 and self.board[x - 1][y] == 0: 
-                possible_end_cords.append((x - 2, y))    
+            if x == 6 and board[x - 2][y] == 0 and board[x - 1][y] == 0: 
+                possible_end_cords.append(CORDS[(x - 2) * 8 + y])    
 
         # Same logic as above but for black pawns.
-        if enemy_pieces[0] == 1:
-
-            if len(self.move_log) > 0:
-                previous_move = self.move_log[-1]
-                if x < 7 and y < 7 and self.board[x][y + 1] == 6 and previous_move[0] == 6 and previous_move[1] == (6, y + 1) and previous_move[3] == (4, y + 1): 
-                    possible_end_cords.append((x + 1, y + 1))
-                if x < 7 and y > 0 and self.board[x][y - 1] == 6 and previous_move[0] == 6 and previous_move[1] == (6, y - 1) and previous_move[3] == (4, y - 1): 
-                    possible_end_cords.append((x + 1, y - 1))
-
-            for direction_index in range(2):
-                m, n  = self.offset(start_cord, self.diagonal_offsets[direction_index], 1)
-                if 0 <= m <= 7 and 0 <= n <= 7 and self.board[m][n] in enemy_pieces:
-                    possible_end_cords.append((m, n))
-
-            if x < 7 and self.board[x + 1][y] == 0: 
-                possible_end_cords.append((x + 1, y))
-            if x == 1 and self.board[x + 2][y] == 0 and self.board[x + 1][y] == 0: 
-                possible_end_cords.append((x + 2, y))
+        elif piece < 0:
+
+            if self.en_passant is not None and self.turn == -1 and self.en_passant[0] == x + 1 and self.en_passant[1] in (y - 1, y + 1): 
+                possible_end_cords.append(self.en_passant)
+
+            for end_cord in PAWN_ATTACKS[-1][x * 8 + y]:
+                if board[end_cord[0]][end_cord[1]] > 0:
+                    possible_end_cords.append(end_cord)
+
+            if x < 7 and board[x + 1][y] == 0: 
+                possible_end_cords.append(CORDS[(x + 1) * 8 + y])
+            if x == 1 and board[x + 2][y] == 0 and board[x + 1][y] == 0: 
+                possible_end_cords.append(CORDS[(x + 2) * 8 + y])
         return possible_end_cords
             
     # Returns all possible (possibly illegal) cords that the knight, hypothetically, could move from (start cord, which is a tuple of the form (x, y)).
     def knight_cords(self, start_cord) -> list:
-        possible_end_cords = []
-        enemy_pieces = self.black_pieces if self.board[start_cord[0]][start_cord[1]] > 0 else self.white_pieces
-
-        for direction_index in range(8):
-            m, n = self.offset(start_cord, self.knight_offsets[direction_index], 1)
-            if 0 <= m <= 7 and 0 <= n <= 7 and (self.board[m][n] in enemy_pieces or self.board[m][n] == 0):
-                possible_end_cords.append((m, n))
-        return possible_end_cords
+        board = self.board
+        x, y = start_cord
+        piece = board[x][y]
+        return [end_cord for end_cord in KNIGHT_TARGETS[x * 8 + y] if board[end_cord[0]][end_cord[1]] * piece <= 0]
 
     # Returns all possible (possibly illegal) cords that the queen, hypothetically, could move from (start cord, which is a tuple of the form (x, y)).
     # Adds bishop and rook's hypothetical movement from that cord.
     def queen_cords(self, start_cord) -> list:
-        return list(self.bishop_cords(start_cord) + self.rook_cords(start_cord))
+        return self.bishop_cords(start_cord) + self.rook_cords(start_cord)
 
     # Returns all possible (possibly illegal) cords that the king, hypothetically, could move from (start cord, which is a tuple of the form (x, y)).
-    # Adds bishop and rook's hypothetical movement from that cord; but with offset multipler equal to 1.
+    # Adds the squares one step away (see KING_TARGETS).
     # Also checks for castling moves.
     def king_cords(self, start_cord) -> list:
         possible_end_cords = []
 
         # If the start cord of king is where it is at the start of the game
-        # AND if the king has never been moved 
-        # AND if the rook to the right at the end of the rank has never been moved
+        # AND if the king-side castling right is still held (neither the king nor the rook to the right 
+        #     at the end of the rank has moved, nor has that rook been captured)
+        # AND if that rook is on its square (the right alone might have come from a bad FEN)
         # AND if all squares between the king and the rook in-consideration, are empty 
         # AND if the king is NOT in check
-        # AND if the king does not pass through checks,
+        # AND if the king does not pass through checks (nor lands in one),
         # then castling is possible.
-        if start_cord == (7, 4) and not self.has_moved(5, (7, 4)) and not self.has_moved(1, (7, 7)) and self.board[7][5:7] == [0, 0] and not self.in_check(1):
-            # Simulate king moving one step to the right.
-            self.board[7][4:7] = [0, 5, 0]
-
-            # Check if in that position, check is delivered.
-            if not self.in_check(1):
-
-                # Simulate king moving two steps to the right.
-                self.board[7][4:7] = [0, 0, 5]
-
-                # Check if in that position, check is delivered.
-                if not self.in_check(1): 
-
-                    # Reset to original state.
-                    self.board[7][4:7] = [5, 0, 0]
-
-                    # Add two steps to the right as valid, don't worry about hinting that it is a castling move for, func move() will handle that.
-                    possible_end_cords.append((7, 6))
-
-            # Reset to original state.
-            self.board[7][4:7] = [5, 0, 0]
-            
+        # Add two steps to the right as valid, don't worry about hinting that it is a castling move for, func move() will handle that.
+        if (start_cord == (7, 4) and self.castling & 1 and self.board[7][7] == 1 and self.board[7][5:7] == [0, 0] and 
+            not self.is_square_attacked((7, 4), -1) and not self.is_square_attacked((7, 5), -1) and not self.is_square_attacked((7, 6), -1)):
+            possible_end_cords.append((7, 6))
 
         # Same logic as above.
-        if start_cord == (7, 4) and not self.has_moved(5, (7, 4)) and not self.has_moved(1, (7, 0)) and self.board[7][1:4] == [0, 0, 0] and not self.in_check(1):
-            self.board[7][2:5] = [0, 5, 0]
-
-            if not self.in_check(1):
-                self.board[7][2:5] = [5, 0, 0]
-
-                if not self.in_check(1):
-                    self.board[7][2:5] = [0, 0, 5]
-                    possible_end_cords.append((7, 2))
-
-            self.board[7][2:5] = [0, 0, 5]
+        if (start_cord == (7, 4) and self.castling & 2 and self.board[7][0] == 1 and self.board[7][1:4] == [0, 0, 0] and 
+            not self.is_square_attacked((7, 4), -1) and not self.is_square_attacked((7, 3), -1) and not self.is_square_attacked((7, 2), -1)):
+            possible_end_cords.append((7, 2))
             
-        if start_cord == (0, 4) and not self.has_moved(-5, (0, 4)) and not self.has_moved(-1, (0, 7)) and self.board[0][5:7] == [0, 0] and not self.in_check(-1):
-            self.board[0][4:7] = [0, -5, 0]
-
-            if not self.in_check(-1):
-                self.board[0][4:7] = [0, 0, -5]
-
-                if not self.in_check(-1):
-                    self.board[0][4:7] = [-5, 0, 0]
-                    possible_end_cords.append((0, 6))
-
-            self.board[0][4:7] = [-5, 0, 0]
+        if (start_cord == (0, 4) and self.castling & 4 and self.board[0][7] == -1 and self.board[0][5:7] == [0, 0] and 
+            not self.is_square_attacked((0, 4), 1) and not self.is_square_attacked((0, 5), 1) and not self.is_square_attacked((0, 6), 1)):
+            possible_end_cords.append((0, 6))
             
-        if start_cord == (0, 4) and not self.has_moved(-5, (0, 4)) and not self.has_moved(-1, (0, 0)) and self.board[0][1:4] == [0, 0, 0] and not self.in_check(-1):
-            self.board[0][2:5] = [0, -5, 0]
-
-            if not self.in_check(-1):
-                self.board[0][2:5] = [-5, 0, 0]
-
-                if not self.in_check(-1):
-                    self.board[0][2:5] = [0, 0, -5]
-
-                    possible_end_cords.append((0, 2))
-            self.board[0][2:5] = [0, 0, -5]
+        if (start_cord == (0, 4) and self.castling & 8 and self.board[0][0] == -1 and self.board[0][1:4] == [0, 0, 0] and 
+            not self.is_square_attacked((0, 4), 1) and not self.is_square_attacked((0, 3), 1) and not self.is_square_attacked((0, 2), 1)):
+            possible_end_cords.append((0, 2))
         
-        possible_end_cords.extend(self.bishop_cords(start_cord) + self.rook_cords(start_cord))
+        board = self.board
+        x, y = start_cord
+        piece = board[x][y]
+        for end_cord in KING_TARGETS[x * 8 + y]:
+            if board[end_cord[0]][end_cord[1]] * piece <= 0:
+                possible_end_cords.append(end_cord)
         return possible_end_cords
 
-    # Check if a piece has ever moved from a cord.
-    def has_moved(self, piece, cord) -> bool:
-        for move in self.move_log:
-            if move[0] == piece and move[1] == cord:
-                return True
-        return False
-    
     # Checks if side (color: 1 for white and -1 for black) can move any piece or not.
     def cannot_move(self, color) -> bool:
-        self_pieces = self.white_pieces if color == 1 else self.black_pieces
-
-        for x in range(8):
-            for y in range(8):
-                if self.board[x][y] in self_pieces:
-                    # If there is any legal move at all
-                    if len(self.get_all_legal_moves((x, y))) > 0:
-                        return False
-        return True
+        if color == self.turn:
+            return self.position_status() & STATUS_NO_MOVES != 0
+        return len(self.generate_legal_moves(color)) == 0
 
     def reset(self) -> None:
         """
@@ -359,7 +783,48 @@ class Engine():
             self.board[1][i] = self.pieces[5]
             self.board[6][i] = self.pieces[11]
 
-    # TODO: in_check() broken. fix it.
+        self.find_kings()
+        self.load_pieces()
+        self.start_history()
+
+    def is_square_attacked(self, cord, color) -> bool:
+        """
+        parameters:
+            (1) cord (iterable object of length 2): the co-ordinate of the square looked at
+            (2) color int: 1 (white) or -1 (black); the side whose attacks are looked for
+
+        returns: True if any piece of color attacks cord; else False
+        """
+
+        board = self.board
+        square = cord[0] * 8 + cord[1]
+
+        # Knights: any knight of color a knight's jump away from cord.
+        knight = 2 * color
+        for m, n in KNIGHT_TARGETS[square]:
+            if board[m][n] == knight:
+                return True
+
+        # Pawns: a pawn of color attacks cord from the squares a pawn of the other colour on cord would attack 
+        # (white pawns capture towards x = 0, so a white pawn attacking cord stands on the row below, x + 1).
+        pawn = 6 * color
+        for m, n in PAWN_ATTACKS[-color][square]:
+            if board[m][n] == pawn:
+                return True
+
+        # Rays: walk outwards until the first piece; it attacks cord if it is a rook or queen (straight rays), 
+        # a bishop or queen (diagonal rays), or the king one step away.
+        queen, king = 4 * color, 5 * color
+        for rays, slider in ((STRAIGHT_RAYS[square], color), (DIAGONAL_RAYS[square], 3 * color)):
+            for ray in rays:
+                for end_cord in ray:
+                    piece = board[end_cord[0]][end_cord[1]]
+                    if piece != 0:
+                        if piece == slider or piece == queen or (piece == king and end_cord is ray[0]):
+                            return True
+                        break
+        return False
+
     def in_check(self, color) -> bool:
         """
         parameters:
@@ -367,34 +832,11 @@ class Engine():
 
         returns: True or False if the color is under check; else False
         """
-        print(f"checking if {color} is in check")
-        if color == 1:
-            enemy_pieces = self.black_pieces
-        elif color == -1:
-            enemy_pieces = self.white_pieces
-        else:
+        if color not in (1, -1):
             return None
 
-        king_cord = None
-        
-        # search for king
-        for i in range(8):
-            for j in range(8):
-                if self.board[i][j] == 5 and color == 1: 
-                    king_cord = (i, j)
-                    break
-                elif self.board[i][j] == -5 and color == -1: 
-                    king_cord = (i, j)
-                    break
-        
-        if king_cord is not None:
-            # For every piece on the board, if it is occupied by an enemy piece and its possible_end_cords includes the king_cord,
-            # then the king is under check.       
-            for m in range(8):
-                for n in range(8):
-                    if self.board[m][n] in enemy_pieces and king_cord in self.piece_function_key[self.board[m][n]]((m, n)):
-                        return True
-        return False
+        king_cord = self.king_positions[color]
+        return king_cord is not None and self.is_square_attacked(king_cord, -color)
 
     def get_all_legal_moves(self, start_cord) -> list:
         """
@@ -405,35 +847,205 @@ class Engine():
         """
 
         x, y = start_cord
-        color = 1 if self.board[x][y] > 0 else -1
-        all_legal_moves = []
 
         # If the square is empty, return an empty list.
         if self.board[x][y] == 0:
-            return all_legal_moves
-  
-        # List of all possible end cords.
-        all_possible_end_cords = self.piece_function_key[self.board[x][y]]((x, y))
-
-        if all_possible_end_cords != []:
-            for cord in all_possible_end_cords:
-
-                # Simulate the move.
-                piece_moved = self.board[x][y]
-                piece_captured = self.board[cord[0]][cord[1]]
-
-                self.board[x][y] = 0
-                self.board[cord[0]][cord[1]] = piece_moved
-                
-                # Check if in_check.
-                if not self.in_check(color):
-                    all_legal_moves.append(cord)
-                
-                # Undo move to leave board unaltered after this function terminates.
-                self.board[x][y] = piece_moved
-                self.board[cord[0]][cord[1]] = piece_captured
-
-        return all_legal_moves
+            return []
+
+        # A promotion is listed once per promotion piece by generate_legal_moves(); keep one cord per move.
+        color = 1 if self.board[x][y] > 0 else -1
+        return [end_cord for _, end_cord, promotion_piece in self.generate_legal_moves(color, (x, y)) 
+                if promotion_piece is None or promotion_piece == 4 * color]
+
+    def generate_legal_moves(self, color, start_cord=None) -> list:
+        """
+        parameters:
+            (1) color int: 1 (white) or -1 (black)
+            (2) start_cord (iterable object of length 2) [OPTIONAL]: only generate the moves of the piece on this co-ordinate
+
+        returns: A list of all legal moves of color, as (start_cord, end_cord, promotion_piece) tuples.
+                 promotion_piece is None unless the move is a promotion, which is listed once per piece (queen, rook, bishop, knight).
+        """
+
+        return self.collect_legal_moves(color, start_cord, MOVE_TUPLES, PROMOTION_TUPLES)
+
+    # The legal moves of color packed by ttable.pack_move(), 2 bytes each, in the order of generate_legal_moves().
+    def generate_packed_moves(self, color, start_cord=None) -> array:
+        return array("H", self.collect_legal_moves(color, start_cord, MOVE_CODES, PROMOTION_CODES))
+
+    def collect_legal_moves(self, color, start_cord, move_table, promotion_table) -> list:
+        """
+        parameters:
+            (1) color int: 1 (white) or -1 (black)
+            (2) start_cord (iterable object of length 2): only generate the moves of the piece on this co-ordinate (None for all)
+            (3) move_table, promotion_table: MOVE_TUPLES and PROMOTION_TUPLES, or MOVE_CODES and PROMOTION_CODES
+
+        returns: the legal moves of color, as the entries of the tables (see top of file) for their squares: 
+                 generate_legal_moves() and generate_packed_moves() are this, with one pair of tables or the other.
+        """
+
+        board = self.board
+        enemy = -color
+        king_cord = self.king_positions[color]
+        last_rank = 0 if color == 1 else 7
+        legal_moves = []
+        append = legal_moves.append
+
+        # Found once per position, by walking outwards from the king:
+        #   checkers:   number of enemy pieces giving check.
+        #   check_mask: None if not in check; else the squares that capture the checker or block its ray.
+        #   pins:       pinned cord -> the squares it may still move to (the pin ray, up to and including the pinner).
+        checkers = 0
+        check_mask = None
+        pins = {}
+
+        if king_cord is not None:
+            kx, ky = king_cord
+            square = kx * 8 + ky
+
+            for rays, slider in ((STRAIGHT_RAYS[square], 1), (DIAGONAL_RAYS[square], 3)):
+                for ray in rays:
+                    pinned = None
+
+                    for i, (m, n) in enumerate(ray):
+                        piece = board[m][n]
+
+                        # First own piece on the ray may be pinned; a second one shields it.
+                        if piece * color > 0:
+                            if pinned is not None:
+                                break
+                            pinned = ray[i]
+
+                        elif piece != 0:
+                            if piece == slider * enemy or piece == 4 * enemy:
+                                if pinned is None:
+                                    checkers += 1
+                                    check_mask = set(ray[:i + 1])
+                                else:
+                                    pins[pinned] = set(ray[:i + 1])
+                            break
+
+            for m, n in KNIGHT_TARGETS[square]:
+                if board[m][n] == 2 * enemy:
+                    checkers += 1
+                    check_mask = {(m, n)}
+
+            # An enemy pawn giving check stands one row ahead of the king (from the king's point of view): 
+            # on a square a pawn of color on the king's square would attack.
+            for m, n in PAWN_ATTACKS[color][square]:
+                if board[m][n] == 6 * enemy:
+                    checkers += 1
+                    check_mask = {(m, n)}
+
+        if start_cord is None:
+            cords = sorted(self.piece_cords[color])
+        else:
+            cords = [tuple(start_cord)] if board[start_cord[0]][start_cord[1]] * color > 0 else []
+
+        for cord in cords:
+            x, y = cord
+            piece = board[x][y]
+
+            # Only the king may move out of a double check; king moves are generated below.
+            if piece == 5 * color or checkers > 1:
+                continue
+
+            pin = pins.get(cord)
+            moves = move_table[x * 8 + y]
+            for end_cord in self.piece_function_key[piece](cord):
+                if pin is not None and end_cord not in pin:
+                    continue
+
+                # En-passant (a pawn moving diagonally onto an empty square) removes a pawn that neither the check 
+                # nor the pin mask accounts for, so it is the one move that is simulated.
+                if piece == 6 * color and end_cord[1] != y and board[end_cord[0]][end_cord[1]] == 0:
+                    board[x][y] = 0
+                    board[x][end_cord[1]] = 0
+                    board[end_cord[0]][end_cord[1]] = piece
+                    if king_cord is None or not self.is_square_attacked(king_cord, enemy):
+                        append(moves[end_cord[0] * 8 + end_cord[1]])
+                    board[x][y] = piece
+                    board[x][end_cord[1]] = -piece
+                    board[end_cord[0]][end_cord[1]] = 0
+                    continue
+
+                if check_mask is not None and end_cord not in check_mask:
+                    continue
+
+                if piece == 6 * color and end_cord[0] == last_rank:
+                    legal_moves.extend(promotion_table[x * 8 + y][end_cord[0] * 8 + end_cord[1]])
+                else:
+                    append(moves[end_cord[0] * 8 + end_cord[1]])
+
+        # The king may not step onto an attacked square; it is lifted off the board while looking, 
+        # so that it does not shield squares behind it from a slider. Castling is checked by king_cords().
+        if king_cord is not None and (start_cord is None or tuple(start_cord) == king_cord):
+            kx, ky = king_cord
+            king_end_cords = self.king_cords(king_cord)
+            moves = move_table[kx * 8 + ky]
+
+            board[kx][ky] = 0
+            for end_cord in king_end_cords:
+                if abs(end_cord[1] - ky) == 2 or not self.is_square_attacked(end_cord, enemy):
+                    append(moves[end_cord[0] * 8 + end_cord[1]])
+            board[kx][ky] = 5 * color
+
+        return legal_moves
+
+    # All legal moves of the side to move, looked up in (and else stored to) the transposition table if there is one.
+    def legal_moves(self) -> list:
+        if self.table is None:
+            return self.generate_legal_moves(self.turn)
+
+        moves = self.table.get_moves(self.key)
+        if moves is None:
+            moves = self.generate_legal_moves(self.turn)
+            self.table.store_moves(self.key, moves)
+        return moves
+
+    # The legal moves of the side to move packed by ttable.pack_move(), 2 bytes each (see generate_packed_moves()).
+    def packed_legal_moves(self) -> array:
+        return self.generate_packed_moves(self.turn)
+
+    def position_status(self) -> int:
+        """
+        parameters: None
+
+        returns: the status flags of the side to move (see top of file): STATUS_IN_CHECK if it is in check, 
+                 STATUS_NO_MOVES if it has no legal move; 0 if neither
+        """
+
+        if self.table is not None:
+            status = self.table.get_status(self.key)
+            if status is not None:
+                return status
+
+        status = (STATUS_IN_CHECK if self.in_check(self.turn) else 0) | (STATUS_NO_MOVES if len(self.legal_moves()) == 0 else 0)
+        if self.table is not None:
+            self.table.store_status(self.key, status)
+        return status
+
+    def status(self) -> GameStatus:
+        """
+        parameters: None
+
+        returns: the GameStatus (see top of file) of the position, worked out once and kept until the next 
+                 move(), undo_move() or reset()
+        """
+
+        if self.game_status is None:
+            in_check = self.in_check(self.turn)
+            legal_moves = len(self.legal_moves())
+            checkmate = in_check and legal_moves == 0
+            stalemate = not in_check and legal_moves == 0
+            draw = stalemate or (not checkmate and self.is_draw())
+
+            if checkmate:
+                result = "0-1" if self.turn == 1 else "1-0"
+            else:
+                result = "1/2-1/2" if draw else None
+            self.game_status = GameStatus(in_check, legal_moves, checkmate, stalemate, draw, result)
+        return self.game_status
 
     def is_draw(self) -> bool:
         """
@@ -443,38 +1055,47 @@ class Engine():
         """
         # citation for the rules: wikipedia
 
-        # If the previous 3 moves were the same, it is a draw.
-        if len(self.move_log) >= 9 and self.move_log[-1] == self.move_log[-5] == self.move_log[-9]: 
+        # If the same position has occurred 3 times, it is a draw.
+        if self.is_threefold_repetition(): 
             return True
 
-        # If in the last 50 moves, no pawn was moved OR no piece was captured, it is a draw.
-        if len(self.move_log) >= 50:
-            for i in range(-1, -51, -1):
-                if self.move_log[i][3] != 0 or self.move_log[i][0] in (6, -6): 
-                    return False
+        # If in the last 50 moves (100 plies), no pawn was moved AND no piece was captured, it is a draw.
+        if self.halfmove_clock >= 100:
             return True
         
-        white_pieces = []
-        black_pieces = []
-        for row in self.board:
-            for piece in row:
-                if piece < 0 :
-                    black_pieces.append(piece)
-                elif piece > 0: 
-                    white_pieces.append(piece)
-
-        white_pieces = sorted(white_pieces)
-        black_pieces = sorted(black_pieces)
-        
         # If certain piece combinations (evident below) are observed, it is a draw:
-        if white_pieces in ([5], [3, 5], [2, 5]) and black_pieces in ([-5], [-5, -3], [-5, -2]): 
+        #     king (and a bishop or a knight) against king (and a bishop or a knight), two knights and king against king.
+        material = self.material
+        white_minors = material[6 + 3] + material[6 + 2]
+        black_minors = material[6 - 3] + material[6 - 2]
+        if material[6 + 1] + material[6 + 4] + material[6 + 6] + material[6 - 1] + material[6 - 4] + material[6 - 6] > 0:
+            return False
+        if white_minors <= 1 and black_minors <= 1:
             return True
-        elif white_pieces == [2, 2, 5] and black_pieces == [-5]: 
+        if (material[6 + 2] == 2 and material[6 + 3] == 0 and black_minors == 0) or (material[6 - 2] == 2 and material[6 - 3] == 0 and white_minors == 0):
             return True
-        elif black_pieces == [-5, -2, -2] and white_pieces == [5]: 
-            return True 
         return False
 
+    def repetition_count(self) -> int:
+        """
+        parameters: None
+
+        returns: the number of times the current position has occurred (1 the first time). 
+                 Only the positions since the last capture or pawn move are looked at; none before it can repeat.
+        """
+
+        count = 1
+        for i in range(2, min(self.halfmove_clock, len(self.history)) + 1, 2):
+            if self.history[-i][0] == self.key:
+                count += 1
+        return count
+
+    def is_threefold_repetition(self) -> bool:
+        return self.repetition_count() >= 3
+
+    def is_fivefold_repetition(self) -> bool:
+        return self.repetition_count() >= 5
+
     def in_checkmate(self) -> int:
         """
         paramters: None
@@ -482,7 +1103,7 @@ class Engine():
         returns: 1 if white's turn and has been check-mated; -1 if black's turn and has been check-mated; else None
         """
 
-        if self.cannot_move(self.turn) and self.in_check(self.turn): 
+        if self.status().checkmate: 
             return self.turn
     
     def is_stalemate(self) -> bool:
@@ -492,7 +1113,7 @@ class Engine():
         returns: True if game state is a stalemate; else False
         """
 
-        return True if self.cannot_move(self.turn) and not self.in_check(self.turn) else False
+        return self.status().stalemate
 
     def is_promotion_move(self, start_cord, end_cord) -> bool:
         """
@@ -522,102 +1143,94 @@ class Engine():
         x1 = start_cord[0]
         y1 = start_cord[1]
 
-        x2 = end_cord[0]
-        y2 = end_cord[1]
-
         # If it is the turn of the piece's color.
         if (self.turn > 0 and self.board[x1][y1] > 0) or (self.turn < 0 and self.board[x1][y1] < 0):
             
             # If the end_cord is a possible cord (also possibly illegal).
-            if end_cord in self.piece_function_key[self.board[x1][y1]](start_cord):
-
-                # If promotion_piece not given, set to queen of the respective color.
-                if promotion_piece is None:
-                    promotion_piece = 4 if self.turn == 1 else -4
-
-                # add_on not yet specified, but declared.
-                add_on = None
-
-                # Flag for if_promotion is possible.
-                is_promotion = False
-
-                # Piece to be moved.
-                piece_moved = self.board[x1][y1]
-
-                # Piece to be captured (could be 0).
-                piece_captured = self.board[x2][y2]
-
-                # If promotion is possible.
-                if self.is_promotion_move(start_cord, end_cord):
-                    is_promotion = True
-
-                # Checks if en-passant is possible AND is the chosen move.
-                # The required add_on is set.
-                if len(self.move_log) > 0:
-                    prev = self.move_log[-1]
-                    if end_cord == (x1 - 1, y1 + 1) and x1 > 0 and y1 < 7 and self.board[x1][y1 + 1] == -6 and prev[0] == -6 and prev[1] == (1, y1 + 1) and prev[3] == (3, y1 + 1): 
-                        self.board[x1][y1 + 1] = 0
-                        add_on = 10
-                        
-                    elif end_cord == (x1 - 1, y1 - 1) and x1 > 0 and y1 > 0 and self.board[x1][y1 - 1] == -6 and prev[0] == -6 and prev[1] == (1, y1 - 1) and prev[3] == (3, y1 - 1): 
-                        self.board[x1][y1 - 1] = 0
-                        add_on = 11
-
-                    elif end_cord == (x1 + 1, y1 + 1) and x1 < 7 and y1 < 7 and self.board[x1][y1 + 1] == 6 and prev[0] == 6 and prev[1] == (6, y1 + 1) and prev[3] == (4, y1 + 1): 
-                        self.board[x1][y1 + 1] = 0
-                        add_on = 12
-                        
-                    elif end_cord == (x1 + 1, y1 - 1) and x1 < 7 and y1 > 0 and self.board[x1][y1 - 1] == 6 and prev[0] == 6 and prev[1] == (6, y1 - 1) and prev[3] == (4, y1 - 1): 
-                        self.board[x1][y1 - 1] = 0
-                        add_on = 13
-                
-                # Make move.
-                self.board[x1][y1] = 0
-                self.board[x2][y2] = piece_moved
-                
-                # After the move has been made, if color in check, reverse the move and return False.
-                if self.in_check(self.turn):
-                    self.board[x1][y1] = piece_moved
-                    self.board[x2][y2] = piece_captured
-                    return False
-
-                # Checks if the move is castling and sets the required add_on. 
-                if piece_moved == 5 and start_cord == (7, 4) and end_cord == (7, 6): 
-                    self.board[7][5] = 1
-                    self.board[7][7] = 0
-                    add_on = 14
-    
-                elif piece_moved == 5 and start_cord == (7, 4) and end_cord == (7, 2): 
-                    self.board[7][3] = 1
-                    self.board[7][0] = 0
-                    add_on = 15
-            
-                elif piece_moved == -5 and start_cord == (0, 4) and end_cord == (0, 6): 
-                    self.board[0][5] = -1
-                    self.board[0][7] = 0
-                    add_on = 16
-                
-                elif piece_moved == -5 and start_cord == (0, 4) and end_cord == (0, 2): 
-                    self.board[0][3] = -1
-                    self.board[0][0] = 0
-                    add_on = 17
-
-                # If promotion flag is True, the end_cord is replaced with promotion_piece.
-                elif is_promotion:
-                    self.board[x2][y2] = promotion_piece
-
-                # Move added to log.
-                if add_on == None:
-                    self.move_log.append((piece_moved, start_cord, piece_captured, end_cord, 0))
-                else:
-                    self.move_log.append((piece_moved, start_cord, piece_captured, end_cord, add_on))
+            if tuple(end_cord) in self.piece_function_key[self.board[x1][y1]](start_cord):
 
-                # It is now the opponent's turn.
-                self.turn *= -1
+                # Make move; if it leaves the mover's king in check, take it back and return False.
+                self.apply_legal_move(start_cord, end_cord, promotion_piece)
+                if self.in_check(-self.turn):
+                    self.undo_legal_move()
+                    return False
                 return True
 
         return False
 
+    def apply_legal_move(self, start_cord, end_cord, promotion_piece=None) -> None:
+        """
+        parameters:
+            (1) start_cord, end_cord, promotion_piece: a move of legal_moves() (see generate_legal_moves()); 
+                                                       promotion_piece is Queen (4 or -4) by default, as in move()
+
+        returns: None. Nothing is checked: a move that is not legal leaves the engine in a state no game can reach. 
+                 move() is the one for moves from outside (the GUI, a network, ...); this one, for moves of the generator.
+        """
+
+        x1, y1 = start_cord[0], start_cord[1]
+        x2, y2 = end_cord[0], end_cord[1]
+        board = self.board
+
+        # Piece to be moved, piece to be captured (could be 0) and key of the position before the move, for the history.
+        piece_moved = board[x1][y1]
+        piece_captured = board[x2][y2]
+        previous_key = self.key
+        promoted = 0
+
+        self.set_square(start_cord, 0)
+        self.set_square(end_cord, piece_moved)
+
+        if piece_moved == 6 or piece_moved == -6:
+            # A pawn moving diagonally onto an empty square takes en-passant the pawn beside it.
+            if y1 != y2 and piece_captured == 0:
+                self.set_square((x1, y2), 0)
+
+            # The pawn is replaced with promotion_piece on the last rank.
+            elif x2 == 0 or x2 == 7:
+                promoted = promotion_piece or 4 * self.turn
+                self.set_square(end_cord, promoted)
+
+        # A king moving two squares castles; the rook jumps over it.
+        elif (piece_moved == 5 or piece_moved == -5) and (y2 - y1 == 2 or y1 - y2 == 2):
+            add_on = CASTLING_ADD_ONS[(x2, y2)]
+            rook_start, rook_end = CASTLING_ROOK_MOVES[add_on]
+            self.set_square(rook_end, 1 if piece_moved > 0 else -1)
+            self.set_square(rook_start, 0)
+
+        # Move added to log (packed as by ttable.pack_move()).
+        self.log.push((x1 * 8 + y1) | (x2 * 8 + y2) << 6 | (promoted + 6) << 12, piece_moved, piece_captured)
+
+        # It is now the opponent's turn.
+        self.turn *= -1
+
+        # The state of the position left goes onto the history. set_square() has already updated the key 
+        # for the pieces; add the side to move, castling rights and en-passant file.
+        self.history.append((previous_key, self.castling, self.en_passant, self.halfmove_clock))
+        self.key ^= ZOBRIST_BLACK_TO_MOVE
+
+        if self.castling:
+            castling = self.castling & CASTLING_MASKS.get((x1, y1), 0b1111) & CASTLING_MASKS.get((x2, y2), 0b1111)
+            self.key ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+            self.castling = castling
+
+        if self.en_passant is not None:
+            self.key ^= ZOBRIST_EN_PASSANT[self.en_passant[1]]
+            self.en_passant = None
+
+        # A pawn moving two squares can be taken en-passant on the square it passed.
+        if (piece_moved == 6 or piece_moved == -6) and (x2 - x1 == 2 or x1 - x2 == 2):
+            self.en_passant = ((x1 + x2) // 2, y1)
+            self.key ^= ZOBRIST_EN_PASSANT[y1]
+
+        # Captures and pawn moves cannot be taken back, so no earlier position can come again.
+        if piece_captured != 0 or piece_moved == 6 or piece_moved == -6:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+
+        self.game_status = None
+
     def undo_move(self) -> bool:
         """
         parameters: None
@@ -626,48 +1239,54 @@ class Engine():
         """
 
         if len(self.move_log) > 0:
-            # Undo move.
-            previous_move = self.move_log[-1]
-            self.board[previous_move[1][0]][previous_move[1][1]] = previous_move[0]
-            self.board[previous_move[3][0]][previous_move[3][1]] = previous_move[2]
-            
-            # If add_on detected...
-            # pawns are added back in case of en-passant add-ons.
-            # rooks are re-placed in case of castling add_ons.
-            if previous_move[4] != 0:
-                if previous_move[4] == 10: 
-                    self.board[previous_move[1][0]][previous_move[1][1] + 1] = -6
-                    
-                elif previous_move[4] == 11:
-                    self.board[previous_move[1][0]][previous_move[1][1] - 1] = -6
-                    
-                elif previous_move[4] == 12:
-                    self.board[previous_move[1][0]][previous_move[1][1] + 1] = 6
-                    
-                elif previous_move[4] == 13:
-                    self.board[previous_move[1][0]][previous_move[1][1] - 1] = 6
-
-                elif previous_move[4] == 14: 
-                    self.board[7][7] = 1
-                    self.board[7][5] = 0
-                    
-                elif previous_move[4] == 15:
-                    self.board[7][0] = 1
-                    self.board[7][3] = 0
-                    
-                elif previous_move[4] == 16: 
-                    self.board[0][7] = -1
-                    self.board[0][5] = 0
-                    
-                elif previous_move[4] == 17: 
-                    self.board[0][0] = -1
-                    self.board[0][3] = 0
-
-            # Delete the log.
-            del self.move_log[-1]
-
-            # Reverse the turn.
-            self.turn *= -1
-
+            self.undo_legal_move()
             return True
         return False
+
+    # undo_move() for a caller that knows there is a move to undo (the pair of apply_legal_move()).
+    def undo_legal_move(self) -> None:
+        # Undo move.
+        piece_moved, start_cord, piece_captured, end_cord, add_on = self.log.pop()
+        self.set_square(start_cord, piece_moved)
+        self.set_square(end_cord, piece_captured)
+
+        # If add_on detected...
+        # rooks are re-placed in case of castling add_ons.
+        # pawns are added back in case of en-passant add-ons (beside the start cord, on the file of the end cord).
+        if add_on != 0:
+            if add_on in CASTLING_ROOK_MOVES:
+                rook_start, rook_end = CASTLING_ROOK_MOVES[add_on]
+                self.set_square(rook_start, 1 if piece_moved > 0 else -1)
+                self.set_square(rook_end, 0)
+            else:
+                self.set_square((start_cord[0], end_cord[1]), -piece_moved)
+
+        # Reverse the turn.
+        self.turn *= -1
+
+        # Back to the state from before the move; an engine built from a move log works it out from the log.
+        if len(self.history) > 0:
+            self.key, self.castling, self.en_passant, self.halfmove_clock = self.history.pop()
+        else:
+            self.start_history()
+
+        self.game_status = None
+
+    def perft(self, depth) -> int:
+        """
+        parameters:
+            (1) depth (int): number of plies to walk from the current position
+
+        returns: the number of leaf nodes (positions) reached after exactly depth plies; 
+                 every promotion piece counts as a separate move.
+        """
+
+        if depth == 0:
+            return 1
+
+        nodes = 0
+        for start_cord, end_cord, promotion_piece in self.legal_moves():
+            self.apply_legal_move(start_cord, end_cord, promotion_piece)
+            nodes += self.perft(depth - 1)
+            self.undo_legal_move()
+        return nodes
@@ -0,0 +1,177 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* The static evaluation: every piece is worth a fixed number of centipawns on every square      *
+* (PIECE_SQUARE_TABLES: its material, plus a bonus for where it stands), and a position is      *
+* worth the sum over its pieces.                                                                *
+*                                                                                               *
+* An Engine keeps that sum (Engine.score) as its pieces move: set_square() adds the entry of    *
+* the piece put on a square and takes off the one of the piece it replaces, so move() and       *
+* undo_move() keep it right and evaluate() only reads it.                                       *
+*                                                                                               *
+* evaluate_batch() scores many positions in one go with NumPy, as N x 12 x 64 one-hot planes    *
+* (one plane per piece code) dotted with the tables: for labelling positions offline.           *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+Usage:
+    python evaluation.py --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+    python evaluation.py --file positions.fen --batch-size 4096 > labels.jsonl
+
+**  Scores are in centipawns. Engine.score is from white's point of view; evaluate() and
+    evaluate_batch() (by default) from the side to move's, as the search wants them. **
+**  NumPy is only needed by planes() and evaluate_batch(), which import it; nothing else here
+    (nor the engine) does. **
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# PIECE_SQUARE_TABLES[piece + 6][8 * x + y]: centipawns of piece on (x, y), for white (so the   #
+# entries of black pieces are negative; the row of index 6, an empty square, is all zeros):     #
+#      rook 500, king 0:             the same on every square                                   #
+#      knight 320, bishop 330,       plus CENTRE_BONUS: 0 on the rim to 15 on the four centre   #
+#      queen 900:                    squares                                                    #
+#      pawn 100:                     plus 5 per rank gained from its starting rank, plus a      #
+#                                    third of CENTRE_BONUS                                      #
+#                                                                                               #
+# planes(positions) (NumPy uint8, N x 12 x 64): planes[n][p][8 * x + y] is 1 if position n has  #
+# piece PLANE_PIECES[p] on (x, y), else 0.                                                      #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+
+import argparse
+import json
+import sys
+
+# Centipawns, by absolute piece code.
+PIECE_VALUES = (0, 500, 320, 330, 900, 0, 100)
+
+# Bonus of a knight, bishop or queen for being near the centre, by cord: 0 on the rim to 15 on the four centre squares.
+CENTRE_BONUS = tuple(tuple(5 * (3 - max(abs(2 * x - 7), abs(2 * y - 7)) // 2) for y in range(8)) for x in range(8))
+
+# Piece code of every plane of planes().
+PLANE_PIECES = (1, 2, 3, 4, 5, 6, -1, -2, -3, -4, -5, -6)
+
+
+# Centipawns of piece on (x, y), for white (see top of file).
+def square_value(piece, x, y) -> int:
+    if piece == 0:
+        return 0
+    kind = abs(piece)
+    value = PIECE_VALUES[kind]
+    if kind in (2, 3, 4):
+        value += CENTRE_BONUS[x][y]
+    elif kind == 6:
+        # Ranks gained from the starting rank (white pawns move towards x = 0), more so in the centre.
+        value += 5 * (6 - x if piece > 0 else x - 1) + CENTRE_BONUS[x][y] // 3
+    return value if piece > 0 else -value
+
+
+PIECE_SQUARE_TABLES = tuple(tuple(square_value(piece, x, y) for x in range(8) for y in range(8)) for piece in range(-6, 7))
+
+
+# The score of a board (8 x 8 list, see engine.py) for white, from scratch.
+def board_score(board) -> int:
+    return sum(PIECE_SQUARE_TABLES[board[x][y] + 6][x * 8 + y] for x in range(8) for y in range(8))
+
+
+def evaluate(engine) -> int:
+    """
+    parameters:
+        (1) engine (Engine): the position
+
+    returns: a static score of the position (see top of file), from the point of view of the side to move
+    """
+
+    return engine.score * engine.turn
+
+
+# A Position (see position.py), an Engine or a FEN, as a Position.
+def to_position(position):
+    from position import Position
+
+    if isinstance(position, str):
+        return Position.from_fen(position)
+    if not isinstance(position, Position):
+        return Position.from_engine(position)
+    return position
+
+
+def planes(positions):
+    """
+    parameters:
+        (1) positions (iterable object): Positions (see position.py), Engines or FENs, in any mix
+
+    returns: the one-hot planes of the positions (see top of file), a NumPy uint8 array of N x 12 x 64
+    """
+
+    import numpy
+
+    codes = numpy.frombuffer(b"".join(to_position(position).squares for position in positions), dtype=numpy.uint8).reshape(-1, 64)
+    plane_codes = numpy.array([piece + 6 for piece in PLANE_PIECES], dtype=numpy.uint8)
+    return (codes[:, None, :] == plane_codes[None, :, None]).astype(numpy.uint8)
+
+
+# The tables as NumPy weights for planes(): 12 x 64, in the order of PLANE_PIECES.
+def plane_weights():
+    import numpy
+
+    return numpy.array([PIECE_SQUARE_TABLES[piece + 6] for piece in PLANE_PIECES], dtype=numpy.int32)
+
+
+def evaluate_batch(positions, weights=None, side_to_move=True):
+    """
+    parameters:
+        (1) positions (list): Positions (see position.py), Engines or FENs, in any mix
+        (2) weights (NumPy array of 12 x 64) [OPTIONAL]: weights of the planes (plane_weights() by default)
+        (3) side_to_move (bool) [OPTIONAL]: scores from the side to move's point of view (else from white's)
+
+    returns: the scores, a NumPy int array of N; the same numbers as evaluate() with the default weights
+    """
+
+    import numpy
+
+    positions = [to_position(position) for position in positions]
+    if len(positions) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+
+    weights = plane_weights() if weights is None else numpy.asarray(weights)
+    scores = numpy.tensordot(planes(positions).astype(weights.dtype), weights, axes=([1, 2], [0, 1]))
+    if side_to_move:
+        scores = scores * numpy.array([position.turn for position in positions], dtype=scores.dtype)
+    return scores
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Static scores of positions.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--fen", help="a position, scored through an Engine")
+    source.add_argument("--file", help="a file of positions, one FEN per line, scored in batches with NumPy")
+    parser.add_argument("--batch-size", type=int, default=4096, help="positions scored at once")
+    parser.add_argument("--white", action="store_true", help="scores from white's point of view (else the side to move's)")
+    args = parser.parse_args(argv)
+
+    if args.fen is not None:
+        from engine import Engine
+
+        engine = Engine.from_fen(args.fen)
+        print(json.dumps({"fen": args.fen, "score": engine.score if args.white else evaluate(engine)}), flush=True)
+        return 0
+
+    # Every line is labelled with its score, batch by batch, in the order of the file.
+    def flush(fens) -> None:
+        for fen, score in zip(fens, evaluate_batch(fens, side_to_move=not args.white)):
+            print(json.dumps({"fen": fen, "score": int(score)}))
+
+    with open(args.file) as file:
+        fens = []
+        for line in file:
+            if line.strip():
+                fens.append(line.strip())
+            if len(fens) == args.batch_size:
+                flush(fens)
+                fens = []
+        flush(fens)
+    sys.stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
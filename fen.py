@@ -0,0 +1,200 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* Forsyth-Edwards Notation (FEN): parsing, formatting and streaming of position files.          *
+*                                                                                               *
+* Engine.from_fen(), Engine.set_fen() and Engine.to_fen() (see engine.py) are built on these.   *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+**  A FEN has six fields: piece placement, side to move, castling rights, en-passant square,
+    halfmove clock and fullmove number. The last two may be missing (as in EPD), and anything
+    after the sixth field is ignored. **
+**  A castling right whose king or rook is not on its home square is dropped, and the en-passant
+    square must be on the 6th rank if white is to move (the 3rd if black is). **
+**  The halfmove clock must be a number from 0 and the fullmove number one from 1, both at most
+    CLOCK_LIMIT, since a packed position keeps each in 2 bytes (see Engine.to_bytes()). **
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# parse_fen() returns (board, turn, castling, en_passant, halfmove_clock, fullmove_number):      #
+#      board (List[List]):  8 x 8 list of piece codes (see engine.py)                           #
+#      turn (int):          1 (white) or -1 (black)                                             #
+#      castling (int):      castling rights bitmask (see engine.py)                             #
+#      en_passant (tuple):  cord of the en-passant square, None if there is none                #
+#      halfmove_clock (int), fullmove_number (int)                                              #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+PIECE_CODES = {"R": 1, "N": 2, "B": 3, "Q": 4, "K": 5, "P": 6,
+               "r": -1, "n": -2, "b": -3, "q": -4, "k": -5, "p": -6}
+PIECE_LETTERS = {code: letter for letter, code in PIECE_CODES.items()}
+
+CASTLING_LETTERS = (("K", 1), ("Q", 2), ("k", 4), ("q", 8))
+
+# (right, cord of the king, cord of the rook, colour): the pieces a castling right needs on their home squares.
+CASTLING_HOMES = ((1, (7, 4), (7, 7), 1), (2, (7, 4), (7, 0), 1), (4, (0, 4), (0, 7), -1), (8, (0, 4), (0, 0), -1))
+
+# Rank of the en-passant square, by the side to move: behind a black pawn that has just moved two squares if white is to move.
+EN_PASSANT_RANKS = {1: "6", -1: "3"}
+
+# Largest halfmove clock or fullmove number parse_fen() accepts.
+CLOCK_LIMIT = 65535
+
+# A row of the placement field -> list of 8 piece codes; filled in as rows are met, since datasets repeat them a lot.
+_row_cache = {}
+
+
+# "e2" -> (6, 4)
+def square_to_cord(square) -> tuple:
+    return (8 - int(square[1]), ord(square[0]) - ord("a"))
+
+
+# (6, 4) -> "e2"
+def cord_to_square(cord) -> str:
+    return "abcdefgh"[cord[1]] + str(8 - cord[0])
+
+
+# castling without the rights whose king or rook is not on its home square of board.
+def castling_on_board(board, castling) -> int:
+    for right, king, rook, color in CASTLING_HOMES:
+        if castling & right and (board[king[0]][king[1]] != 5 * color or board[rook[0]][rook[1]] != color):
+            castling &= ~right
+    return castling
+
+
+# The int of a clock field of fen, which must be written in ASCII digits and lie in [lowest, CLOCK_LIMIT].
+def parse_clock(field, lowest, fen) -> int:
+    if not (field.isascii() and field.isdigit() and lowest <= int(field) <= CLOCK_LIMIT):
+        raise ValueError(f"invalid FEN clock: {fen}")
+    return int(field)
+
+
+def parse_row(row) -> list:
+    codes = _row_cache.get(row)
+    if codes is None:
+        codes = []
+        for char in row:
+            if char.isdigit():
+                codes.extend([0] * int(char))
+            else:
+                codes.append(PIECE_CODES[char])
+        if len(codes) != 8:
+            raise ValueError(f"invalid FEN row: {row}")
+        if len(_row_cache) < 65536:
+            _row_cache[row] = codes
+    return codes
+
+
+def parse_fen(fen) -> tuple:
+    """
+    parameters:
+        (1) fen (str): a position in FEN
+
+    returns: (board, turn, castling, en_passant, halfmove_clock, fullmove_number) (see top of file);
+             raises ValueError if fen is not a valid FEN
+    """
+
+    fields = fen.split()
+    if len(fields) < 2:
+        raise ValueError(f"invalid FEN: {fen}")
+
+    rows = fields[0].split("/")
+    if len(rows) != 8:
+        raise ValueError(f"invalid FEN: {fen}")
+    try:
+        board = [parse_row(row)[:] for row in rows]
+    except KeyError:
+        raise ValueError(f"invalid FEN: {fen}") from None
+
+    if fields[1] not in ("w", "b"):
+        raise ValueError(f"invalid FEN: {fen}")
+    turn = 1 if fields[1] == "w" else -1
+
+    castling = 0
+    if len(fields) > 2:
+        for letter, bit in CASTLING_LETTERS:
+            if letter in fields[2]:
+                castling |= bit
+        castling = castling_on_board(board, castling)
+
+    en_passant = None
+    if len(fields) > 3 and fields[3] != "-":
+        square = fields[3]
+        if len(square) != 2 or square[0] not in "abcdefgh" or square[1] != EN_PASSANT_RANKS[turn]:
+            raise ValueError(f"invalid FEN en-passant square: {fen}")
+        en_passant = square_to_cord(square)
+
+    halfmove_clock = parse_clock(fields[4], 0, fen) if len(fields) > 4 else 0
+    fullmove_number = parse_clock(fields[5], 1, fen) if len(fields) > 5 else 1
+    return board, turn, castling, en_passant, halfmove_clock, fullmove_number
+
+
+def format_fen(board, turn, castling, en_passant, halfmove_clock, fullmove_number) -> str:
+    """
+    parameters: the fields returned by parse_fen() (see top of file)
+
+    returns: the position in FEN
+    """
+
+    rows = []
+    for row in board:
+        text = ""
+        empty = 0
+        for piece in row:
+            if piece == 0:
+                empty += 1
+            else:
+                if empty > 0:
+                    text += str(empty)
+                    empty = 0
+                text += PIECE_LETTERS[piece]
+        rows.append(text + str(empty) if empty > 0 else text)
+
+    rights = "".join(letter for letter, bit in CASTLING_LETTERS if castling & bit) or "-"
+    square = "-" if en_passant is None else cord_to_square(en_passant)
+    return f"{'/'.join(rows)} {'w' if turn == 1 else 'b'} {rights} {square} {halfmove_clock} {fullmove_number}"
+
+
+def read_fens(source):
+    """
+    parameters:
+        (1) source (str or file object): path of a file with one FEN per line, or the open file (text)
+
+    returns: a generator of the FEN of every line, read lazily; blank lines and lines starting with # are skipped.
+             Anything after the FEN on a line (a ; or , and what follows it) is dropped.
+    """
+
+    if isinstance(source, str):
+        with open(source, "r", buffering=1 << 20) as file:
+            yield from read_fens(file)
+        return
+
+    for line in source:
+        line = line.strip()
+        if not line or line[0] == "#":
+            continue
+        for separator in (";", ","):
+            if separator in line:
+                line = line[:line.index(separator)].rstrip()
+        yield line
+
+
+def stream_positions(source, engine=None, backend="mailbox"):
+    """
+    parameters:
+        (1) source (str or file object): a FEN file (see read_fens())
+        (2) engine (Engine) [OPTIONAL]: the engine to set every position on (a new one by default)
+        (3) backend (str) [OPTIONAL]: the backend of the new engine
+
+    returns: a generator that sets the one engine to the position of every line in turn and yields it;
+             the engine is only valid until the next position is read.
+    """
+
+    from engine import Engine
+
+    if engine is None:
+        engine = Engine(backend=backend)
+    for fen in read_fens(source):
+        engine.set_fen(fen)
+        yield engine
@@ -0,0 +1,199 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* Games and benchmarks without a display: scripted games, games of the search against itself    *
+* and search benchmarks, for scripts, servers and worker processes.                             *
+*                                                                                               *
+* Nothing here, nor in any module it imports, imports pygame: only chess.py (the window) does,  *
+* so a process that runs this pays for the engine alone at start-up.                            *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+Usage:
+    python headless.py moves e2e4 e7e5 g1f3             (plays the moves, prints the position reached)
+    python headless.py play --time 0.5 --max-plies 120  (the search against itself, as PGN)
+    python headless.py bench --depth 3                  (searches every position of perft.py)
+
+**  Moves are given in coordinate notation, as printed by perft.move_name(): "e2e4", "e7e8q". **
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# play_game() returns the game (dict):                                                          #
+#      fen (str):         the starting position                                                 #
+#      moves (list):      SAN of every move played (see pgn.py)                                 #
+#      result (str):      "1-0", "0-1", "1/2-1/2", or "*" if the game was cut at max_plies      #
+#      plies (int), final_fen (str), seconds (float)                                            #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from book import OpeningBook
+from engine import Engine, BACKENDS
+from fen import START_FEN, parse_fen
+from perft import POSITIONS, move_name
+from pgn import move_to_san
+from search import Searcher
+from tablebase import Tablebase
+from ttable import TranspositionTable
+
+
+def parse_move(engine, name) -> tuple:
+    """
+    parameters:
+        (1) engine (Engine): the position the move is played in
+        (2) name (str): the move in coordinate notation, e.g. "e2e4", "e7e8q"
+
+    returns: the move, as (start_cord, end_cord, promotion_piece); raises ValueError if it is not a legal move of the side to move
+    """
+
+    for move in engine.legal_moves():
+        if move_name(move) == name.lower():
+            return move
+    raise ValueError(f"illegal move: {name}")
+
+
+def game_result(engine):
+    """
+    parameters:
+        (1) engine (Engine): the position
+
+    returns: "1-0", "0-1" or "1/2-1/2" if the game is over in the position; None if it goes on
+    """
+
+    return engine.status().result
+
+
+def play_moves(names, fen=START_FEN, backend="mailbox") -> Engine:
+    """
+    parameters:
+        (1) names (list): moves in coordinate notation, played in turn
+        (2) fen (str) [OPTIONAL]: the starting position
+        (3) backend (str) [OPTIONAL]: the Engine backend
+
+    returns: the engine at the position reached; raises ValueError at the first move that is not legal
+    """
+
+    engine = Engine.from_fen(fen, backend)
+    for name in names:
+        engine.apply_legal_move(*parse_move(engine, name))
+    return engine
+
+
+def play_game(fen=START_FEN, max_depth=None, max_nodes=None, max_time=None, max_plies=200, book=None, tablebase=None,
+              backend="mailbox") -> dict:
+    """
+    parameters:
+        (1) fen (str) [OPTIONAL]: the starting position
+        (2) max_depth, max_nodes, max_time [OPTIONAL]: budgets of every move (see Searcher.search())
+        (3) max_plies (int) [OPTIONAL]: the game is cut after this many moves
+        (4) book (OpeningBook), tablebase (Tablebase) [OPTIONAL]: given to the search (see search.py)
+        (5) backend (str) [OPTIONAL]: the Engine backend
+
+    returns: the game (see top of file), the search playing both sides
+    """
+
+    start = time.perf_counter()
+    engine = Engine.from_fen(fen, backend, TranspositionTable())
+    searcher = Searcher(engine, book=book, tablebase=tablebase)
+
+    moves = []
+    result = game_result(engine)
+    while result is None and len(moves) < max_plies:
+        move = searcher.search(max_depth, max_nodes, max_time)["move"]
+        moves.append(move_to_san(engine, move))
+        engine.apply_legal_move(*move)
+        result = game_result(engine)
+
+    return {"fen": fen, "moves": moves, "result": result or "*", "plies": len(moves), "final_fen": engine.to_fen(),
+            "seconds": round(time.perf_counter() - start, 4)}
+
+
+# The game as PGN text (see pgn.py).
+def game_to_pgn(game, headers=None) -> str:
+    tags = {"Event": "?", "White": "search", "Black": "search", "Result": game["result"]}
+    if game["fen"] != START_FEN:
+        tags.update(SetUp="1", FEN=game["fen"])
+    tags.update(headers or {})
+
+    _, turn, _, _, _, number = parse_fen(game["fen"])
+    tokens = [] if turn == 1 else [f"{number}..."]
+    for san in game["moves"]:
+        if turn == 1:
+            tokens.append(f"{number}.")
+        else:
+            number += 1
+        tokens.append(san)
+        turn = -turn
+    tokens.append(game["result"])
+
+    lines = [f'[{tag} "{value}"]' for tag, value in tags.items()]
+    return "\n".join(lines) + "\n\n" + " ".join(tokens) + "\n"
+
+
+def bench(max_depth=3, backend="mailbox") -> dict:
+    """
+    parameters:
+        (1) max_depth (int) [OPTIONAL]: depth searched in every position
+        (2) backend (str) [OPTIONAL]: the Engine backend
+
+    returns: {"positions": {name: {"nodes", "seconds", "nps"}}, "nodes", "seconds", "nps"} over the positions of perft.py
+    """
+
+    positions = {}
+    for name, (fen, _) in POSITIONS.items():
+        report = Searcher(Engine.from_fen(fen, backend), TranspositionTable()).search(max_depth)
+        positions[name] = {"nodes": report["nodes"], "seconds": report["seconds"], "nps": report["nps"]}
+
+    nodes = sum(position["nodes"] for position in positions.values())
+    seconds = sum(position["seconds"] for position in positions.values())
+    return {"positions": positions, "nodes": nodes, "seconds": round(seconds, 4), "nps": round(nodes / seconds) if seconds > 0 else None}
+
+
+def main(argv=None) -> int:
+    # CPU time of the process up to here: interpreter start-up and imports.
+    startup_seconds = time.process_time()
+
+    parser = argparse.ArgumentParser(description="Games and benchmarks without a display.")
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    commands = parser.add_subparsers(dest="command", required=True)
+    moves_parser = commands.add_parser("moves", help="play moves and print the position reached")
+    moves_parser.add_argument("moves", nargs="*", help="moves in coordinate notation")
+    moves_parser.add_argument("--fen", default=START_FEN, help="the starting position")
+    play_parser = commands.add_parser("play", help="a game of the search against itself, as PGN")
+    play_parser.add_argument("--fen", default=START_FEN, help="the starting position")
+    play_parser.add_argument("--depth", type=int, help="deepest iteration of every move")
+    play_parser.add_argument("--nodes", type=int, help="nodes of every move")
+    play_parser.add_argument("--time", type=float, help="seconds of every move")
+    play_parser.add_argument("--max-plies", type=int, default=200, help="the game is cut after this many moves")
+    play_parser.add_argument("--book", help="an opening book (see book.py)")
+    play_parser.add_argument("--tablebase", help="a directory of endgame tables (see tablebase.py)")
+    bench_parser = commands.add_parser("bench", help="search every position of perft.py")
+    bench_parser.add_argument("--depth", type=int, default=3, help="depth searched in every position")
+    args = parser.parse_args(argv)
+
+    if args.command == "moves":
+        try:
+            engine = play_moves(args.moves, args.fen, args.backend)
+        except ValueError as exception:
+            print(json.dumps({"error": str(exception)}), flush=True)
+            return 1
+        print(json.dumps({"fen": engine.to_fen(), "result": game_result(engine),
+                          "legal_moves": [move_name(move) for move in engine.legal_moves()]}), flush=True)
+
+    elif args.command == "play":
+        book = None if args.book is None else OpeningBook(args.book)
+        tablebase = None if args.tablebase is None else Tablebase(args.tablebase)
+        game = play_game(args.fen, args.depth, args.nodes, args.time, args.max_plies, book, tablebase, args.backend)
+        print(game_to_pgn(game), flush=True)
+
+    else:
+        report = bench(args.depth, args.backend)
+        report.update(startup_seconds=round(startup_seconds, 4), pygame_loaded="pygame" in sys.modules)
+        print(json.dumps(report), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
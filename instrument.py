@@ -0,0 +1,170 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* Opt-in instrumentation: calls and time spent in the hot methods of an Engine (in_check, every  *
+* *_cords generator, get_all_legal_moves, apply_legal_move, undo_legal_move, move, ...) and     *
+* nodes of a Searcher.                                                                          *
+*                                                                                               *
+* attach() wraps the methods of one engine or searcher (its instance only, not the class), and  *
+* detach() takes the wrappers off again: an object that is not attached runs the plain methods, *
+* so instrumentation that is off costs nothing.                                                 *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+Usage:
+    python instrument.py --depth 3
+    python instrument.py --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1" --time 2
+
+**  Times include the calls made inside (queen_cords() calls bishop_cords() and rook_cords(),
+    move() calls apply_legal_move() and in_check(), ...), so they do not add up to the total.
+    The search, perft and the other trusted callers make and take back moves with
+    apply_legal_move() and undo_legal_move(); move() and undo_move() count the checked calls. **
+**  An attached engine cannot be pickled; send it to another process with Engine.to_bytes(). **
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# snapshot() returns (dict):                                                                    #
+#      seconds (float):  time since the counters were started (or reset)                        #
+#      counters (dict):  {name: {"calls": int, "seconds": float, "mean_us": float}}, one per    #
+#                        method wrapped; "nodes" counts the nodes of an attached searcher       #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+
+import argparse
+import functools
+import json
+import sys
+import time
+
+from engine import Engine, BACKENDS
+
+# Methods of an engine that are counted and timed.
+ENGINE_METHODS = ("in_check", "is_square_attacked", "rook_cords", "knight_cords", "bishop_cords", "queen_cords", "king_cords",
+                  "pawn_cords", "get_all_legal_moves", "generate_legal_moves", "legal_moves", "apply_legal_move",
+                  "undo_legal_move", "move", "undo_move", "status")
+
+# Methods of a searcher, by the name of their counter.
+SEARCHER_METHODS = {"count_node": "nodes"}
+
+
+class Instrumentation():
+    def __init__(self, callback=None, interval=1.0) -> None:
+        """
+        parameters:
+            (1) callback (function) [OPTIONAL]: called with snapshot() every interval seconds while wrapped methods run
+            (2) interval (float) [OPTIONAL]: seconds between two calls of callback
+        """
+
+        self.callback = callback
+        self.interval = interval
+
+        # name: [calls, seconds]; the wrappers hold on to these lists, so reset() clears them in place.
+        self.counters = {}
+        self.reset()
+
+    def reset(self) -> None:
+        for counter in self.counters.values():
+            counter[0] = 0
+            counter[1] = 0.0
+        self.start = time.perf_counter()
+        self.next_report = self.start + self.interval
+
+    # function, wrapped so that its calls and time go to the counter of name.
+    def wrap(self, name, function):
+        counter = self.counters.setdefault(name, [0, 0.0])
+        perf_counter = time.perf_counter
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                end = perf_counter()
+                counter[0] += 1
+                counter[1] += end - start
+                if self.callback is not None and end >= self.next_report:
+                    self.next_report = end + self.interval
+                    self.callback(self.snapshot())
+
+        return wrapper
+
+    def attach(self, target):
+        """
+        parameters:
+            (1) target (Engine or Searcher): the object to instrument
+
+        returns: target, with its methods wrapped (see top of file)
+        """
+
+        if isinstance(target, Engine):
+            for name in ENGINE_METHODS:
+                if name not in vars(target):
+                    setattr(target, name, self.wrap(name, getattr(target, name)))
+            # The move generators are also reached through this table, which holds bound methods.
+            target.piece_function_key = {piece: getattr(target, function.__name__) for piece, function in target.piece_function_key.items()}
+        else:
+            for name, counter_name in SEARCHER_METHODS.items():
+                if hasattr(target, name) and name not in vars(target):
+                    setattr(target, name, self.wrap(counter_name, getattr(target, name)))
+            self.attach(target.engine)
+        return target
+
+    def detach(self, target):
+        """
+        parameters:
+            (1) target (Engine or Searcher): an object given to attach()
+
+        returns: target, with its plain methods back
+        """
+
+        names = ENGINE_METHODS if isinstance(target, Engine) else SEARCHER_METHODS
+        for name in names:
+            vars(target).pop(name, None)
+        if isinstance(target, Engine):
+            target.piece_function_key = {piece: getattr(target, function.__name__) for piece, function in target.piece_function_key.items()}
+        else:
+            self.detach(target.engine)
+        return target
+
+    def snapshot(self) -> dict:
+        """
+        parameters: None
+
+        returns: the counters so far (see top of file)
+        """
+
+        counters = {}
+        for name, (calls, seconds) in self.counters.items():
+            counters[name] = {"calls": calls, "seconds": round(seconds, 6), "mean_us": round(1e6 * seconds / calls, 3) if calls > 0 else None}
+        return {"seconds": round(time.perf_counter() - self.start, 6), "counters": counters}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot())
+
+
+def main(argv=None) -> int:
+    from fen import START_FEN
+    from search import Searcher
+    from ttable import TranspositionTable
+
+    parser = argparse.ArgumentParser(description="Search a position with the engine instrumented, and print the counters.")
+    parser.add_argument("--fen", default=START_FEN, help="the position (defaults to the starting position)")
+    parser.add_argument("--depth", type=int, help="deepest iteration")
+    parser.add_argument("--nodes", type=int, help="nodes to search at most")
+    parser.add_argument("--time", type=float, help="seconds to search at most")
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--interval", type=float, help="also print the counters every this many seconds")
+    args = parser.parse_args(argv)
+
+    callback = None if args.interval is None else lambda snapshot: print(json.dumps(snapshot), flush=True)
+    instrumentation = Instrumentation(callback, args.interval or 1.0)
+    searcher = instrumentation.attach(Searcher(Engine.from_fen(args.fen, args.backend), TranspositionTable()))
+    report = searcher.search(args.depth, args.nodes, args.time)
+
+    snapshot = instrumentation.snapshot()
+    snapshot.update(nodes=report["nodes"], depth=report["depth"])
+    print(json.dumps(snapshot), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
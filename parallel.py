@@ -0,0 +1,163 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* A parallel search (see search.py) over a pool of processes, by root-move splitting:           *
+*    the legal moves of the root are dealt out to the workers, every worker searches its own    *
+*    moves with iterative deepening, and the best move of the deepest iteration that every      *
+*    worker finished wins.                                                                      *
+*                                                                                               *
+* A position goes to a worker packed by Engine.to_bytes() and moves as ints packed by           *
+* ttable.pack_move(), never as a pickled Engine.                                                *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+Usage:
+    python parallel.py --workers 8 --depth 4
+    python parallel.py --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1" --time 5
+
+**  Every worker has its own transposition table; nothing is shared between them but the
+    budgets. The node budget is split evenly between the workers. **
+
+The command line runs the single-process search and then the parallel one on the same position and
+budget, and prints both reports and the speedup as one JSON object.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import Engine, BACKENDS
+from search import Searcher, MATE, MAX_PLY
+from ttable import TranspositionTable, pack_move, unpack_move
+
+
+# Runs in a worker process: searches the root moves given of the packed position.
+def search_root_moves(data, packed_moves, max_depth, max_nodes, max_time, backend, table_bytes) -> dict:
+    engine = Engine.from_bytes(data, backend)
+    report = Searcher(engine, TranspositionTable(table_bytes)).search(max_depth, max_nodes, max_time,
+                                                                      [unpack_move(move) for move in packed_moves])
+    report["pid"] = os.getpid()
+    return report
+
+
+class ParallelSearcher():
+    def __init__(self, workers=None, backend="mailbox", table_bytes=16 * 1024 * 1024) -> None:
+        """
+        parameters:
+            (1) workers (int) [OPTIONAL]: number of worker processes (the number of cores by default)
+            (2) backend (str) [OPTIONAL]: the Engine backend of the workers
+            (3) table_bytes (int) [OPTIONAL]: byte budget of the transposition table of every worker
+        """
+
+        self.workers = workers or os.cpu_count() or 1
+        self.backend = backend
+        self.table_bytes = table_bytes
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def search(self, engine, max_depth=None, max_nodes=None, max_time=None) -> dict:
+        """
+        parameters:
+            (1) engine (Engine): the root position; it is not changed
+            (2) max_depth, max_nodes, max_time [OPTIONAL]: budgets (see Searcher.search()); max_nodes is for all workers together
+
+        returns: the report of Searcher.search(), with the nodes of all workers,
+                 plus workers (int): the number of workers that searched a move
+        """
+
+        start = time.perf_counter()
+        moves = Searcher(engine).order_root_moves(engine.legal_moves())
+
+        # Dealt out in turn, so that every worker gets some of the likely best moves.
+        shares = [moves[i::self.workers] for i in range(self.workers)]
+        shares = [share for share in shares if len(share) > 0]
+        if len(shares) == 0:
+            return Searcher(engine).search(max_depth, max_nodes, max_time)
+
+        data = engine.to_bytes()
+        worker_nodes = None if max_nodes is None else max(1, max_nodes // len(shares))
+        futures = [self.pool.submit(search_root_moves, data, [pack_move(move) for move in share], max_depth, worker_nodes,
+                                    max_time, self.backend, self.table_bytes) for share in shares]
+        reports = [future.result() for future in futures]
+
+        # The deepest iteration every worker finished; a worker that found a mate has nothing deeper to search.
+        unfinished = [report["depth"] for report in reports if report["score"] is None or abs(report["score"]) <= MATE - MAX_PLY]
+        depth = min(unfinished) if len(unfinished) > 0 else max(report["depth"] for report in reports)
+
+        best = None
+        for report in reports:
+            iterations = [iteration for iteration in report["iterations"] if iteration["depth"] == depth] or report["iterations"][-1:]
+            if len(iterations) > 0 and (best is None or iterations[0]["score"] > best["score"]):
+                best = iterations[0]
+
+        seconds = time.perf_counter() - start
+        nodes = sum(report["nodes"] for report in reports)
+        result = {"move": moves[0], "score": None, "depth": 0, "pv": [], "nodes": nodes, "seconds": round(seconds, 4),
+                  "nps": round(nodes / seconds) if seconds > 0 else None, "iterations": [], "workers": len(shares)}
+        if best is not None:
+            result.update(move=best["pv"][0] if best["pv"] else moves[0], score=best["score"], depth=depth, pv=best["pv"])
+
+        # Time to depth: a depth is reached once the slowest worker has finished it.
+        for iteration_depth in range(1, depth + 1):
+            done = [iteration for report in reports for iteration in report["iterations"] if iteration["depth"] == iteration_depth]
+            if len(done) == len(reports):
+                result["iterations"].append({"depth": iteration_depth, "score": max(iteration["score"] for iteration in done),
+                                             "nodes": sum(iteration["nodes"] for iteration in done),
+                                             "seconds": max(iteration["seconds"] for iteration in done),
+                                             "pv": max(done, key=lambda iteration: iteration["score"])["pv"]})
+        return result
+
+
+def compare(engine, workers=None, max_depth=None, max_nodes=None, max_time=None, backend="mailbox") -> dict:
+    """
+    parameters:
+        (1) engine (Engine): the root position
+        (2) workers (int) [OPTIONAL]: number of worker processes (the number of cores by default)
+        (3) max_depth, max_nodes, max_time [OPTIONAL]: budgets (see Searcher.search())
+        (4) backend (str) [OPTIONAL]: the Engine backend of the workers
+
+    returns: {"serial": report, "parallel": report, "speedup": serial seconds / parallel seconds}
+    """
+
+    serial = Searcher(engine, TranspositionTable()).search(max_depth, max_nodes, max_time)
+    with ParallelSearcher(workers, backend) as searcher:
+        parallel = searcher.search(engine, max_depth, max_nodes, max_time)
+
+    return {"serial": serial, "parallel": parallel,
+            "speedup": round(serial["seconds"] / parallel["seconds"], 2) if parallel["seconds"] > 0 else None}
+
+
+def main(argv=None) -> int:
+    from fen import START_FEN
+    from perft import move_name
+
+    parser = argparse.ArgumentParser(description="Parallel best move search, against the single-process one.")
+    parser.add_argument("--fen", default=START_FEN, help="root position (defaults to the starting position)")
+    parser.add_argument("--workers", type=int, help="worker processes (defaults to the number of cores)")
+    parser.add_argument("--depth", type=int, help="deepest iteration")
+    parser.add_argument("--nodes", type=int, help="nodes to search at most")
+    parser.add_argument("--time", type=float, help="seconds to search at most")
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    args = parser.parse_args(argv)
+
+    result = compare(Engine.from_fen(args.fen, args.backend), args.workers, args.depth, args.nodes, args.time, args.backend)
+    for report in (result["serial"], result["parallel"]):
+        report["move"] = None if report["move"] is None else move_name(report["move"])
+        report["pv"] = [move_name(move) for move in report["pv"]]
+        for iteration in report["iterations"]:
+            iteration["pv"] = [move_name(move) for move in iteration["pv"]]
+    print(json.dumps(result), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
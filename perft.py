@@ -0,0 +1,189 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* Perft: counts the leaf nodes of the legal move tree to a fixed depth and times it.            *
+*                                                                                               *
+* The node counts of the catalogue below are the published ones, so any difference is a bug    *
+* in the move generator (or in move / undo_move).                                               *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+Usage:
+    python perft.py                                   (the whole catalogue)
+    python perft.py --position kiwipete --depth 3
+    python perft.py --fen "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1" --depth 4 --divide
+    python perft.py --backend bitboard
+    python perft.py --file positions.fen --depth 3    (every FEN of a file, one per line)
+    python perft.py --invalid                         (only the malformed FENs below)
+
+Every result is printed as one JSON object per line:
+    {"name": ..., "fen": ..., "backend": ..., "depth": ..., "nodes": ..., "expected": ..., "ok": ...,
+     "seconds": ..., "nps": ..., "divide": {...}}
+The whole catalogue also checks that every FEN of INVALID_FENS is refused with a ValueError:
+    {"name": "invalid", "fen": ..., "error": ..., "ok": ...}
+The exit status is 1 if any count differs from the expected one, or any malformed FEN is accepted.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from engine import Engine, BACKENDS
+from fen import START_FEN, cord_to_square, read_fens
+
+
+# name: (fen, {depth: nodes}).
+POSITIONS = {
+    "start": (START_FEN, {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    # Castling both ways for both sides, pins, en-passant and promotions.
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    # Rook endgame: en-passant captures that would expose the king along the rank.
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    # Promotions (with capture), checks and castling rights for one side only.
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    "position4-mirrored": ("r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1", {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    # Castling rights with no rooks on the board: they are dropped, so the kings only step.
+    "kings-only": ("4k3/8/8/8/8/8/8/4K3 w KQkq - 0 1", {1: 5, 2: 25, 3: 170}),
+}
+
+# FENs that parse_fen() must refuse (with a ValueError), above all for their en-passant field and clocks.
+INVALID_FENS = (
+    "8/8/8/8/8/8/8/8 w - i3 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w - e9 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w - e3 0 1",
+    "4k3/8/8/8/8/8/8/4K3 b - e6 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w - e66 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w - 6e 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w - E6 0 1",
+    "4k3/8/8/8/8/8/8/4K3 x - - 0 1",
+    "4k3/8/8/8/8/8/4K3 w - - 0 1",
+    "4k3/8/8/8/8/8/8/4K2X w - - 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w - - x 1",
+    "4k3/8/8/8/8/8/8/4K3 w - - -1 1",
+    "4k3/8/8/8/8/8/8/4K3 w - - 0 0",
+    "4k3/8/8/8/8/8/8/4K3 w - - 0 70000",
+    "4k3/8/8/8/8/8/8/4K3 w - - 65536 1",
+)
+
+PROMOTION_LETTERS = {1: "r", 2: "n", 3: "b", 4: "q"}
+
+
+# ((6, 4), (4, 4), None) -> "e2e4"; ((1, 0), (0, 0), 4) -> "a7a8q"
+def move_name(move) -> str:
+    start_cord, end_cord, promotion_piece = move
+    name = cord_to_square(start_cord) + cord_to_square(end_cord)
+    return name if promotion_piece is None else name + PROMOTION_LETTERS[abs(promotion_piece)]
+
+
+def divide(engine, depth) -> dict:
+    """
+    parameters:
+        (1) engine (Engine): the root position
+        (2) depth (int): depth of the count, including the root move (at least 1)
+
+    returns: {root move in coordinate notation (e.g. "e2e4", "a7a8q"): leaf nodes below it}
+    """
+
+    counts = {}
+    for start_cord, end_cord, promotion_piece in engine.generate_legal_moves(engine.turn):
+        engine.apply_legal_move(start_cord, end_cord, promotion_piece)
+        counts[move_name((start_cord, end_cord, promotion_piece))] = engine.perft(depth - 1)
+        engine.undo_legal_move()
+    return counts
+
+
+def run(fen, depth, backend="mailbox", expected=None, name=None, with_divide=False) -> dict:
+    """
+    parameters:
+        (1) fen (str): the root position
+        (2) depth (int): perft depth
+        (3) backend (str) [OPTIONAL]: the Engine backend
+        (4) expected (int) [OPTIONAL]: the known node count, if any
+        (5) name (str) [OPTIONAL]: catalogue name, copied into the report
+        (6) with_divide (bool) [OPTIONAL]: also report the node count under every root move
+
+    returns: the report (see the top of this file) as a dict
+    """
+
+    engine = Engine.from_fen(fen, backend)
+
+    start = time.perf_counter()
+    if with_divide:
+        counts = divide(engine, depth)
+        nodes = sum(counts.values())
+    else:
+        nodes = engine.perft(depth)
+    seconds = time.perf_counter() - start
+
+    report = {"name": name, "fen": fen, "backend": backend, "depth": depth, "nodes": nodes,
+              "expected": expected, "ok": None if expected is None else nodes == expected,
+              "seconds": round(seconds, 4), "nps": round(nodes / seconds) if seconds > 0 else None}
+    if with_divide:
+        report["divide"] = counts
+    return report
+
+
+def check_invalid(fen) -> dict:
+    """
+    parameters:
+        (1) fen (str): a malformed FEN
+
+    returns: the report of the check (see the top of this file): ok if Engine.from_fen() raised a ValueError
+    """
+
+    try:
+        Engine.from_fen(fen)
+    except ValueError as error:
+        return {"name": "invalid", "fen": fen, "error": str(error), "ok": True}
+    except Exception as error:
+        return {"name": "invalid", "fen": fen, "error": repr(error), "ok": False}
+    return {"name": "invalid", "fen": fen, "error": None, "ok": False}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Perft node counts and move generator throughput.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--fen", help="root position (defaults to the whole catalogue)")
+    source.add_argument("--position", choices=sorted(POSITIONS), help="a position of the catalogue")
+    source.add_argument("--file", help="a file of positions, one FEN per line (read as a stream)")
+    source.add_argument("--invalid", action="store_true", help="only check that the malformed FENs are refused")
+    parser.add_argument("--depth", type=int, help="perft depth (defaults to every catalogued depth up to --max-nodes)")
+    parser.add_argument("--max-nodes", type=int, default=100000, help="skip catalogued depths with more nodes than this")
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--divide", action="store_true", help="report the nodes below every root move")
+    args = parser.parse_args(argv)
+
+    if args.invalid:
+        jobs = []
+    elif args.fen is not None:
+        jobs = [(None, args.fen, args.depth or 1, None)]
+    elif args.file is not None:
+        jobs = ((None, fen, args.depth or 1, None) for fen in read_fens(args.file))
+    else:
+        names = [args.position] if args.position else list(POSITIONS)
+        jobs = []
+        for name in names:
+            fen, known = POSITIONS[name]
+            if args.depth is not None:
+                jobs.append((name, fen, args.depth, known.get(args.depth)))
+            else:
+                jobs.extend((name, fen, depth, nodes) for depth, nodes in known.items() if nodes <= args.max_nodes)
+
+    failed = False
+    for name, fen, depth, expected in jobs:
+        report = run(fen, depth, args.backend, expected, name, args.divide)
+        failed = failed or report["ok"] is False
+        print(json.dumps(report), flush=True)
+
+    if args.invalid or (args.fen is None and args.file is None and args.position is None):
+        for fen in INVALID_FENS:
+            report = check_invalid(fen)
+            failed = failed or not report["ok"]
+            print(json.dumps(report), flush=True)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* Portable Game Notation (PGN): games are read lazily from a file, their moves (in Standard      *
+* Algebraic Notation, SAN) replayed through Engine.apply_legal_move() once parse_san() has      *
+* found them among the legal moves, and the result of every game reported. Large archives       *
+* are validated over a pool of processes.                                                       *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+Usage:
+    python pgn.py games.pgn                         (one JSON result per game, then a summary)
+    python pgn.py games.pgn --workers 8 --summary   (the summary only)
+
+**  The file is read a line at a time and only a bounded number of games is in flight at once,
+    so memory does not grow with the size of the file. **
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# read_games() yields every game as a dict:                                                     #
+#      index (int):     position of the game in the file, from 0                                #
+#      headers (dict):  tag pairs, e.g. {"White": ..., "Black": ..., "FEN": ...}                #
+#      moves (list):    SAN of every move of the main line (comments, NAGs and variations are    #
+#                       dropped)                                                                #
+#      result (str):    "1-0", "0-1", "1/2-1/2" or "*"                                          #
+#                                                                                               #
+# replay_game() returns, for a game:                                                            #
+#      index (int), result (str)                                                                #
+#      plies (int):        number of moves replayed                                             #
+#      fen (str):          the position reached (see fen.py)                                    #
+#      illegal_ply (int):  number (from 1) of the first move that is not legal; None if all are #
+#      error (str):        why it is not legal; None if all are                                 #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+
+from engine import Engine, BACKENDS
+from fen import square_to_cord, cord_to_square
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+SAN_PIECES = {"N": 2, "B": 3, "R": 1, "Q": 4, "K": 5}
+SAN_LETTERS = {2: "N", 3: "B", 1: "R", 4: "Q", 5: "K"}
+
+HEADER_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+
+# Movetext tokens: comments, variation brackets, NAGs, results, move numbers, moves.
+TOKEN_PATTERN = re.compile(r"\{[^}]*\}?|;[^\n]*|\(|\)|\$\d+|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s(){};$]+")
+
+# Piece letter, file and rank of the piece moved (if given), capture, end square, promotion piece.
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+
+def parse_movetext(text) -> tuple:
+    """
+    parameters:
+        (1) text (str): the movetext of a game
+
+    returns: (moves, result): the SAN of every move of the main line, and the result token ("*" if there is none)
+    """
+
+    moves = []
+    result = "*"
+    variation_depth = 0
+
+    for token in TOKEN_PATTERN.findall(text):
+        first = token[0]
+        if first == "(":
+            variation_depth += 1
+        elif first == ")":
+            variation_depth = max(0, variation_depth - 1)
+        elif variation_depth > 0 or first in "{;$":
+            continue
+        elif token in RESULTS:
+            result = token
+        elif first.isdigit() and token[-1] == ".":
+            continue
+        else:
+            moves.append(token)
+    return moves, result
+
+
+def read_games(source):
+    """
+    parameters:
+        (1) source (str or file object): path of a PGN file, or the open file (text)
+
+    returns: a generator of every game of the file (see top of file), read lazily
+    """
+
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8", errors="replace", buffering=1 << 20) as file:
+            yield from read_games(file)
+        return
+
+    index = 0
+    headers = {}
+    movetext = []
+    open_comment = False
+
+    for line in source:
+        stripped = line.strip()
+
+        # A tag pair starts a new game once the last one has moves; tags never appear inside a comment.
+        if not open_comment and stripped.startswith("["):
+            if len(movetext) > 0:
+                moves, result = parse_movetext("".join(movetext))
+                yield {"index": index, "headers": headers, "moves": moves, "result": result}
+                index += 1
+                headers = {}
+                movetext = []
+
+            match = HEADER_PATTERN.match(stripped)
+            if match is not None:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"')
+            continue
+
+        # Escaped lines are not part of the game.
+        if stripped.startswith("%"):
+            continue
+
+        if stripped or len(movetext) > 0:
+            movetext.append(line)
+            open_comment = line.count("{") > line.count("}") or (open_comment and "}" not in line)
+
+    if len(movetext) > 0 or len(headers) > 0:
+        moves, result = parse_movetext("".join(movetext))
+        yield {"index": index, "headers": headers, "moves": moves, "result": result}
+
+
+def parse_san(engine, san) -> tuple:
+    """
+    parameters:
+        (1) engine (Engine): the position the move is played in
+        (2) san (str): the move in SAN, e.g. "e4", "Nbd7", "exd6", "O-O", "e8=Q+"
+
+    returns: the move, as (start_cord, end_cord, promotion_piece); raises ValueError if it is not
+             exactly one legal move of the side to move (with an x if and only if it captures)
+    """
+
+    color = engine.turn
+    board = engine.board
+    text = san.rstrip("+#!?")
+    legal_moves = engine.legal_moves()
+
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        rank = 7 if color == 1 else 0
+        end_cord = (rank, 6 if len(text) == 3 else 2)
+        for move in legal_moves:
+            if move[0] == (rank, 4) and move[1] == end_cord and board[rank][4] == 5 * color:
+                return move
+        raise ValueError(f"illegal move: {san}")
+
+    match = SAN_PATTERN.match(text)
+    if match is None:
+        raise ValueError(f"not a SAN move: {san}")
+
+    letter, start_file, start_rank, capture, end_square, promotion_letter = match.groups()
+    piece = (SAN_PIECES[letter] if letter else 6) * color
+    end_cord = square_to_cord(end_square)
+    promotion_piece = None if promotion_letter is None else SAN_PIECES[promotion_letter] * color
+    start_y = None if start_file is None else ord(start_file) - ord("a")
+    start_x = None if start_rank is None else 8 - int(start_rank)
+    # A pawn without a file stays on its file; a pawn that leaves it captures (en-passant if the square is empty).
+    if piece == 6 * color and start_y is None:
+        start_y = end_cord[1]
+
+    candidates = [move for move in legal_moves
+                  if move[1] == end_cord and move[2] == promotion_piece and board[move[0][0]][move[0][1]] == piece and
+                  (start_y is None or move[0][1] == start_y) and (start_x is None or move[0][0] == start_x) and
+                  (capture is not None) == (board[end_cord[0]][end_cord[1]] != 0 or (piece == 6 * color and move[0][1] != end_cord[1]))]
+
+    if len(candidates) == 0:
+        raise ValueError(f"illegal move: {san}")
+    if len(candidates) > 1:
+        raise ValueError(f"ambiguous move: {san}")
+    return candidates[0]
+
+
+def move_to_san(engine, move) -> str:
+    """
+    parameters:
+        (1) engine (Engine): the position the move is played in
+        (2) move (tuple): a legal move of the side to move, as (start_cord, end_cord, promotion_piece)
+
+    returns: the move in SAN, with + or # if it gives check or mate
+    """
+
+    (x1, y1), (x2, y2), promotion_piece = move
+    board = engine.board
+    piece = board[x1][y1]
+
+    if abs(piece) == 5 and abs(y2 - y1) == 2:
+        san = "O-O" if y2 == 6 else "O-O-O"
+    elif abs(piece) == 6:
+        capture = y1 != y2
+        san = ("abcdefgh"[y1] + "x" if capture else "") + cord_to_square((x2, y2))
+        if promotion_piece is not None:
+            san += "=" + SAN_LETTERS[abs(promotion_piece)]
+    else:
+        # The file of the piece if it tells it apart from the others of its kind that can go there, else the rank, else both.
+        others = [start for start, end, _ in engine.legal_moves() if end == (x2, y2) and start != (x1, y1) and board[start[0]][start[1]] == piece]
+        disambiguation = ""
+        if len(others) > 0:
+            if all(start[1] != y1 for start in others):
+                disambiguation = "abcdefgh"[y1]
+            elif all(start[0] != x1 for start in others):
+                disambiguation = str(8 - x1)
+            else:
+                disambiguation = cord_to_square((x1, y1))
+        san = SAN_LETTERS[abs(piece)] + disambiguation + ("x" if board[x2][y2] != 0 else "") + cord_to_square((x2, y2))
+
+    engine.apply_legal_move(*move)
+    if engine.in_check(engine.turn):
+        san += "#" if len(engine.legal_moves()) == 0 else "+"
+    engine.undo_legal_move()
+    return san
+
+
+def replay_game(game, backend="mailbox") -> dict:
+    """
+    parameters:
+        (1) game (dict): a game read by read_games()
+        (2) backend (str) [OPTIONAL]: the Engine backend to replay it with
+
+    returns: the result of the game (see top of file)
+    """
+
+    illegal_ply = None
+    error = None
+    plies = 0
+
+    try:
+        if "FEN" in game["headers"]:
+            engine = Engine.from_fen(game["headers"]["FEN"], backend)
+        else:
+            engine = Engine(backend=backend)
+    except ValueError as exception:
+        return {"index": game["index"], "result": game["result"], "plies": 0, "fen": None, "illegal_ply": 1, "error": str(exception)}
+
+    for ply, san in enumerate(game["moves"], 1):
+        try:
+            move = parse_san(engine, san)
+        except ValueError as exception:
+            illegal_ply = ply
+            error = str(exception)
+            break
+        engine.apply_legal_move(*move)
+        plies = ply
+
+    return {"index": game["index"], "result": game["result"], "plies": plies, "fen": engine.to_fen(),
+            "illegal_ply": illegal_ply, "error": error}
+
+
+# Runs in a worker process: replays a chunk of games.
+def replay_games(games, backend) -> list:
+    return [replay_game(game, backend) for game in games]
+
+
+def validate_games(source, workers=None, chunk_size=32, backend="mailbox"):
+    """
+    parameters:
+        (1) source (str or file object): a PGN file (see read_games())
+        (2) workers (int) [OPTIONAL]: number of worker processes (the number of cores by default); 1 replays in this process
+        (3) chunk_size (int) [OPTIONAL]: number of games sent to a worker at once
+        (4) backend (str) [OPTIONAL]: the Engine backend to replay with
+
+    returns: a generator of the result of every game (see top of file), in the order of the file.
+             At most two chunks per worker are in flight at once.
+    """
+
+    # Imported only when games are validated, so that the workers, which just replay them, start faster.
+    from concurrent.futures import ProcessPoolExecutor
+
+    games = read_games(source)
+    if workers == 1:
+        for game in games:
+            yield replay_game(game, backend)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = 2 * workers
+        pending = deque()
+        while True:
+            chunk = list(itertools.islice(games, chunk_size))
+            if len(chunk) > 0:
+                pending.append(pool.submit(replay_games, chunk, backend))
+            if len(pending) > 0 and (len(pending) >= in_flight or len(chunk) == 0):
+                yield from pending.popleft().result()
+            if len(chunk) == 0 and len(pending) == 0:
+                return
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replays and validates the games of a PGN file.")
+    parser.add_argument("file", help="the PGN file")
+    parser.add_argument("--workers", type=int, help="worker processes (defaults to the number of cores)")
+    parser.add_argument("--chunk-size", type=int, default=32, help="games sent to a worker at once")
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--summary", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    games = 0
+    illegal = 0
+    plies = 0
+    for result in validate_games(args.file, args.workers, args.chunk_size, args.backend):
+        games += 1
+        plies += result["plies"]
+        illegal += result["illegal_ply"] is not None
+        if not args.summary:
+            print(json.dumps(result))
+
+    seconds = time.perf_counter() - start
+    print(json.dumps({"games": games, "illegal_games": illegal, "plies": plies, "seconds": round(seconds, 4),
+                      "games_per_second": round(games / seconds, 2) if seconds > 0 else None}), flush=True)
+    return 1 if illegal > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* Position: an immutable snapshot of a position, a value that can be hashed, compared, pickled  *
+* and handed to other threads or processes as it is.                                            *
+*                                                                                               *
+* The board is 64 bytes (bytes, one per square); apply() copies them once and changes the few   *
+* squares a move touches, so a move costs the same whatever came before it, and the position it *
+* was applied to is left as it was. Engine.from_position() builds an engine to search from one. *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+Usage:
+    position = Position.from_fen(START_FEN).apply(((6, 4), (4, 4), None))
+    engine = Engine.from_position(position)
+
+**  Cords, piece codes, castling rights and keys are those of engine.py. **
+**  apply() trusts its move: it is meant for moves of legal_moves(), and checks nothing. **
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Fields (read only):                                                                           #
+#      squares (bytes):          piece code + 6 of every square, by square index 8 * x + y      #
+#      turn (int):               1 or -1                                                        #
+#      castling (int):           castling rights bitmask                                        #
+#      en_passant (tuple):       cord a pawn may capture en-passant on (None if there is none)  #
+#      halfmove_clock (int), fullmove_number (int)                                              #
+#      key (int):                Zobrist key, the same as an Engine at the position has         #
+#                                                                                               #
+# Positions are equal when every field is; the hash is taken from the key.                    #
+# to_bytes() is Engine.to_bytes() with no earlier keys, so Engine.from_bytes() reads it too.    #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+
+from engine import (CASTLING_ADD_ONS, CASTLING_MASKS, CASTLING_ROOK_MOVES, PACKED_POSITION, ZOBRIST_BLACK_TO_MOVE,
+                    ZOBRIST_CASTLING, ZOBRIST_EN_PASSANT, ZOBRIST_PIECES, pack_position)
+from fen import format_fen, parse_fen
+
+FIELDS = ("squares", "turn", "castling", "en_passant", "halfmove_clock", "fullmove_number", "key")
+
+
+class Position():
+    __slots__ = FIELDS
+
+    def __init__(self, squares, turn=1, castling=0b1111, en_passant=None, halfmove_clock=0, fullmove_number=1, key=None) -> None:
+        """
+        parameters:
+            (1) squares (bytes-like object of length 64): the board (see top of file)
+            (2) turn, castling, en_passant, halfmove_clock, fullmove_number [OPTIONAL]: the rest of the position
+            (3) key (int) [OPTIONAL]: its Zobrist key, computed if not given
+        """
+
+        squares = bytes(squares)
+        if len(squares) != 64:
+            raise ValueError(f"a board has 64 squares, not {len(squares)}")
+        en_passant = None if en_passant is None else (en_passant[0], en_passant[1])
+        if key is None:
+            key = zobrist_key(squares, turn, castling, en_passant)
+
+        for name, value in zip(FIELDS, (squares, turn, castling, en_passant, halfmove_clock, fullmove_number, key)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError("Position is immutable; apply() returns a new one")
+
+    def __delattr__(self, name) -> None:
+        raise AttributeError("Position is immutable")
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Position):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in FIELDS)
+
+    def __hash__(self) -> int:
+        return self.key
+
+    def __repr__(self) -> str:
+        return f"Position.from_fen({self.to_fen()!r})"
+
+    # Pickled as its fields: __slots__ and a __setattr__ that refuses every write leave pickle no other way.
+    def __reduce__(self):
+        return Position, tuple(getattr(self, name) for name in FIELDS)
+
+    @classmethod
+    def from_fen(cls, fen):
+        """
+        parameters:
+            (1) fen (str): the position in FEN (see fen.py)
+
+        returns: the Position; raises ValueError if fen is not a valid FEN
+        """
+
+        board, turn, castling, en_passant, halfmove_clock, fullmove_number = parse_fen(fen)
+        return cls(bytes(piece + 6 for row in board for piece in row), turn, castling, en_passant, halfmove_clock, fullmove_number)
+
+    @classmethod
+    def from_engine(cls, engine):
+        """
+        parameters:
+            (1) engine (Engine): any engine, of either backend
+
+        returns: the Position of engine now (its move log and history are left out)
+        """
+
+        plies = engine.ply_offset + len(engine.move_log)
+        return cls(bytes(piece + 6 for row in engine.board for piece in row), engine.turn, engine.castling, engine.en_passant,
+                   engine.halfmove_clock, plies // 2 + 1, engine.key)
+
+    @classmethod
+    def from_bytes(cls, data):
+        squares, turn, castling, en_passant, halfmove_clock, fullmove_number, _ = PACKED_POSITION.unpack_from(data)
+        return cls(squares, turn, castling, None if en_passant == 255 else (en_passant // 8, en_passant % 8), halfmove_clock,
+                   fullmove_number)
+
+    def to_bytes(self) -> bytes:
+        en_passant = 255 if self.en_passant is None else self.en_passant[0] * 8 + self.en_passant[1]
+        return pack_position(self.squares, self.turn, self.castling, en_passant, self.halfmove_clock, self.fullmove_number, 0)
+
+    def to_fen(self) -> str:
+        return format_fen(self.board(), self.turn, self.castling, self.en_passant, self.halfmove_clock, self.fullmove_number)
+
+    # The board as the 8 x 8 list of engine.py (a new one on every call).
+    def board(self) -> list:
+        squares = self.squares
+        return [[squares[x * 8 + y] - 6 for y in range(8)] for x in range(8)]
+
+    def piece_at(self, cord) -> int:
+        return self.squares[cord[0] * 8 + cord[1]] - 6
+
+    def apply(self, move):
+        """
+        parameters:
+            (1) move (tuple): (start_cord, end_cord, promotion_piece) of a legal move of the side to move
+
+        returns: the Position after the move; this one is left unchanged
+        """
+
+        start_cord, end_cord, promotion_piece = move
+        start, end = start_cord[0] * 8 + start_cord[1], end_cord[0] * 8 + end_cord[1]
+        squares = bytearray(self.squares)
+        piece, captured = squares[start] - 6, squares[end] - 6
+
+        # (square, piece code) of every square the move changes.
+        changes = [(start, 0), (end, piece)]
+        if piece == 6 or piece == -6:
+            if self.en_passant is not None and end_cord[0] == self.en_passant[0] and end_cord[1] == self.en_passant[1]:
+                changes.append((start_cord[0] * 8 + end_cord[1], 0))
+            elif end_cord[0] == 0 or end_cord[0] == 7:
+                changes[1] = (end, promotion_piece or 4 * self.turn)
+        elif (piece == 5 or piece == -5) and abs(end_cord[1] - start_cord[1]) == 2:
+            rook_start, rook_end = CASTLING_ROOK_MOVES[CASTLING_ADD_ONS[(end_cord[0], end_cord[1])]]
+            changes += [(rook_start[0] * 8 + rook_start[1], 0), (rook_end[0] * 8 + rook_end[1], 1 if piece > 0 else -1)]
+
+        key = self.key ^ ZOBRIST_BLACK_TO_MOVE
+        for square, new_piece in changes:
+            key ^= ZOBRIST_PIECES[squares[square]][square] ^ ZOBRIST_PIECES[new_piece + 6][square]
+            squares[square] = new_piece + 6
+
+        castling = self.castling
+        if castling:
+            castling &= CASTLING_MASKS.get((start_cord[0], start_cord[1]), 0b1111) & CASTLING_MASKS.get((end_cord[0], end_cord[1]), 0b1111)
+            key ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+
+        if self.en_passant is not None:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant[1]]
+        en_passant = None
+        if (piece == 6 or piece == -6) and abs(end_cord[0] - start_cord[0]) == 2:
+            en_passant = ((start_cord[0] + end_cord[0]) // 2, start_cord[1])
+            key ^= ZOBRIST_EN_PASSANT[start_cord[1]]
+
+        halfmove_clock = 0 if captured != 0 or piece == 6 or piece == -6 else self.halfmove_clock + 1
+        fullmove_number = self.fullmove_number + (1 if self.turn == -1 else 0)
+        return Position(squares, -self.turn, castling, en_passant, halfmove_clock, fullmove_number, key)
+
+
+# The Zobrist key of a position (see engine.py), from scratch.
+def zobrist_key(squares, turn, castling, en_passant) -> int:
+    key = 0 if turn == 1 else ZOBRIST_BLACK_TO_MOVE
+    for square, code in enumerate(squares):
+        key ^= ZOBRIST_PIECES[code][square]
+    key ^= ZOBRIST_CASTLING[castling]
+    if en_passant is not None:
+        key ^= ZOBRIST_EN_PASSANT[en_passant[1]]
+    return key
@@ -0,0 +1,361 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* A best-move search on top of Engine.apply_legal_move() / Engine.undo_legal_move():            *
+*    negamax alpha-beta with iterative deepening and a quiescence search of captures,           *
+*    moves ordered by: best move of the transposition table, captures by MVV-LVA, killer        *
+*    moves, history scores.                                                                     *
+*                                                                                               *
+* The search stops at the first of its budgets: depth, nodes or seconds; the result is the one  *
+* of the last depth searched to the end. A move found in the opening book (if one is given) is  *
+* played without searching, and so is the move of the endgame tables (if given) in a position  *
+* they hold; deeper in the tree, such a position is scored by the tables.                       *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+Usage:
+    python search.py --depth 4
+    python search.py --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1" --time 5
+
+**  Scores are in centipawns, from the point of view of the side to move. A mate in n plies
+    scores MATE - n (or -(MATE - n) if the side to move is the one mated). **
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Searcher.search() returns the report (dict):                                                  #
+#      move (tuple):     best move, (start_cord, end_cord, promotion_piece); None if none        #
+#      score (int):      its score                                                              #
+#      depth (int):      depth of the last iteration searched to the end                        #
+#      pv (list):        principal variation, the moves expected from both sides                #
+#      nodes (int):      nodes searched (quiescence nodes included)                             #
+#      seconds (float), nps (int): time taken and nodes per second                              #
+#      iterations (list): {depth, score, nodes, seconds, pv} of every iteration (time to depth) #
+#      book (bool):      True if the move comes from the opening book (nothing is searched)     #
+#      tablebase (bool): True if the move comes from the endgame tables (nothing is searched)   #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from book import OpeningBook
+from engine import Engine, BACKENDS
+from evaluation import PIECE_VALUES, evaluate
+from tablebase import Tablebase, WIN, LOSS
+from ttable import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+
+MATE = 100000
+INFINITY = 1000000
+
+# Plies a search can reach, quiescence included.
+MAX_PLY = 128
+
+# Depth searched when no budget is given.
+DEFAULT_DEPTH = 4
+
+# Nodes between two looks at the clock.
+CLOCK_INTERVAL = 1024
+
+
+# Raised inside the search when a budget runs out; the search unwinds to the root.
+class SearchAborted(Exception):
+    pass
+
+
+class Searcher():
+    # book: an OpeningBook (see book.py) looked at before searching, if given.
+    # tablebase: a Tablebase (see tablebase.py) of endgames, looked at before searching and at every node, if given.
+    def __init__(self, engine, table=None, book=None, tablebase=None) -> None:
+        self.engine = engine
+        self.book = book
+        self.tablebase = tablebase
+
+        # Search results are kept in the engine's table when it has one, so that they share its entries.
+        self.table = table or engine.table or TranspositionTable()
+
+    # Counts a node and raises SearchAborted once a budget has run out.
+    def count_node(self) -> None:
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchAborted()
+        if self.deadline is not None and self.nodes % CLOCK_INTERVAL == 0 and time.perf_counter() > self.deadline:
+            raise SearchAborted()
+
+    # True if move takes a piece (en-passant included).
+    def is_capture(self, move) -> bool:
+        (x1, y1), (x2, y2), _ = move
+        board = self.engine.board
+        return board[x2][y2] != 0 or (board[x1][y1] in (6, -6) and (x2, y2) == self.engine.en_passant)
+
+    # MVV-LVA: the most valuable victim first, then the least valuable attacker.
+    def capture_score(self, move) -> int:
+        (x1, y1), (x2, y2), promotion_piece = move
+        board = self.engine.board
+        victim = PIECE_VALUES[abs(board[x2][y2])] if board[x2][y2] != 0 else PIECE_VALUES[6]
+        score = 10 * victim - PIECE_VALUES[abs(board[x1][y1])]
+        if promotion_piece is not None:
+            score += PIECE_VALUES[abs(promotion_piece)]
+        return score
+
+    # The moves sorted best first (see the top of file).
+    def order_moves(self, moves, table_move, ply) -> list:
+        board = self.engine.board
+        killers = self.killers[ply]
+
+        def key(move):
+            if move == table_move:
+                return 4 * INFINITY
+            if self.is_capture(move) or move[2] is not None:
+                return 2 * INFINITY + self.capture_score(move)
+            if move in killers:
+                return INFINITY + (1 if move == killers[0] else 0)
+            (x1, y1), end_cord, _ = move
+            return self.history.get((board[x1][y1], end_cord), 0)
+
+        return sorted(moves, key=key, reverse=True)
+
+    # Root moves with no search behind them yet: captures and promotions first, by MVV-LVA.
+    def order_root_moves(self, moves) -> list:
+        return sorted(moves, key=lambda move: self.capture_score(move) if self.is_capture(move) or move[2] is not None else -INFINITY, 
+                      reverse=True)
+
+    # A quiet move that caused a cut-off becomes a killer of the ply, and gains history in proportion to depth.
+    def record_cutoff(self, move, depth, ply) -> None:
+        killers = self.killers[ply]
+        if move != killers[0]:
+            killers[1] = killers[0]
+            killers[0] = move
+
+        (x1, y1), end_cord, _ = move
+        piece = self.engine.board[x1][y1]
+        self.history[(piece, end_cord)] = self.history.get((piece, end_cord), 0) + depth * depth
+
+    # Mate scores are stored relative to the node (not the root), so that they stay right at any ply.
+    def score_to_table(self, score, ply) -> int:
+        if score > MATE - MAX_PLY:
+            return score + ply
+        if score < -MATE + MAX_PLY:
+            return score - ply
+        return score
+
+    def score_from_table(self, score, ply) -> int:
+        if score > MATE - MAX_PLY:
+            return score - ply
+        if score < -MATE + MAX_PLY:
+            return score + ply
+        return score
+
+    def negamax(self, depth, alpha, beta, ply) -> int:
+        self.count_node()
+        engine = self.engine
+        self.pv[ply] = []
+
+        # Repeating a position, or reaching the 50-move rule, is a draw.
+        if ply > 0 and (engine.halfmove_clock >= 100 or engine.repetition_count() >= 2):
+            return 0
+
+        # A position of the endgame tables is known exactly.
+        if ply > 0 and self.tablebase is not None:
+            value = self.tablebase.probe(engine)
+            if value is not None:
+                result, plies = value
+                if result == WIN:
+                    return MATE - ply - plies
+                if result == LOSS:
+                    return -(MATE - ply - plies)
+                return 0
+
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self.quiescence(alpha, beta, ply)
+
+        alpha_original = alpha
+        table_move = None
+        stored = self.table.get_search(engine.key)
+        if stored is not None:
+            stored_depth, stored_score, bound, table_move = stored
+            if ply > 0 and stored_depth >= depth:
+                score = self.score_from_table(stored_score, ply)
+                if bound == EXACT:
+                    return score
+                elif bound == LOWER_BOUND:
+                    alpha = max(alpha, score)
+                elif bound == UPPER_BOUND:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+
+        moves = engine.legal_moves() if ply > 0 or self.root_moves is None else self.root_moves
+        if len(moves) == 0:
+            return -MATE + ply if engine.in_check(engine.turn) else 0
+
+        best_score = -INFINITY
+        best_move = None
+        for move in self.order_moves(moves, table_move, ply):
+            quiet = not self.is_capture(move) and move[2] is None
+
+            engine.apply_legal_move(*move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            engine.undo_legal_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                self.pv[ply] = [move] + self.pv[ply + 1]
+                if alpha >= beta:
+                    if quiet:
+                        self.record_cutoff(move, depth, ply)
+                    break
+
+        if best_score <= alpha_original:
+            bound = UPPER_BOUND
+        elif best_score >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.table.store_search(engine.key, depth, self.score_to_table(best_score, ply), bound, best_move)
+        return best_score
+
+    # Only captures (and promotions) are searched, until the position is quiet; the side to move may also
+    # stand pat on the static score, unless it is in check: then every evasion is searched, and having none is mate.
+    def quiescence(self, alpha, beta, ply) -> int:
+        self.count_node()
+        engine = self.engine
+        self.pv[ply] = []
+
+        if ply >= MAX_PLY - 1:
+            return evaluate(engine)
+
+        if engine.in_check(engine.turn):
+            moves = engine.legal_moves()
+            if len(moves) == 0:
+                return -MATE + ply
+            moves = self.order_root_moves(moves)
+        else:
+            stand_pat = evaluate(engine)
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+
+            moves = [move for move in engine.legal_moves()
+                     if self.is_capture(move) or (move[2] is not None and abs(move[2]) == 4)]
+            moves.sort(key=self.capture_score, reverse=True)
+
+        for move in moves:
+            engine.apply_legal_move(*move)
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            engine.undo_legal_move()
+
+            if score > alpha:
+                alpha = score
+                self.pv[ply] = [move] + self.pv[ply + 1]
+                if alpha >= beta:
+                    break
+        return alpha
+
+    def search(self, max_depth=None, max_nodes=None, max_time=None, root_moves=None) -> dict:
+        """
+        parameters:
+            (1) max_depth (int) [OPTIONAL]: deepest iteration
+            (2) max_nodes (int) [OPTIONAL]: nodes to search at most
+            (3) max_time (float) [OPTIONAL]: seconds to search at most
+            With no budget at all, the search goes to DEFAULT_DEPTH.
+            (4) root_moves (list) [OPTIONAL]: only search these legal moves at the root (all of them by default)
+
+        returns: the report (see top of file); the engine is left at the position it was given in.
+        """
+
+        engine = self.engine
+        if max_depth is None:
+            max_depth = DEFAULT_DEPTH if max_nodes is None and max_time is None else MAX_PLY - 1
+
+        start = time.perf_counter()
+        self.nodes = 0
+        self.max_nodes = max_nodes
+        self.deadline = None if max_time is None else start + max_time
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {}
+        self.pv = [[] for _ in range(MAX_PLY + 1)]
+        self.table.new_search()
+
+        root_plies = len(engine.move_log)
+        self.root_moves = None if root_moves is None else list(root_moves)
+        moves = engine.legal_moves() if root_moves is None else self.root_moves
+        report = {"move": moves[0] if len(moves) > 0 else None, "score": None, "depth": 0, "pv": [],
+                  "nodes": 0, "seconds": 0.0, "nps": None, "iterations": [], "book": False,
+                  "tablebase": False}
+
+        # A book move, or a move of the endgame tables, needs no search.
+        book_move = None if self.book is None or root_moves is not None else self.book.choose(engine)
+        value = None if self.tablebase is None or root_moves is not None else self.tablebase.probe(engine)
+        if book_move is not None:
+            report.update(move=book_move, pv=[book_move], book=True)
+        elif value is not None and len(moves) > 0:
+            result, plies = value
+            table_move = self.tablebase.best_move(engine)
+            report.update(move=table_move, pv=[table_move], tablebase=True,
+                          score=MATE - plies if result == WIN else -(MATE - plies) if result == LOSS else 0)
+        elif len(moves) > 0:
+            for depth in range(1, max_depth + 1):
+                try:
+                    score = self.negamax(depth, -INFINITY, INFINITY, 0)
+                except SearchAborted:
+                    # Back to the root position.
+                    while len(engine.move_log) > root_plies:
+                        engine.undo_move()
+                    break
+
+                seconds = time.perf_counter() - start
+                report.update(move=self.pv[0][0] if self.pv[0] else report["move"], score=score, depth=depth, pv=list(self.pv[0]))
+                report["iterations"].append({"depth": depth, "score": score, "nodes": self.nodes,
+                                             "seconds": round(seconds, 4), "pv": list(self.pv[0])})
+
+                # No deeper search can find a faster mate.
+                if abs(score) > MATE - MAX_PLY:
+                    break
+
+        seconds = time.perf_counter() - start
+        report.update(nodes=self.nodes, seconds=round(seconds, 4), nps=round(self.nodes / seconds) if seconds > 0 else None)
+        return report
+
+
+def best_move(engine, max_depth=None, max_nodes=None, max_time=None):
+    """
+    parameters:
+        (1) engine (Engine): the position, with the side to move to play
+        (2) max_depth, max_nodes, max_time [OPTIONAL]: budgets (see Searcher.search())
+
+    returns: the best move found, as (start_cord, end_cord, promotion_piece); None if there is no legal move
+    """
+
+    return Searcher(engine).search(max_depth, max_nodes, max_time)["move"]
+
+
+def main(argv=None) -> int:
+    from fen import START_FEN
+    from perft import move_name
+
+    parser = argparse.ArgumentParser(description="Best move search and its throughput.")
+    parser.add_argument("--fen", default=START_FEN, help="root position (defaults to the starting position)")
+    parser.add_argument("--depth", type=int, help="deepest iteration")
+    parser.add_argument("--nodes", type=int, help="nodes to search at most")
+    parser.add_argument("--time", type=float, help="seconds to search at most")
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--book", help="an opening book to look at first (see book.py)")
+    parser.add_argument("--tablebase", help="a directory of endgame tables (see tablebase.py)")
+    args = parser.parse_args(argv)
+
+    book = None if args.book is None else OpeningBook(args.book)
+    tablebase = None if args.tablebase is None else Tablebase(args.tablebase)
+    report = Searcher(Engine.from_fen(args.fen, args.backend), book=book, tablebase=tablebase).search(args.depth, args.nodes, args.time)
+    report["move"] = None if report["move"] is None else move_name(report["move"])
+    report["pv"] = [move_name(move) for move in report["pv"]]
+    for iteration in report["iterations"]:
+        iteration["pv"] = [move_name(move) for move in iteration["pv"]]
+    print(json.dumps(report), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
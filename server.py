@@ -0,0 +1,480 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* A game server on asyncio: many games at once over one local TCP socket, moves checked by       *
+* Engine, status pushed to every connection watching a game, and engine moves searched in a     *
+* pool of processes so that the event loop never blocks on a search.                            *
+*                                                                                               *
+* Also a load-test client: N players that each play a game against the server's engine.         *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+Usage:
+    python server.py serve --port 8765 --workers 4
+    python server.py load --port 8765 --players 200 --plies 20
+
+**  Messages are JSON objects, one per line, both ways. A request may carry an "id", which its
+    reply carries back; pushed messages have an "event" instead. **
+**  Every field of a request is checked before it is used (see check_request()), so a bad request
+    only ever gets a reply with "ok": false, as does a move or engine request once the game is over. **
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Requests ("op"), and what their reply holds besides "id" and "ok" (false with an "error"):    #
+#      new      {fen [OPTIONAL]}:                  game (int), status                           #
+#      move     {game, move (e.g. "e2e4")}:        status                                       #
+#      engine   {game, depth / nodes / time}:      move, score, status (the engine plays)       #
+#      status   {game}:                            status                                       #
+#      watch    {game}:                            status; then every status of the game is    #
+#                                                  pushed as {"event": "status", "game", ...}   #
+#      close    {game}:                            nothing more                                 #
+#      metrics  {game [OPTIONAL]}:                 metrics of the server, or of one game        #
+#                                                                                               #
+# status (dict): fen, turn (1 or -1), in_check, result (None while the game goes on),           #
+#                legal_moves (list of moves in coordinate notation), last_move                  #
+#                                                                                               #
+# metrics: latency of every op in milliseconds, from the request read to the reply written:     #
+#          {op: {count, mean_ms, max_ms, p50_ms, p95_ms, p99_ms}}, over the latest requests     #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import deque
+
+from engine import Engine, BACKENDS
+from fen import START_FEN
+from headless import parse_move
+from perft import move_name
+from search import Searcher
+from ttable import TranspositionTable, pack_move, unpack_move
+
+# Latencies kept per op for the percentiles.
+LATENCY_WINDOW = 1024
+
+# Budget of an engine move when the request gives none.
+DEFAULT_ENGINE_NODES = 2000
+
+# Fields a request may carry, and their types; OPS gives the ones every op needs (depth, nodes and time: see check_budget()).
+FIELD_TYPES = {"game": int, "move": str, "fen": str}
+OPS = {"new": (), "metrics": (), "status": ("game",), "watch": ("game",), "close": ("game",), "move": ("game", "move"),
+       "engine": ("game",)}
+
+
+# A request line as JSON; raises ValueError if it is not (nor too deeply nested to read).
+def read_request(line):
+    try:
+        return json.loads(line)
+    except RecursionError:
+        raise ValueError("request nested too deeply") from None
+
+
+# Reads a line of reader: (line, too_long), line empty at the end of the stream. A line longer than the limit of
+# the stream is read to its end and dropped, and too_long is True.
+async def read_line(reader) -> tuple:
+    too_long = False
+    while True:
+        try:
+            return await reader.readuntil(b"\n"), too_long
+        except asyncio.IncompleteReadError as error:
+            return error.partial, too_long
+        except asyncio.LimitOverrunError as error:
+            await reader.readexactly(error.consumed)
+            too_long = True
+
+
+# Raises ValueError unless request is a JSON object with a known op, the fields of that op, and fields of the right types.
+def check_request(request) -> None:
+    if not isinstance(request, dict):
+        raise ValueError("a request is a JSON object")
+    op = request.get("op")
+    if not isinstance(op, str) or op not in OPS:
+        raise ValueError(f"unknown op: {op}")
+    for name in OPS[op]:
+        if request.get(name) is None:
+            raise ValueError(f"{op} needs {name}")
+    for name, kind in FIELD_TYPES.items():
+        value = request.get(name)
+        # bool is an int to isinstance(), but not a game id.
+        if value is not None and (not isinstance(value, kind) or isinstance(value, bool)):
+            raise ValueError(f"{name} must be of type {kind.__name__}")
+
+
+# (max_depth, max_nodes, max_time) of an engine request; raises ValueError if one is not a positive number.
+def check_budget(request) -> tuple:
+    budget = []
+    for name, kinds in (("depth", int), ("nodes", int), ("time", (int, float))):
+        value = request.get(name)
+        if value is not None and (not isinstance(value, kinds) or isinstance(value, bool) or not 0 < value < math.inf):
+            raise ValueError(f"{name} must be a positive number")
+        budget.append(value)
+    if budget == [None, None, None]:
+        budget[1] = DEFAULT_ENGINE_NODES
+    return tuple(budget)
+
+
+# Raises ValueError unless the position of engine can be played from: one king of each colour, no pawn on
+# the first or last rank, and the side that has just moved not in check.
+def check_position(engine) -> None:
+    kings = {color: sum(row.count(5 * color) for row in engine.board) for color in (1, -1)}
+    if kings[1] != 1 or kings[-1] != 1:
+        raise ValueError("a position needs one king of each colour")
+    if any(abs(piece) == 6 for piece in engine.board[0] + engine.board[7]):
+        raise ValueError("a pawn cannot stand on the first or last rank")
+    if engine.in_check(-engine.turn):
+        raise ValueError("the side that has just moved is in check")
+
+
+# Runs in a worker process: the best move of the packed position (see Engine.to_bytes()), packed by ttable.pack_move().
+def search_position(data, max_depth, max_nodes, max_time, backend) -> tuple:
+    engine = Engine.from_bytes(data, backend)
+    report = Searcher(engine, TranspositionTable(1024 * 1024)).search(max_depth, max_nodes, max_time)
+    return None if report["move"] is None else pack_move(report["move"]), report["score"], report["nodes"]
+
+
+class LatencyStats():
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=LATENCY_WINDOW)
+
+    def add(self, seconds) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def report(self) -> dict:
+        recent = sorted(self.recent)
+
+        def percentile(p):
+            return round(1000 * recent[min(len(recent) - 1, int(p * len(recent)))], 3) if recent else None
+
+        return {"count": self.count, "mean_ms": round(1000 * self.total / self.count, 3) if self.count else None,
+                "max_ms": round(1000 * self.max, 3), "p50_ms": percentile(0.5), "p95_ms": percentile(0.95), "p99_ms": percentile(0.99)}
+
+
+class ServerGame():
+    __slots__ = ("engine", "lock", "watchers", "latency", "last_move")
+
+    def __init__(self, engine) -> None:
+        self.engine = engine
+
+        # Held while the engine searches, so that no move is played under it.
+        self.lock = asyncio.Lock()
+        self.watchers = set()
+
+        # op: LatencyStats
+        self.latency = {}
+        self.last_move = None
+
+    def status(self) -> dict:
+        engine = self.engine
+        status = engine.status()
+        return {"fen": engine.to_fen(), "turn": engine.turn, "in_check": status.in_check, "result": status.result,
+                "legal_moves": [move_name(move) for move in engine.legal_moves()], "last_move": self.last_move}
+
+
+class GameServer():
+    def __init__(self, workers=None, backend="mailbox") -> None:
+        """
+        parameters:
+            (1) workers (int) [OPTIONAL]: number of processes that search engine moves (the number of cores by default)
+            (2) backend (str) [OPTIONAL]: the Engine backend of every game
+        """
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.games = {}
+        self.next_game = 1
+        self.connections = 0
+        self.latency = {}
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=8765):
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=1 << 20)
+        return self.server
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        # Shutting the pool down waits for its processes, which must not block the event loop.
+        await asyncio.get_running_loop().run_in_executor(None, lambda: self.pool.shutdown(cancel_futures=True))
+
+    # The game of a checked request (see check_request()).
+    def game(self, request) -> ServerGame:
+        game = self.games.get(request.get("game"))
+        if game is None:
+            raise ValueError(f"no such game: {request.get('game')}")
+        return game
+
+    # Raises ValueError if game was closed while the request waited for its lock.
+    def check_open(self, request, game) -> None:
+        if self.games.get(request["game"]) is not game:
+            raise ValueError(f"no such game: {request['game']}")
+
+    # The (move, score, nodes) that a worker process finds for engine; raises ValueError if the search fails, whether the
+    # position cannot be packed or the worker dies (the pool is then replaced, so that later searches still run).
+    async def search_move(self, engine, max_depth, max_nodes, max_time) -> tuple:
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures.process import BrokenProcessPool
+
+        pool = self.pool
+        try:
+            packed, score, nodes = await asyncio.get_running_loop().run_in_executor(
+                pool, search_position, engine.to_bytes(), max_depth, max_nodes, max_time, self.backend)
+        except BrokenProcessPool:
+            if self.pool is pool:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            raise ValueError("the engine worker stopped; try again") from None
+        except ValueError:
+            raise
+        except Exception as exception:
+            raise ValueError(f"the engine search failed: {exception!r}") from None
+        return unpack_move(packed), score, nodes
+
+    # Sends the status of game to every connection that watches it.
+    def push_status(self, game_id, game) -> None:
+        if len(game.watchers) == 0:
+            return
+        line = (json.dumps({"event": "status", "game": game_id, "status": game.status()}) + "\n").encode()
+        for writer in list(game.watchers):
+            if writer.is_closing():
+                game.watchers.discard(writer)
+            else:
+                writer.write(line)
+
+    async def handle_request(self, request, writer) -> dict:
+        check_request(request)
+        op = request["op"]
+
+        if op == "new":
+            engine = Engine.from_fen(request.get("fen") or START_FEN, self.backend)
+            check_position(engine)
+            game_id = self.next_game
+            self.next_game += 1
+            self.games[game_id] = ServerGame(engine)
+            return {"game": game_id, "status": self.games[game_id].status()}
+
+        if op == "metrics":
+            if "game" in request:
+                return {"metrics": {name: stats.report() for name, stats in self.game(request).latency.items()}}
+            return {"games": len(self.games), "connections": self.connections,
+                    "metrics": {name: stats.report() for name, stats in self.latency.items()}}
+
+        game = self.game(request)
+        if op == "status":
+            return {"status": game.status()}
+
+        if op == "watch":
+            game.watchers.add(writer)
+            return {"status": game.status()}
+
+        # The lock lets a move or engine request already running on the game finish first.
+        if op == "close":
+            async with game.lock:
+                self.check_open(request, game)
+                del self.games[request["game"]]
+            return {}
+
+        if op == "move":
+            async with game.lock:
+                self.check_open(request, game)
+                if game.engine.status().result is not None:
+                    raise ValueError("the game is over")
+                move = parse_move(game.engine, request["move"])
+                game.engine.apply_legal_move(*move)
+                game.last_move = move_name(move)
+            self.push_status(request["game"], game)
+            return {"status": game.status()}
+
+        if op == "engine":
+            max_depth, max_nodes, max_time = check_budget(request)
+            async with game.lock:
+                self.check_open(request, game)
+                engine = game.engine
+                if engine.status().result is not None:
+                    raise ValueError("the game is over")
+                move, score, nodes = await self.search_move(engine, max_depth, max_nodes, max_time)
+                engine.apply_legal_move(*move)
+                game.last_move = move_name(move)
+            self.push_status(request["game"], game)
+            return {"move": game.last_move, "score": score, "nodes": nodes, "status": game.status()}
+
+    async def handle_connection(self, reader, writer) -> None:
+        self.connections += 1
+        try:
+            while True:
+                line, too_long = await read_line(reader)
+                if not line:
+                    break
+                start = time.perf_counter()
+
+                request = None
+                try:
+                    if too_long:
+                        raise ValueError("request too long")
+                    request = read_request(line)
+                    reply = await self.handle_request(request, writer)
+                    reply["ok"] = True
+                # The only error a request can raise: JSON and request checks, FENs, illegal moves, finished or closed
+                # games, and failed searches (see search_move()).
+                except ValueError as exception:
+                    request = request if isinstance(request, dict) else {}
+                    reply = {"ok": False, "error": str(exception)}
+                if "id" in request:
+                    reply["id"] = request["id"]
+
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+
+                seconds = time.perf_counter() - start
+                op = request.get("op")
+                op = op if isinstance(op, str) and op in OPS else "invalid"
+                self.latency.setdefault(op, LatencyStats()).add(seconds)
+                game_id = request.get("game", reply.get("game"))
+                game = self.games.get(game_id) if isinstance(game_id, int) else None
+                if game is not None:
+                    game.latency.setdefault(op, LatencyStats()).add(seconds)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            for game in self.games.values():
+                game.watchers.discard(writer)
+            writer.close()
+
+
+async def serve(host, port, workers, backend) -> None:
+    server = GameServer(workers, backend)
+    await server.start(host, port)
+    print(json.dumps({"listening": f"{host}:{port}"}), flush=True)
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+class Client():
+    # A connection to the server: request() sends a request and waits for its reply; pushed messages are skipped.
+    def __init__(self, reader, writer) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=8765):
+        reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+        return cls(reader, writer)
+
+    async def request(self, op, **fields) -> dict:
+        self.next_id += 1
+        self.writer.write((json.dumps(dict(fields, op=op, id=self.next_id)) + "\n").encode())
+        await self.writer.drain()
+        while True:
+            reply = json.loads(await self.reader.readline())
+            if reply.get("id") == self.next_id:
+                return reply
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def play_against_server(host, port, plies, engine_nodes, rng, latencies) -> dict:
+    client = await Client.connect(host, port)
+    try:
+        start = time.perf_counter()
+        reply = await client.request("new")
+        latencies.setdefault("new", LatencyStats()).add(time.perf_counter() - start)
+        game, status = reply["game"], reply["status"]
+
+        played = 0
+        while played < plies and status["result"] is None:
+            # The player moves at random, the engine answers.
+            start = time.perf_counter()
+            reply = await client.request("move", game=game, move=rng.choice(status["legal_moves"]))
+            latencies.setdefault("move", LatencyStats()).add(time.perf_counter() - start)
+            status = reply["status"]
+            played += 1
+            if status["result"] is not None:
+                break
+
+            start = time.perf_counter()
+            reply = await client.request("engine", game=game, nodes=engine_nodes)
+            latencies.setdefault("engine", LatencyStats()).add(time.perf_counter() - start)
+            if not reply["ok"]:
+                break
+            status = reply["status"]
+            played += 1
+
+        await client.request("close", game=game)
+        return {"plies": played, "result": status["result"]}
+    finally:
+        await client.close()
+
+
+async def load_test(host="127.0.0.1", port=8765, players=100, plies=20, engine_nodes=200, seed=0) -> dict:
+    """
+    parameters:
+        (1) host, port [OPTIONAL]: the server
+        (2) players (int) [OPTIONAL]: number of players connected at once, each playing one game
+        (3) plies (int) [OPTIONAL]: moves of every game (the player's and the engine's)
+        (4) engine_nodes (int) [OPTIONAL]: node budget of every engine move
+        (5) seed (int) [OPTIONAL]: seed of the players' random moves
+
+    returns: {"players", "plies", "seconds", "requests_per_second", "latency": {op: LatencyStats.report()}} as the players saw it
+    """
+
+    rng = random.Random(seed)
+    latencies = {}
+    start = time.perf_counter()
+    games = await asyncio.gather(*(play_against_server(host, port, plies, engine_nodes, random.Random(rng.random()), latencies)
+                                   for _ in range(players)))
+    seconds = time.perf_counter() - start
+
+    requests = sum(stats.count for stats in latencies.values())
+    return {"players": players, "plies": sum(game["plies"] for game in games), "seconds": round(seconds, 4),
+            "requests_per_second": round(requests / seconds, 2) if seconds > 0 else None,
+            "latency": {op: stats.report() for op, stats in latencies.items()}}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Asyncio game server, and a load-test client for it.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--workers", type=int, help="search processes (defaults to the number of cores)")
+    serve_parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    load_parser = commands.add_parser("load", help="simulate players against a running server")
+    load_parser.add_argument("--host", default="127.0.0.1")
+    load_parser.add_argument("--port", type=int, default=8765)
+    load_parser.add_argument("--players", type=int, default=100, help="players connected at once")
+    load_parser.add_argument("--plies", type=int, default=20, help="moves of every game")
+    load_parser.add_argument("--engine-nodes", type=int, default=200, help="node budget of every engine move")
+    load_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, args.workers, args.backend))
+        except KeyboardInterrupt:
+            pass
+    else:
+        report = asyncio.run(load_test(args.host, args.port, args.players, args.plies, args.engine_nodes, args.seed))
+        print(json.dumps(report), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
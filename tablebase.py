@@ -0,0 +1,556 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* Endgame tablebases of 3 and 4 pieces (kings included): win / draw / loss and distance to mate  *
+* of every position of a material signature, built offline by retrograde analysis over the     *
+* move generator of Engine, written as one binary file per signature and probed through mmap.   *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+Usage:
+    python tablebase.py build tables                  (every 3-piece table)
+    python tablebase.py build tables --pieces 4 --workers 8
+    python tablebase.py build tables KRvK KQvKR
+    python tablebase.py probe tables --fen "8/8/8/4k3/8/8/8/R3K3 w - - 0 1"
+
+**  A signature names the pieces of each side, strongest first: "KQvKR" is king and queen
+    against king and rook. Tables are only built for the side with more (or stronger) pieces as
+    white; a position with colours the other way round is looked up colour-flipped. **
+**  Castling and en-passant are left out of the tables: a position with either is not probed. **
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# A table file is TABLE_MAGIC (8 bytes), the signature (16 bytes, padded with zeros) and then    #
+# one byte per index, for the side to move:                                                     #
+#      0:          draw                                                                         #
+#      1 - 127:    win, mate in 2v - 1 plies                                                    #
+#      128 - 254:  loss, mated in 2(v - 128) plies                                              #
+#      255:        not a position (pieces on one square, side not to move in check, ...)        #
+# so a table holds wins of up to MAX_WIN_PLIES and losses of up to MAX_LOSS_PLIES.              #
+#                                                                                               #
+# Index of a position: the board is turned (mirrored, rotated; only mirrored left to right if    #
+# there are pawns) so that the white king is on one of KING_SQUARES; then                       #
+#      index = ((king slot * 64 + black king) * 64 + next piece ...) * 2 + (1 if black to move)  #
+# with the other pieces in the order of the signature (pieces of one kind by square).           #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+Building a table:
+    (1) The indices are dealt out in ranges to a pool of processes. For every position a worker
+        lists the moves (Engine.generate_legal_moves()): a move that keeps the signature leads
+        to another index of the table; a capture or promotion leads to a smaller (or other)
+        table, which is probed: tables are built in an order that makes them ready in time.
+    (2) The moves are turned around (for every index, the indices that lead to it), and the
+        results are spread from the mates outwards, nearest mate first: a position is won if
+        one move leads to a lost one, and lost once every move leads to a won one.
+    (3) Positions left over are draws.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+from array import array
+
+from engine import Engine
+
+TABLE_MAGIC = b"CHESSTB1"
+HEADER_SIZE = len(TABLE_MAGIC) + 16
+
+ORDER = "KQRBNP"
+LETTER_CODES = {"K": 5, "Q": 4, "R": 1, "B": 3, "N": 2, "P": 6}
+CODE_LETTERS = {5: "K", 4: "Q", 1: "R", 3: "B", 2: "N", 6: "P"}
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+NOT_A_POSITION = 255
+
+# Longest distances to mate a table byte holds (see top of file); a build that finds a longer one stops with a ValueError.
+MAX_WIN_PLIES = 253
+MAX_LOSS_PLIES = 252
+
+# Most pieces of a table, kings included.
+MAX_PIECES = 4
+
+# Position kinds found by the workers.
+INVALID = 0
+NORMAL = 1
+MATED = 2
+STALEMATE = 3
+
+NO_DISTANCE = 0xFFFF
+
+# The eight symmetries of the board, as square -> square tables (square index 8 * x + y).
+TRANSFORMS = tuple(tuple(8 * f(sq // 8, sq % 8)[0] + f(sq // 8, sq % 8)[1] for sq in range(64)) for f in (
+    lambda x, y: (x, y), lambda x, y: (x, 7 - y), lambda x, y: (7 - x, y), lambda x, y: (7 - x, 7 - y),
+    lambda x, y: (y, x), lambda x, y: (y, 7 - x), lambda x, y: (7 - y, x), lambda x, y: (7 - y, 7 - x)))
+
+# The white king is brought onto the a1-d1-d4 triangle with no pawns, onto files a-d with pawns.
+PAWNLESS_KING_SQUARES = tuple(sq for sq in range(64) if 7 - sq // 8 <= sq % 8 <= 3)
+PAWN_KING_SQUARES = tuple(sq for sq in range(64) if sq % 8 <= 3)
+
+# The symmetry used for a white king square.
+PAWNLESS_TRANSFORM = tuple(next(t for t in TRANSFORMS if t[sq] in PAWNLESS_KING_SQUARES) for sq in range(64))
+PAWN_TRANSFORM = tuple(TRANSFORMS[0] if sq % 8 <= 3 else TRANSFORMS[1] for sq in range(64))
+
+
+# Table byte -> (WIN, DRAW or LOSS, plies to mate), None if it is not a position.
+def decode_value(value):
+    if value == NOT_A_POSITION:
+        return None
+    if value == 0:
+        return DRAW, 0
+    if value < 128:
+        return WIN, 2 * value - 1
+    return LOSS, 2 * (value - 128)
+
+
+# (WIN, DRAW or LOSS, plies to mate) -> table byte; raises ValueError if plies is too long for the byte.
+def encode_value(result, plies) -> int:
+    if result == WIN:
+        if plies > MAX_WIN_PLIES:
+            raise ValueError(f"a win in {plies} plies does not fit a table byte (at most {MAX_WIN_PLIES})")
+        return (plies + 1) // 2
+    if result == LOSS:
+        if plies > MAX_LOSS_PLIES:
+            raise ValueError(f"a loss in {plies} plies does not fit a table byte (at most {MAX_LOSS_PLIES})")
+        return 128 + plies // 2
+    return 0
+
+
+# [(piece code, square)] -> "KQvKR"
+def signature_of(pieces) -> str:
+    white = "".join(sorted((CODE_LETTERS[piece] for piece, _ in pieces if piece > 0), key=ORDER.index))
+    black = "".join(sorted((CODE_LETTERS[-piece] for piece, _ in pieces if piece < 0), key=ORDER.index))
+    return white + "v" + black
+
+
+# More pieces first, then stronger pieces.
+def side_strength(letters) -> tuple:
+    return (-len(letters), [ORDER.index(letter) for letter in letters])
+
+
+# True if white is the stronger side of signature (tables are only built that way round).
+def is_canonical(signature) -> bool:
+    white, black = signature.split("v")
+    return side_strength(white) <= side_strength(black)
+
+
+# Colours swapped and the board mirrored top to bottom: the same position seen from the other side.
+def flip(pieces, turn) -> tuple:
+    return [(-piece, (7 - sq // 8) * 8 + sq % 8) for piece, sq in pieces], -turn
+
+
+def signatures(pieces) -> list:
+    """
+    parameters:
+        (1) pieces (int): number of pieces, kings included (3 or 4)
+
+    returns: every canonical signature of that many pieces, in an order in which they can be built
+             (the tables a capture or promotion leads to come first)
+    """
+
+    extras = "QRBNP"
+    sides = [""] + list(extras) + [a + b for i, a in enumerate(extras) for b in extras[i:]]
+    found = set()
+    for white in sides:
+        for black in sides:
+            if len(white) + len(black) == pieces - 2 and is_canonical("K" + white + "vK" + black):
+                found.add("K" + white + "vK" + black)
+    return sorted(found, key=lambda signature: (signature.count("P"), signature))
+
+
+def build_order(names) -> list:
+    # Fewer pieces first; among the same number, fewer pawns first (a promotion lowers the count of pawns).
+    return sorted(names, key=lambda signature: (len(signature) - 1, signature.count("P"), signature))
+
+
+class TableLayout():
+    def __init__(self, signature) -> None:
+        white, black = signature.split("v")
+        self.signature = signature
+        self.codes = [5, -5] + [LETTER_CODES[letter] for letter in white[1:]] + [-LETTER_CODES[letter] for letter in black[1:]]
+        self.pawns = "P" in signature
+        self.king_squares = PAWN_KING_SQUARES if self.pawns else PAWNLESS_KING_SQUARES
+        self.king_slots = {sq: slot for slot, sq in enumerate(self.king_squares)}
+        self.transforms = PAWN_TRANSFORM if self.pawns else PAWNLESS_TRANSFORM
+        self.size = len(self.king_squares) * 64 ** (len(self.codes) - 1) * 2
+
+    # Index (see top of file) of a position with the pieces of the signature.
+    def index(self, pieces, turn) -> int:
+        white_king = next(sq for piece, sq in pieces if piece == 5)
+        transform = self.transforms[white_king]
+
+        squares = {}
+        for piece, sq in pieces:
+            squares.setdefault(piece, []).append(transform[sq])
+        for piece_squares in squares.values():
+            piece_squares.sort(reverse=True)
+
+        index = self.king_slots[transform[white_king]]
+        for piece in self.codes[1:]:
+            index = index * 64 + squares[piece].pop()
+        return index * 2 + (0 if turn == 1 else 1)
+
+    # Index -> (pieces, turn); the inverse of index() for the positions it gives.
+    def decode(self, index) -> tuple:
+        turn = 1 if index % 2 == 0 else -1
+        index //= 2
+
+        squares = []
+        for _ in self.codes[1:]:
+            squares.append(index % 64)
+            index //= 64
+        squares.reverse()
+        return list(zip(self.codes, [self.king_squares[index]] + squares)), turn
+
+
+class Tablebase():
+    def __init__(self, directory) -> None:
+        """
+        parameters:
+            (1) directory (str): the directory of the table files
+        """
+
+        self.directory = directory
+
+        # signature: (file, mmap, TableLayout), or None if there is no file for it.
+        self.tables = {}
+
+    def close(self) -> None:
+        for table in self.tables.values():
+            if table is not None:
+                table[1].close()
+                table[0].close()
+        self.tables = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def path(self, signature) -> str:
+        return os.path.join(self.directory, signature + ".tb")
+
+    # The open table of signature, None if there is none.
+    def table(self, signature):
+        if signature not in self.tables:
+            path = self.path(signature)
+            if os.path.exists(path):
+                file = open(path, "rb")
+                table_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                if table_map[:len(TABLE_MAGIC)] != TABLE_MAGIC:
+                    table_map.close()
+                    file.close()
+                    raise ValueError(f"not a tablebase file: {path}")
+                self.tables[signature] = (file, table_map, TableLayout(signature))
+            else:
+                self.tables[signature] = None
+        return self.tables[signature]
+
+    def probe_pieces(self, pieces, turn):
+        """
+        parameters:
+            (1) pieces (list): [(piece code, square index)] of every piece on the board
+            (2) turn (int): the side to move
+
+        returns: (WIN, DRAW or LOSS, plies to mate) for the side to move; None if there is no table for the pieces
+        """
+
+        if len(pieces) == 2:
+            return DRAW, 0
+        if len(pieces) > MAX_PIECES:
+            return None
+
+        signature = signature_of(pieces)
+        if not is_canonical(signature):
+            pieces, turn = flip(pieces, turn)
+            signature = signature_of(pieces)
+
+        table = self.table(signature)
+        if table is None:
+            return None
+        return decode_value(table[1][HEADER_SIZE + table[2].index(pieces, turn)])
+
+    def probe(self, engine):
+        """
+        parameters:
+            (1) engine (Engine): the position
+
+        returns: (WIN, DRAW or LOSS, plies to mate) for the side to move; None if the position is not in the tables
+        """
+
+        if engine.castling or engine.en_passant is not None:
+            return None
+
+        if len(engine.piece_cords[1]) + len(engine.piece_cords[-1]) > MAX_PIECES:
+            return None
+        board = engine.board
+        pieces = [(board[x][y], x * 8 + y) for color in (1, -1) for x, y in engine.piece_cords[color]]
+        return self.probe_pieces(pieces, engine.turn)
+
+    def best_move(self, engine):
+        """
+        parameters:
+            (1) engine (Engine): the position
+
+        returns: the move that keeps the best result of the tables for the side to move (the fastest win, the slowest loss),
+                 as (start_cord, end_cord, promotion_piece); None if the position is not in the tables
+        """
+
+        best = None
+        best_rank = None
+        for move in engine.legal_moves():
+            engine.apply_legal_move(*move)
+            value = self.probe(engine)
+            engine.undo_legal_move()
+            if value is None:
+                return None
+
+            # The result of the side moving is the opposite of the one of its opponent.
+            result, plies = -value[0], value[1]
+            rank = (result, -plies if result == WIN else plies)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = move, rank
+        return best
+
+
+# Per-process state of the workers: an empty engine and the tables of the directory.
+_worker_engine = None
+_worker_tablebases = {}
+
+
+# Runs in a worker process: the positions of indices start to stop of the table of signature (see top of file).
+def generate_range(directory, signature, start, stop) -> tuple:
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = Engine([[0 for _ in range(8)] for __ in range(8)], 1, [])
+    if directory not in _worker_tablebases:
+        _worker_tablebases[directory] = Tablebase(directory)
+    engine = _worker_engine
+    tablebase = _worker_tablebases[directory]
+    board = engine.board
+
+    layout = TableLayout(signature)
+    count = stop - start
+    kinds = bytearray(count)
+    external_wins = array("H", [NO_DISTANCE]) * count
+    external_losses = array("H", [0]) * count
+    external_draws = bytearray(count)
+    offsets = array("I", [0])
+    children = array("I")
+
+    for i in range(count):
+        pieces, turn = layout.decode(start + i)
+        squares = [sq for _, sq in pieces]
+
+        # Pieces on one square, pawns on the first or last rank, pieces of one kind out of square order.
+        valid = len(set(squares)) == len(squares) and all(abs(piece) != 6 or 8 <= sq < 56 for piece, sq in pieces)
+        for j in range(2, len(pieces) - 1):
+            if pieces[j][0] == pieces[j + 1][0] and pieces[j][1] > pieces[j + 1][1]:
+                valid = False
+
+        if valid:
+            for piece, sq in pieces:
+                engine.set_square((sq // 8, sq % 8), piece)
+            engine.turn = turn
+            engine.castling = 0
+            engine.en_passant = None
+
+            if engine.in_check(-turn):
+                valid = False
+            else:
+                moves = engine.generate_legal_moves(turn)
+                if len(moves) == 0:
+                    kinds[i] = MATED if engine.in_check(turn) else STALEMATE
+                else:
+                    kinds[i] = NORMAL
+
+                for start_cord, end_cord, promotion_piece in moves:
+                    start_sq = start_cord[0] * 8 + start_cord[1]
+                    end_sq = end_cord[0] * 8 + end_cord[1]
+                    moved = board[start_cord[0]][start_cord[1]] if promotion_piece is None else promotion_piece
+                    child = [(piece, end_sq if sq == start_sq else sq) for piece, sq in pieces if sq != end_sq]
+                    child = [(moved, sq) if sq == end_sq else (piece, sq) for piece, sq in child]
+
+                    if len(child) == len(pieces) and promotion_piece is None:
+                        children.append(layout.index(child, -turn))
+                        continue
+
+                    value = tablebase.probe_pieces(child, -turn)
+                    if value is None:
+                        raise ValueError(f"{signature} needs the table of {signature_of(child)} first")
+                    result, plies = value
+                    if result == LOSS:
+                        external_wins[i] = min(external_wins[i], plies + 1)
+                    elif result == WIN:
+                        external_losses[i] = max(external_losses[i], plies + 1)
+                    else:
+                        external_draws[i] = 1
+
+            for sq in squares:
+                engine.set_square((sq // 8, sq % 8), 0)
+
+        offsets.append(len(children))
+    return kinds, external_wins, external_losses, external_draws, offsets, children
+
+
+def build_table(directory, signature, workers=None, chunk_size=4096) -> dict:
+    """
+    parameters:
+        (1) directory (str): the directory of the table files; the tables the signature leads to must be in it
+        (2) signature (str): a canonical signature, e.g. "KRvK"
+        (3) workers (int) [OPTIONAL]: number of worker processes (the number of cores by default)
+        (4) chunk_size (int) [OPTIONAL]: number of indices sent to a worker at once
+
+    returns: {"signature", "positions" (indices that are positions), "wins", "draws", "losses", "longest" (plies), "seconds"}
+    """
+
+    # Imported here: worker processes and short-lived scripts that never build a pool skip its import.
+    from concurrent.futures import ProcessPoolExecutor
+
+    start_time = time.perf_counter()
+    layout = TableLayout(signature)
+    size = layout.size
+
+    # (1) The moves of every position.
+    kinds = bytearray()
+    external_wins = array("H")
+    external_losses = array("H")
+    external_draws = bytearray()
+    offsets = array("I", [0])
+    children = array("I")
+
+    ranges = [(start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = pool.map(generate_range, [directory] * len(ranges), [signature] * len(ranges),
+                         [start for start, _ in ranges], [stop for _, stop in ranges])
+        for part_kinds, part_wins, part_losses, part_draws, part_offsets, part_children in parts:
+            base = len(children)
+            kinds += part_kinds
+            external_wins += part_wins
+            external_losses += part_losses
+            external_draws += part_draws
+            offsets.extend(base + offset for offset in part_offsets[1:])
+            children += part_children
+
+    # (2) The moves turned around: predecessors[first[c]:first[c + 1]] are the indices with a move to c.
+    first = array("I", [0]) * (size + 1)
+    for child in children:
+        first[child + 1] += 1
+    for index in range(size):
+        first[index + 1] += first[index]
+    predecessors = array("I", [0]) * len(children)
+    fill = array("I", first)
+    for index in range(size):
+        for k in range(offsets[index], offsets[index + 1]):
+            child = children[k]
+            predecessors[fill[child]] = index
+            fill[child] += 1
+    del children, fill
+
+    # Results spread out from the mates: buckets[plies] holds the (index, result) found at that distance.
+    remaining = array("I", (offsets[index + 1] - offsets[index] for index in range(size)))
+    longest_loss = array("H", external_losses)
+    values = bytearray(NOT_A_POSITION if kind == INVALID else 0 for kind in kinds)
+    resolved = bytearray(size)
+    buckets = []
+
+    def push(index, result, plies):
+        while len(buckets) <= plies:
+            buckets.append([])
+        buckets[plies].append((index, result))
+
+    for index in range(size):
+        if kinds[index] == MATED:
+            push(index, LOSS, 0)
+        elif kinds[index] == NORMAL:
+            if external_wins[index] != NO_DISTANCE:
+                push(index, WIN, external_wins[index])
+            elif remaining[index] == 0 and not external_draws[index]:
+                push(index, LOSS, external_losses[index])
+
+    plies = 0
+    while plies < len(buckets):
+        for index, result in buckets[plies]:
+            if resolved[index]:
+                continue
+            resolved[index] = 1
+            values[index] = encode_value(result, plies)
+
+            for k in range(first[index], first[index + 1]):
+                parent = predecessors[k]
+                if resolved[parent] or kinds[parent] != NORMAL:
+                    continue
+                if result == LOSS:
+                    push(parent, WIN, plies + 1)
+                else:
+                    remaining[parent] -= 1
+                    longest_loss[parent] = max(longest_loss[parent], plies + 1)
+                    if remaining[parent] == 0 and not external_draws[parent] and external_wins[parent] == NO_DISTANCE:
+                        push(parent, LOSS, longest_loss[parent])
+        buckets[plies] = None
+        plies += 1
+
+    # (3) Everything else is a draw (already 0).
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, signature + ".tb")
+    with open(path + ".tmp", "wb") as file:
+        file.write(TABLE_MAGIC + signature.encode().ljust(16, b"\0"))
+        file.write(values)
+    os.replace(path + ".tmp", path)
+
+    wins = sum(1 for value in values if 0 < value < 128)
+    losses = sum(1 for value in values if 128 <= value < NOT_A_POSITION)
+    positions = size - values.count(NOT_A_POSITION)
+    return {"signature": signature, "positions": positions, "wins": wins, "draws": positions - wins - losses, "losses": losses,
+            "longest": max(len(buckets) - 1, 0), "seconds": round(time.perf_counter() - start_time, 2)}
+
+
+def build_tables(directory, names, workers=None):
+    """
+    parameters:
+        (1) directory (str): the directory to write the table files to
+        (2) names (list): canonical signatures to build; the ones they lead to must be among them or already built
+        (3) workers (int) [OPTIONAL]: number of worker processes (the number of cores by default)
+
+    returns: a generator of the report of build_table() for every table, as it is built
+    """
+
+    for signature in build_order(names):
+        yield build_table(directory, signature, workers)
+
+
+def main(argv=None) -> int:
+    from fen import START_FEN
+    from perft import move_name
+
+    parser = argparse.ArgumentParser(description="Endgame tablebase generator and probe.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="build tables")
+    build_parser.add_argument("directory", help="directory of the table files")
+    build_parser.add_argument("signatures", nargs="*", help="signatures to build (defaults to every table of --pieces)")
+    build_parser.add_argument("--pieces", type=int, choices=(3, 4), default=3, help="build every table up to this many pieces")
+    build_parser.add_argument("--workers", type=int, help="worker processes (defaults to the number of cores)")
+    probe_parser = commands.add_parser("probe", help="look a position up")
+    probe_parser.add_argument("directory", help="directory of the table files")
+    probe_parser.add_argument("--fen", default=START_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        names = args.signatures or [signature for pieces in range(3, args.pieces + 1) for signature in signatures(pieces)]
+        for report in build_tables(args.directory, names, args.workers):
+            print(json.dumps(report), flush=True)
+    else:
+        engine = Engine.from_fen(args.fen)
+        with Tablebase(args.directory) as tablebase:
+            value = tablebase.probe(engine)
+            move = None if value is None else tablebase.best_move(engine)
+        print(json.dumps({"result": None if value is None else {WIN: "win", DRAW: "draw", LOSS: "loss"}[value[0]],
+                          "plies": None if value is None else value[1], "move": None if move is None else move_name(move)}), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
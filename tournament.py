@@ -0,0 +1,322 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* A match between two configurations of the search: games from a list of openings, each opening *
+* played twice with the colours swapped, over a pool of worker processes. Reports the score, the *
+* Elo difference with its confidence interval, nodes per second and time per move of each side, *
+* and stops early once a sequential probability ratio test (SPRT) has decided.                  *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+Usage:
+    python tournament.py --a "depth=3" --b "depth=2" --games 40
+    python tournament.py --a "nodes=4000,backend=bitboard" --b "nodes=4000" --games 2000 --sprt 0 10 --pgn games.pgn
+
+**  A configuration is "key=value" pairs split by commas (see CONFIG_KEYS); a game is adjudicated
+    with Engine.status() (checkmate, stalemate and Engine.is_draw()), and a game still going at
+    max_plies counts as a draw. **
+**  Elo is the logistic Elo of the score of a over b; SPRT tests elo0 against elo1 (the
+    normal approximation of the log-likelihood ratio, over the score of every game). **
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# run_tournament() returns the report (dict):                                                   #
+#      games (int), wins, draws, losses (int):  from the point of view of a                     #
+#      score (float):        points of a per game                                               #
+#      elo (float), elo_low, elo_high (float):  Elo difference of a over b, and its interval    #
+#      sprt (dict):          {elo0, elo1, llr, lower, upper, result: "H0", "H1" or None}        #
+#      sides (dict):         {"a": ..., "b": ...}: {moves, nodes, seconds, nps, seconds_per_move} #
+#      terminations (dict):  number of games ended by checkmate, stalemate, draw and max_plies  #
+#      seconds (float):      wall time of the match                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from statistics import NormalDist
+
+from engine import Engine
+from headless import game_to_pgn
+from pgn import move_to_san
+from search import Searcher
+from ttable import TranspositionTable
+
+# Openings of the match, a few moves into common lines.
+DEFAULT_OPENINGS = (
+    "r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3",
+    "rnbqkbnr/pp2pppp/3p4/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 0 3",
+    "rnbqkbnr/ppp2ppp/4p3/3p4/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3",
+    "rnbqkb1r/pppppp1p/5np1/8/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3",
+    "rnbqkbnr/ppp2ppp/4p3/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq d6 0 3",
+    "rnbqkbnr/pp2pppp/2p5/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq d6 0 3",
+    "rnbqkbnr/pppp1ppp/8/4p3/2P5/2N5/PP1PPPPP/R1BQKBNR b KQkq - 1 2",
+    "rnbqkbnr/ppp1pppp/8/3p4/8/5NP1/PPPPPP1P/RNBQKB1R b KQkq - 0 2",
+    "rnbqkb1r/pppp1ppp/5n2/4p3/2B1P3/8/PPPP1PPP/RNBQK1NR w KQkq - 2 3",
+    "rnbqkb1r/ppp1pppp/5n2/3p4/3P1B2/4P3/PPP2PPP/RN1QKBNR b KQkq - 0 3",
+)
+
+# Keys of a configuration, and their types:
+#      depth, nodes, time: budgets of every move (see Searcher.search()); hash: megabytes of its transposition table
+#      backend: the Engine backend; book, tablebase: paths given to the search (see book.py and tablebase.py)
+CONFIG_KEYS = {"name": str, "depth": int, "nodes": int, "time": float, "hash": int, "backend": str, "book": str, "tablebase": str}
+
+# Points of a result, for white.
+WHITE_POINTS = {"1-0": 1.0, "1/2-1/2": 0.5, "0-1": 0.0}
+
+# Books and tablebases opened by a worker process, by path.
+_worker_files = {}
+
+
+def parse_config(text) -> dict:
+    """
+    parameters:
+        (1) text (str): "key=value" pairs split by commas, e.g. "nodes=4000,backend=bitboard"
+
+    returns: the configuration (dict); raises ValueError for an unknown key or a value of the wrong type
+    """
+
+    config = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        key, _, value = item.partition("=")
+        if key not in CONFIG_KEYS:
+            raise ValueError(f"unknown configuration key: {key}")
+        config[key] = CONFIG_KEYS[key](value)
+    return config
+
+
+# The budget of a configuration, as the arguments of Searcher.search().
+def budget(config) -> tuple:
+    return config.get("depth"), config.get("nodes"), config.get("time")
+
+
+# A searcher for the side with config, on its own engine at fen.
+def make_player(fen, config) -> tuple:
+    from book import OpeningBook
+    from tablebase import Tablebase
+
+    files = []
+    for key, kind in (("book", OpeningBook), ("tablebase", Tablebase)):
+        path = config.get(key)
+        if path is not None and path not in _worker_files:
+            _worker_files[path] = kind(path)
+        files.append(None if path is None else _worker_files[path])
+
+    engine = Engine.from_fen(fen, config.get("backend", "mailbox"))
+    table = TranspositionTable(config.get("hash", 16) * 1024 * 1024)
+    return engine, Searcher(engine, table, *files)
+
+
+# Runs in a worker process: one game, white playing with config white and black with config black.
+def play_match_game(index, fen, white, black, max_plies) -> dict:
+    start = time.perf_counter()
+    referee = Engine.from_fen(fen)
+    players = {1: make_player(fen, white), -1: make_player(fen, black)}
+
+    # color: [moves, nodes, seconds]
+    sides = {1: [0, 0, 0.0], -1: [0, 0, 0.0]}
+    moves = []
+    status = referee.status()
+    while status.result is None and len(moves) < max_plies:
+        side = sides[referee.turn]
+        _, searcher = players[referee.turn]
+        report = searcher.search(*budget(white if referee.turn == 1 else black))
+        side[0] += 1
+        side[1] += report["nodes"]
+        side[2] += report["seconds"]
+
+        move = report["move"]
+        moves.append(move_to_san(referee, move))
+        for engine in (referee, players[1][0], players[-1][0]):
+            engine.apply_legal_move(*move)
+        status = referee.status()
+
+    if status.checkmate:
+        termination = "checkmate"
+    elif status.stalemate:
+        termination = "stalemate"
+    elif status.draw:
+        termination = "draw"
+    else:
+        termination = "max_plies"
+
+    return {"index": index, "fen": fen, "moves": moves, "result": status.result or "1/2-1/2", "termination": termination,
+            "plies": len(moves), "white": sides[1], "black": sides[-1], "seconds": round(time.perf_counter() - start, 4)}
+
+
+def expected_score(elo) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+# The Elo difference of a score per game (clamped away from 0 and 1, where it has none).
+def score_to_elo(score) -> float:
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_interval(wins, draws, losses, confidence=0.95) -> tuple:
+    """
+    parameters:
+        (1) wins, draws, losses (int): results of a
+        (2) confidence (float) [OPTIONAL]: the confidence of the interval
+
+    returns: (elo, elo_low, elo_high): the Elo difference of a over b and its interval, from the variance of the score per game
+    """
+
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, -math.inf, math.inf
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = NormalDist().inv_cdf(0.5 + confidence / 2) * math.sqrt(variance / games)
+    return score_to_elo(score), score_to_elo(score - margin), score_to_elo(score + margin)
+
+
+def sprt(wins, draws, losses, elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05) -> dict:
+    """
+    parameters:
+        (1) wins, draws, losses (int): results of a
+        (2) elo0, elo1 (float) [OPTIONAL]: the Elo difference of the null hypothesis, and of the alternative
+        (3) alpha, beta (float) [OPTIONAL]: the rates of false positives and false negatives
+
+    returns: {elo0, elo1, llr, lower, upper, result}; result is "H1" (a is elo1 stronger) once llr reaches upper,
+             "H0" once it falls to lower, else None
+    """
+
+    lower, upper = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+    games = wins + draws + losses
+    llr = 0.0
+    if games > 0:
+        score = (wins + 0.5 * draws) / games
+        variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+        if variance > 0:
+            score0, score1 = expected_score(elo0), expected_score(elo1)
+            llr = games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+    result = "H1" if llr >= upper else "H0" if llr <= lower else None
+    return {"elo0": elo0, "elo1": elo1, "llr": round(llr, 4), "lower": round(lower, 4), "upper": round(upper, 4), "result": result}
+
+
+def run_tournament(config_a, config_b, openings=DEFAULT_OPENINGS, games=20, workers=None, max_plies=300, sprt_bounds=None,
+                   confidence=0.95, callback=None) -> dict:
+    """
+    parameters:
+        (1) config_a, config_b (dict): the two configurations (see parse_config())
+        (2) openings (list) [OPTIONAL]: FENs the games start from, each played with both colours
+        (3) games (int) [OPTIONAL]: games to play at most
+        (4) workers (int) [OPTIONAL]: worker processes (the number of cores by default)
+        (5) max_plies (int) [OPTIONAL]: a game is a draw after this many moves
+        (6) sprt_bounds (tuple) [OPTIONAL]: (elo0, elo1, alpha, beta); the match stops as soon as the test decides
+        (7) confidence (float) [OPTIONAL]: confidence of the Elo interval
+        (8) callback (function) [OPTIONAL]: called with every game finished (see play_match_game()), a's colour added
+
+    returns: the report (see top of file)
+    """
+
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    wins = draws = losses = 0
+    sides = {"a": [0, 0, 0.0], "b": [0, 0, 0.0]}
+    terminations = {"checkmate": 0, "stalemate": 0, "draw": 0, "max_plies": 0}
+    test = None
+    decided = False
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # future: True if a plays white. Games are handed out no faster than the workers play them, so that once 
+        # the SPRT has decided only the games already being played are left (they are finished and counted).
+        pending = {}
+        index = 0
+        while pending or (index < games and not decided):
+            while index < games and not decided and len(pending) < workers:
+                fen = openings[(index // 2) % len(openings)]
+                a_white = index % 2 == 0
+                white, black = (config_a, config_b) if a_white else (config_b, config_a)
+                pending[pool.submit(play_match_game, index, fen, white, black, max_plies)] = a_white
+                index += 1
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                a_white = pending.pop(future)
+                game = future.result()
+                game["a_color"] = "white" if a_white else "black"
+
+                points = WHITE_POINTS[game["result"]] if a_white else 1 - WHITE_POINTS[game["result"]]
+                if points == 1:
+                    wins += 1
+                elif points == 0:
+                    losses += 1
+                else:
+                    draws += 1
+                terminations[game["termination"]] += 1
+                for name, color in (("a", "white" if a_white else "black"), ("b", "black" if a_white else "white")):
+                    sides[name] = [total + part for total, part in zip(sides[name], game[color])]
+
+                if callback is not None:
+                    callback(game)
+
+                if sprt_bounds is not None:
+                    test = sprt(wins, draws, losses, *sprt_bounds)
+                    decided = decided or test["result"] is not None
+
+    played = wins + draws + losses
+    elo, elo_low, elo_high = elo_interval(wins, draws, losses, confidence)
+    return {"games": played, "wins": wins, "draws": draws, "losses": losses,
+            "score": round((wins + 0.5 * draws) / played, 4) if played else None,
+            "elo": round(elo, 1), "elo_low": round(elo_low, 1), "elo_high": round(elo_high, 1), "sprt": test,
+            "sides": {name: {"moves": moves, "nodes": nodes, "seconds": round(seconds, 4),
+                             "nps": round(nodes / seconds) if seconds > 0 else None,
+                             "seconds_per_move": round(seconds / moves, 4) if moves else None}
+                      for name, (moves, nodes, seconds) in sides.items()},
+            "terminations": terminations, "seconds": round(time.perf_counter() - start, 4)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="A match between two configurations of the search.")
+    parser.add_argument("--a", default="depth=2", help='configuration a, e.g. "nodes=4000,backend=bitboard"')
+    parser.add_argument("--b", default="depth=2", help="configuration b")
+    parser.add_argument("--games", type=int, default=20, help="games to play at most")
+    parser.add_argument("--openings", help="a file of opening FENs, one per line (defaults to a built-in list)")
+    parser.add_argument("--workers", type=int, help="worker processes (defaults to the number of cores)")
+    parser.add_argument("--max-plies", type=int, default=300, help="a game is a draw after this many moves")
+    parser.add_argument("--sprt", type=float, nargs=2, metavar=("ELO0", "ELO1"), help="stop once the SPRT of elo0 against elo1 decides")
+    parser.add_argument("--alpha", type=float, default=0.05, help="false positive rate of the SPRT")
+    parser.add_argument("--beta", type=float, default=0.05, help="false negative rate of the SPRT")
+    parser.add_argument("--confidence", type=float, default=0.95, help="confidence of the Elo interval")
+    parser.add_argument("--pgn", help="also write the games to this PGN file")
+    args = parser.parse_args(argv)
+
+    try:
+        config_a, config_b = parse_config(args.a), parse_config(args.b)
+    except ValueError as exception:
+        parser.error(str(exception))
+
+    openings = DEFAULT_OPENINGS
+    if args.openings is not None:
+        with open(args.openings) as file:
+            openings = [line.strip() for line in file if line.strip()]
+
+    pgn_file = None if args.pgn is None else open(args.pgn, "w")
+
+    # Every game goes to the PGN file as it finishes.
+    def write_game(game) -> None:
+        names = {"a": config_a.get("name", "a"), "b": config_b.get("name", "b")}
+        white, black = (names["a"], names["b"]) if game["a_color"] == "white" else (names["b"], names["a"])
+        pgn_file.write(game_to_pgn(game, {"Event": "tournament", "Round": str(game["index"] + 1), "White": white, "Black": black}) + "\n")
+
+    try:
+        sprt_bounds = None if args.sprt is None else (args.sprt[0], args.sprt[1], args.alpha, args.beta)
+        report = run_tournament(config_a, config_b, openings, args.games, args.workers, args.max_plies, sprt_bounds,
+                                args.confidence, None if pgn_file is None else write_game)
+    finally:
+        if pgn_file is not None:
+            pgn_file.close()
+
+    print(json.dumps(report), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+"""
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+* A transposition table: a fixed-size cache of per-position results, keyed by the Zobrist key   *
+* of the position (see engine.py). It holds legal-move lists, position status and search        *
+* results, and never grows past the byte budget it was built with:                              *
+*    TranspositionTable(max_bytes=16 * 1024 * 1024)                                             *
+* * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+**  The budget counts the slot list, every entry and every packed move list (as sys.getsizeof
+    sees them), so it is a real bound on the memory of the table, not an entry count. **
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Every slot holds one Entry (or None):                                                         #
+#      key (int):       the full key of the position (the slot index is only its low bits)      #
+#      depth (int):     depth of the search result (0 if there is none)                         #
+#      age (int):       age of the table when the entry was last written to                     #
+#      moves (bytes):   legal moves of the side to move, packed by pack_moves() (or None)        #
+#      status (int):    status flags of the position (see engine.py) (or None)                  #
+#      score (int), bound (int), move (int): search result, the move packed by pack_move()      #
+#                                                                                               #
+# A key goes into slot (key & mask) or its neighbour (index ^ 1). If it is in neither, the      #
+# slot replaced is, in order: an empty one, one written before the last new_search(), the one   #
+# of lower depth.                                                                               #
+#                                                                                               #
+# If a write would take the table past max_bytes, entries are evicted, sweeping the slots from  #
+# where the last sweep stopped: entries of older ages first, then any.                          #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+
+import sys
+
+# Search result bounds.
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+
+class Entry():
+    __slots__ = ("key", "depth", "age", "moves", "status", "score", "bound", "move")
+
+    def __init__(self, key, age) -> None:
+        self.key = key
+        self.depth = 0
+        self.age = age
+        self.moves = None
+        self.status = None
+        self.score = None
+        self.bound = None
+        self.move = None
+
+
+# Bytes of an entry without its move list: the object, its key and the two ints of a search result.
+ENTRY_BYTES = sys.getsizeof(Entry(0, 0)) + sys.getsizeof(2 ** 63) + 2 * sys.getsizeof(2 ** 20)
+
+# Bytes of the move list of a middlegame position, used to size the slot list.
+TYPICAL_MOVES_BYTES = sys.getsizeof(bytes(3 * 40))
+
+
+# (start_cord, end_cord, promotion_piece) -> int: 6 bits per square, the promotion piece + 6 above them.
+def pack_move(move) -> int:
+    start_cord, end_cord, promotion_piece = move
+    return (start_cord[0] * 8 + start_cord[1]) | (end_cord[0] * 8 + end_cord[1]) << 6 | ((promotion_piece or 0) + 6) << 12
+
+
+# int -> (start_cord, end_cord, promotion_piece); the inverse of pack_move().
+def unpack_move(packed) -> tuple:
+    start, end, promotion_piece = packed & 63, packed >> 6 & 63, (packed >> 12) - 6
+    return ((start >> 3, start & 7), (end >> 3, end & 7), promotion_piece or None)
+
+
+# A list of moves -> bytes: three per move (start square, end square, promotion piece + 6).
+def pack_moves(moves) -> bytes:
+    data = bytearray()
+    for start_cord, end_cord, promotion_piece in moves:
+        data += bytes((start_cord[0] * 8 + start_cord[1], end_cord[0] * 8 + end_cord[1], (promotion_piece or 0) + 6))
+    return bytes(data)
+
+
+# bytes -> a list of moves; the inverse of pack_moves().
+def unpack_moves(data) -> list:
+    return [((data[i] >> 3, data[i] & 7), (data[i + 1] >> 3, data[i + 1] & 7), (data[i + 2] - 6) or None)
+            for i in range(0, len(data), 3)]
+
+
+class TranspositionTable():
+    def __init__(self, max_bytes=16 * 1024 * 1024) -> None:
+        # The largest power of two of slots that leaves room for an entry with a typical move list in each.
+        slot_count = 2
+        while (slot_count * 2) * (8 + ENTRY_BYTES + TYPICAL_MOVES_BYTES) <= max_bytes:
+            slot_count *= 2
+
+        self.max_bytes = max_bytes
+        self.slots = [None] * slot_count
+        self.mask = slot_count - 1
+        self.slots_bytes = sys.getsizeof(self.slots)
+        if self.slots_bytes > max_bytes:
+            raise ValueError(f"max_bytes too small for a transposition table: {max_bytes}")
+
+        self.age = 0
+        self.hand = 0
+        self.clear()
+
+    def clear(self) -> None:
+        """
+        - empties the table and zeroes its counters
+
+        parameters: None
+
+        returns: None
+        """
+
+        for index in range(len(self.slots)):
+            self.slots[index] = None
+        self.bytes_used = self.slots_bytes
+        self.entries = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    # Marks every entry written so far as older than the ones to come, so that they are replaced first.
+    def new_search(self) -> None:
+        self.age += 1
+
+    # Slot index of key, or None if it is in neither slot of its pair.
+    def find(self, key):
+        index = key & self.mask
+        for slot in (index, index ^ 1):
+            if self.slots[slot] is not None and self.slots[slot].key == key:
+                return slot
+        return None
+
+    # Bytes an entry takes up, its move list included.
+    def entry_bytes(self, entry) -> int:
+        return ENTRY_BYTES + (0 if entry.moves is None else sys.getsizeof(entry.moves))
+
+    def remove(self, index) -> None:
+        self.bytes_used -= self.entry_bytes(self.slots[index])
+        self.slots[index] = None
+        self.entries -= 1
+
+    # Evicts entries (see the top of file) until size more bytes fit, leaving the pair of slots at index alone.
+    # Returns False if they can not be made to fit.
+    def make_room(self, size, index) -> bool:
+        scanned = 0
+        while self.bytes_used + size > self.max_bytes:
+            if scanned >= 2 * len(self.slots):
+                return False
+
+            slot = self.hand
+            self.hand = (self.hand + 1) & self.mask
+            scanned += 1
+
+            entry = self.slots[slot]
+            if entry is None or slot >> 1 == index >> 1 or (entry.age == self.age and scanned <= len(self.slots)):
+                continue
+            self.remove(slot)
+            self.evictions += 1
+        return True
+
+    # The entry of key to write to: the one already there, or a new one in the slot chosen for replacement.
+    # extra_bytes is what the write is going to add to it. Returns None if it does not fit in the budget.
+    def entry_for(self, key, depth, extra_bytes):
+        slot = self.find(key)
+        if slot is not None:
+            if not self.make_room(extra_bytes, slot):
+                self.rejections += 1
+                return None
+            entry = self.slots[slot]
+            entry.age = self.age
+            return entry
+
+        index = key & self.mask
+        first, second = self.slots[index], self.slots[index ^ 1]
+        if first is None:
+            slot = index
+        elif second is None:
+            slot = index ^ 1
+        else:
+            # The older entry goes first, then the shallower one.
+            first_rank = (first.age == self.age, first.depth)
+            second_rank = (second.age == self.age, second.depth)
+            slot = index if first_rank <= second_rank else index ^ 1
+
+        if self.slots[slot] is not None:
+            self.remove(slot)
+            self.evictions += 1
+
+        if not self.make_room(ENTRY_BYTES + extra_bytes, slot):
+            self.rejections += 1
+            return None
+
+        entry = Entry(key, self.age)
+        self.slots[slot] = entry
+        self.bytes_used += ENTRY_BYTES
+        self.entries += 1
+        return entry
+
+    # Entry of key if there is one, counting the hit or miss.
+    def probe(self, key):
+        slot = self.find(key)
+        if slot is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.slots[slot]
+
+    def get_moves(self, key):
+        """
+        parameters:
+            (1) key (int): Zobrist key of the position
+
+        returns: the legal moves stored for key, as (start_cord, end_cord, promotion_piece) tuples; None if there are none
+        """
+
+        entry = self.probe(key)
+        if entry is None or entry.moves is None:
+            return None
+        return unpack_moves(entry.moves)
+
+    def store_moves(self, key, moves) -> bool:
+        """
+        parameters:
+            (1) key (int): Zobrist key of the position
+            (2) moves (list): its legal moves, as (start_cord, end_cord, promotion_piece) tuples
+
+        returns: True if the moves were stored; False if they do not fit in the budget
+        """
+
+        data = pack_moves(moves)
+        slot = self.find(key)
+        old_bytes = 0 if slot is None or self.slots[slot].moves is None else sys.getsizeof(self.slots[slot].moves)
+
+        entry = self.entry_for(key, 0, sys.getsizeof(data) - old_bytes)
+        if entry is None:
+            return False
+        self.bytes_used += sys.getsizeof(data) - (0 if entry.moves is None else sys.getsizeof(entry.moves))
+        entry.moves = data
+        self.stores += 1
+        return True
+
+    def get_status(self, key):
+        """
+        parameters:
+            (1) key (int): Zobrist key of the position
+
+        returns: the status flags stored for key; None if there are none
+        """
+
+        entry = self.probe(key)
+        return None if entry is None else entry.status
+
+    def store_status(self, key, status) -> bool:
+        """
+        parameters:
+            (1) key (int): Zobrist key of the position
+            (2) status (int): its status flags
+
+        returns: True if the status was stored; False if it does not fit in the budget
+        """
+
+        entry = self.entry_for(key, 0, 0)
+        if entry is None:
+            return False
+        entry.status = status
+        self.stores += 1
+        return True
+
+    def get_search(self, key):
+        """
+        parameters:
+            (1) key (int): Zobrist key of the position
+
+        returns: (depth, score, bound, move) stored for key, the move as a (start_cord, end_cord, promotion_piece) tuple
+                 or None; None if no search result is stored
+        """
+
+        entry = self.probe(key)
+        if entry is None or entry.bound is None:
+            return None
+        return entry.depth, entry.score, entry.bound, None if entry.move is None else unpack_move(entry.move)
+
+    def store_search(self, key, depth, score, bound, move=None) -> bool:
+        """
+        parameters:
+            (1) key (int): Zobrist key of the position
+            (2) depth (int): depth searched
+            (3) score (int): the score found
+            (4) bound (int): EXACT, LOWER_BOUND or UPPER_BOUND
+            (5) move (tuple) [OPTIONAL]: the best move found, as (start_cord, end_cord, promotion_piece)
+
+        returns: True if the result was stored; False if it does not fit in the budget, or a deeper
+                 result of this search is kept for key.
+        """
+
+        slot = self.find(key)
+        if slot is not None:
+            entry = self.slots[slot]
+            if entry.bound is not None and entry.age == self.age and entry.depth > depth:
+                self.rejections += 1
+                return False
+
+        entry = self.entry_for(key, depth, 0)
+        if entry is None:
+            return False
+        entry.depth = depth
+        entry.score = score
+        entry.bound = bound
+        entry.move = None if move is None else pack_move(move)
+        self.stores += 1
+        return True
+
+    def stats(self) -> dict:
+        """
+        parameters: None
+
+        returns: the counters of the table (hits, misses, stores, evictions, rejections), its size and its hit rate
+        """
+
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "evictions": self.evictions,
+                "rejections": self.rejections, "entries": self.entries, "slots": len(self.slots),
+                "bytes_used": self.bytes_used, "max_bytes": self.max_bytes,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0}